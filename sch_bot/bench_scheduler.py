@@ -0,0 +1,399 @@
+"""
+Офлайн-бенчмарк обработчиков scheduler_bot.
+
+    python bench_scheduler.py                       # 20 хабов по 50 групп
+    python bench_scheduler.py --hubs 5 --repeat 20
+    python bench_scheduler.py --json bench.json     # отчет для сравнения между версиями
+
+Первый хаб - тестовая таблица tests/fixtures/schedule.xlsx, остальные -
+синтетические (flows потоков по groups групп, у групп подгруппы КТС и МСС).
+Таблицы отдаются локальным HTTP-сервером на 127.0.0.1, а обработчики
+вызываются с поддельными Message/CallbackQuery - ни Telegram, ни интернет
+не нужны. Время в обработчиках зафиксировано: понедельник, 10:00.
+
+Отчет:
+    этапы подготовки хаба - download, parse (чтение таблицы), layout, index,
+                            prerender (тексты расписаний групп)
+    чтение таблиц         - pd.read_excel (прежний способ) против потокового
+                            чтения xlsx и CSV-экспорта на тех же таблицах
+    обработчики           - p50/p95 задержки и пик памяти по tracemalloc
+
+С --format csv хабы загружаются в виде CSV (SHEET_FORMAT = "csv").
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+import scheduler_bot as bot
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "schedule.xlsx")
+# Понедельник, 10:00: идет вторая пара, часть кабинетов занята
+BENCH_NOW = datetime(2025, 9, 15, 10, 0)
+STAGES = ("download", "parse", "layout", "index", "prerender")
+
+DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+SLOTS = ["9:00-10:35", "10:45-12:20", "12:50-14:25", "14:35-16:10", "16:20-17:55", "18:05-19:40"]
+SUBJECTS = ["Математический анализ", "Программирование", "Физика", "Базы данных", "Теория вероятностей",
+            "Дискретная математика", "Английский язык", "Философия", "Операционные системы", "Численные методы"]
+TEACHERS = ["доц. Петров П.П.", "проф. Сидоров С.С.", "ст. преп. Козлова А.В.", "Иванов И.И.", "асс. Ёлкин Е.Е.",
+            "доцент Смирнова О.Л.", "преп. Кузнецов Д.А.", "Соколов В.В."]
+NOTES = ["с 12.09 занятия", "кураторский час", "по 20.12"]
+
+
+# --- Синтетические таблицы ---
+
+def make_sheet(seed=0, flows=5, groups=10, subgroups=("КТС", "МСС")):
+    """
+    xlsx-файл расписания в формате университетской таблицы: шапка потоков,
+    подгрупп и групп в строках 10-13, занятия с 15-й строки. Пара занимает
+    одну строку (предмет, преподаватель и кабинет в одной ячейке) или три.
+    """
+    rnd = random.Random(seed)
+    columns = [(f, g, sub) for f in range(flows) for g in range(1, groups + 1) for sub in subgroups]
+    width = 2 + len(columns)
+    rooms = [str(rnd.randint(100, 1200)) + rnd.choice(["", "", "а", "б"]) for _ in range(40 + 5 * flows)]
+
+    def blank():
+        return [np.nan] * width
+
+    rows = [blank() for _ in range(bot.DATA_START_ROW)]
+    rows[0][2] = "РАСПИСАНИЕ занятий"
+    flow_row, sub_row, group_row = blank(), blank(), blank()
+    flow_cols = {}
+    for i, (f, g, sub) in enumerate(columns):
+        c = 2 + i
+        if f not in flow_cols:
+            flow_row[c] = f"{f + 1} поток\n(Направление {f + 1})"
+        if f not in flow_cols or columns[i - 1][1] != g:
+            group_row[c] = f"{g} группа"
+        sub_row[c] = sub
+        flow_cols.setdefault(f, []).append(c)
+    rows += [flow_row, blank(), sub_row, group_row, blank()]
+
+    for day in DAYS:
+        for n, slot in enumerate(SLOTS):
+            height = 3 if rnd.random() < 0.3 else 1
+            block = [blank() for _ in range(height)]
+            if n == 0: block[0][0] = day
+            block[0][1] = slot
+
+            def put(c, subject):
+                parts = [subject, rnd.choice(TEACHERS), rnd.choice(rooms)]
+                if height == 3:
+                    for r, part in enumerate(parts): block[r][c] = part
+                else:
+                    block[0][c] = "\n".join(parts)
+
+            for cols in flow_cols.values():
+                kind = rnd.random()
+                if kind < 0.2:
+                    put(cols[0], rnd.choice(SUBJECTS) + " (лекция)")
+                elif kind < 0.3:
+                    continue
+                else:
+                    for c in cols:
+                        x = rnd.random()
+                        if x < 0.35: continue
+                        if x < 0.4: block[0][c] = rnd.choice(NOTES)
+                        else: put(c, rnd.choice(SUBJECTS))
+            rows += block
+
+    buf = io.BytesIO()
+    pd.DataFrame(rows).to_excel(buf, header=False, index=False)
+    return buf.getvalue()
+
+
+def sheet_as_csv(content):
+    """CSV с теми же значениями, что и xlsx-файл (как экспорт листа в CSV)"""
+    cells = bot.read_xlsx_rows(content)
+    n_rows = max(r for r, _ in cells) + 1
+    n_cols = max(c for _, c in cells) + 1
+    buf = io.StringIO()
+    csv.writer(buf).writerows([[cells.get((r, c), "") for c in range(n_cols)] for r in range(n_rows)])
+    return buf.getvalue().encode("utf-8")
+
+def read_sheet_pandas(content):
+    """Прежнее чтение через pd.read_excel и ffill по всей таблице - точка отсчета"""
+    df = pd.read_excel(io.BytesIO(content), header=None)
+    df.iloc[:15] = df.iloc[:15].ffill(axis=1)
+    df[0] = df[0].ffill()
+    df[1] = df[1].ffill(limit=2)
+    return df.fillna("")
+
+def bench_loaders(sheets, repeat=3):
+    """Время чтения одних и тех же таблиц разными способами (медиана по повторам на таблицу)"""
+    csv_sheets = [sheet_as_csv(content) for content in sheets]
+    loaders = {
+        "read_excel (pandas)": (read_sheet_pandas, sheets),
+        "xlsx": (lambda content: bot.read_sheet(content, "xlsx"), sheets),
+        "csv": (lambda content: bot.read_sheet(content, "csv"), csv_sheets),
+    }
+    report = {}
+    for name, (read, contents) in loaders.items():
+        samples = []
+        for content in contents:
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                read(content)
+                runs.append(time.perf_counter() - started)
+            samples.append(sorted(runs)[len(runs) // 2])
+        report[name] = dict(summarize(samples), kib=sum(map(len, contents)) / 1024)
+    return report
+
+
+# --- Поддельные объекты aiogram ---
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+class FakeMessage:
+    """Сообщение без Telegram: тексты ответов складываются в sent"""
+    def __init__(self, text="", user_id=1):
+        self.text = text
+        self.from_user = FakeUser(user_id)
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+        return FakeMessage(user_id=self.from_user.id)
+
+    async def edit_text(self, text, **kwargs):
+        self.sent.append(text)
+
+    async def delete(self):
+        pass
+
+class FakeCallbackQuery:
+    def __init__(self, data="", user_id=1):
+        self.data = data
+        self.from_user = FakeUser(user_id)
+        self.message = FakeMessage(user_id=user_id)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+class FakeState:
+    async def clear(self):
+        pass
+
+    async def set_state(self, state=None):
+        pass
+
+    async def get_data(self):
+        return {}
+
+    async def update_data(self, **kwargs):
+        pass
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return BENCH_NOW
+
+
+# --- Подготовка хабов ---
+
+async def start_sheet_server(sheets):
+    """Локальный сервер таблиц: GET /{sheet_id}/{gid}. Возвращает (runner, шаблон адреса)"""
+    async def handle(request):
+        return web.Response(body=sheets[request.match_info["gid"]])
+
+    app = web.Application()
+    app.router.add_get("/{sheet_id}/{gid}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/{{sheet_id}}/{{gid}}"
+
+async def prepare_hubs(hub_ids, stages):
+    """Загружает и разбирает хабы по этапам, записывая время каждого этапа в stages"""
+    for hid in hub_ids:
+        def timed(stage, func, *args):
+            started = time.perf_counter()
+            result = func(*args)
+            stages[stage].append(time.perf_counter() - started)
+            return result
+
+        started = time.perf_counter()
+        content, etag = await bot.download_sheet(bot.ACADEMIC_DATA[hid])
+        stages["download"].append(time.perf_counter() - started)
+
+        df = timed("parse", bot.read_sheet, content)
+        layout = timed("layout", bot.map_sheet_layout, df)
+        index = timed("index", bot.build_schedule_index, df, layout, hid)
+        hub = {"df": df, "layout": layout, "index": index, "hash": hid, "etag": etag, "checked_at": time.monotonic()}
+        bot.LOCAL_STORAGE[hid] = hub
+        texts = timed("prerender", bot.prerender_schedules, hub)
+        bot.RENDER_CACHE[hid] = {"version": hub["hash"], "texts": texts, "warm": True}
+
+
+# --- Сценарии ---
+
+def build_scenarios(rnd):
+    """Имя обработчика -> функция, создающая очередной вызов со случайными параметрами"""
+    groups, teachers, rooms = [], set(), set()
+    for hid, hub in bot.LOCAL_STORAGE.items():
+        for fid, flow_data in hub["layout"].items():
+            for g_num, subs in flow_data["map"].items():
+                groups.append((hid, fid, str(g_num), str(next(iter(subs.values())))))
+        teachers.update(hub["index"]["teacher_names"].values())
+        rooms.update(hub["index"]["room_names"])
+    teachers, rooms = sorted(teachers), sorted(rooms)
+    days = list(bot.WEEK_DAYS)[:6]
+
+    def render(cold):
+        hid, fid, g_num, col = rnd.choice(groups)
+        if cold: bot.RENDER_CACHE.pop(hid, None)
+        return bot.render_schedule_output(FakeMessage(), rnd.choice(days), hid, fid, g_num, col)
+
+    return {
+        "render_schedule_output": lambda: render(cold=False),
+        "render_schedule_output (cold)": lambda: render(cold=True),
+        "run_proff_search": lambda: bot.run_proff_search(FakeMessage(), "global", rnd.choice(teachers), "all"),
+        "process_room_search": lambda: bot.process_room_search(FakeMessage(rnd.choice(rooms)), FakeState()),
+        "cb_free_rooms": lambda: bot.cb_free_rooms(FakeCallbackQuery("free_rooms")),
+        "free_rooms_range": lambda: bot.free_rooms_range(FakeMessage("/free 12:00 14:00")),
+        "cb_near_event": lambda: bot.cb_near_event(FakeCallbackQuery("near_event")),
+    }
+
+def percentile(samples, q):
+    """Перцентиль q (0-100) методом ближайшего ранга"""
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "total_ms": sum(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+    }
+
+async def measure_handler(make_call, repeat, memory_calls=5):
+    """Задержки repeat вызовов, затем пик памяти за memory_calls вызовов под tracemalloc"""
+    samples = []
+    for _ in range(repeat):
+        call = make_call()
+        started = time.perf_counter()
+        await call
+        samples.append(time.perf_counter() - started)
+
+    # tracemalloc замедляет код, поэтому память меряется отдельным проходом
+    tracemalloc.start()
+    try:
+        for _ in range(memory_calls):
+            await make_call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(summarize(samples), peak_kib=peak / 1024)
+
+
+async def run_benchmark(hubs=20, flows=5, groups=10, repeat=50, seed=0, sheet_format="xlsx", loader_sheets=4):
+    """Прогоняет бенчмарк и возвращает отчет (dict). Глобальное состояние бота восстанавливается"""
+    saved = (dict(bot.ACADEMIC_DATA), dict(bot.LOCAL_STORAGE), dict(bot.RENDER_CACHE),
+             bot.SHEETS_EXPORT_URL, bot.SHEET_FORMAT, bot.datetime)
+    rnd = random.Random(seed)
+
+    sheets = {"0": open(FIXTURE, "rb").read()}
+    for i in range(1, hubs):
+        sheets[str(i)] = make_sheet(seed=seed + i, flows=flows, groups=groups)
+    loaders = bench_loaders(list(sheets.values())[:loader_sheets])
+    if sheet_format == "csv":
+        sheets = {gid: sheet_as_csv(content) for gid, content in sheets.items()}
+
+    runner, url = await start_sheet_server(sheets)
+    try:
+        bot.SHEETS_EXPORT_URL = url
+        bot.SHEET_FORMAT = sheet_format
+        bot.datetime = FrozenDatetime
+        bot.ACADEMIC_DATA.clear()
+        bot.LOCAL_STORAGE.clear()
+        bot.RENDER_CACHE.clear()
+        for gid in sheets:
+            bot.ACADEMIC_DATA[f"bench_{gid}"] = {"label": f"Хаб {gid}", "sheet_id": "bench", "gid": gid}
+
+        stages = {stage: [] for stage in STAGES}
+        await prepare_hubs(list(bot.ACADEMIC_DATA), stages)
+
+        handlers = {}
+        for name, make_call in build_scenarios(rnd).items():
+            handlers[name] = await measure_handler(make_call, repeat)
+
+        return {
+            "config": {"hubs": hubs, "flows": flows, "groups": groups, "repeat": repeat, "seed": seed,
+                       "format": sheet_format},
+            "sheet": {
+                "groups": sum(len(f["map"]) for hub in bot.LOCAL_STORAGE.values() for f in hub["layout"].values()),
+                "cells": sum(len(hub["index"]["cells"]) for hub in bot.LOCAL_STORAGE.values()),
+                "kib": sum(map(len, sheets.values())) / 1024,
+            },
+            "stages": {stage: summarize(samples) for stage, samples in stages.items()},
+            "loaders": loaders,
+            "handlers": handlers,
+        }
+    finally:
+        await bot.close_http_session()
+        await runner.cleanup()
+        academic, local, render, bot.SHEETS_EXPORT_URL, bot.SHEET_FORMAT, bot.datetime = saved
+        for target, source in ((bot.ACADEMIC_DATA, academic), (bot.LOCAL_STORAGE, local), (bot.RENDER_CACHE, render)):
+            target.clear()
+            target.update(source)
+
+
+def format_report(report):
+    sheet, lines = report["sheet"], []
+    lines.append(f"Хабов: {report['config']['hubs']}, групп: {sheet['groups']}, "
+                 f"ячеек: {sheet['cells']}, {report['config']['format']}: {sheet['kib']:.0f} КиБ")
+    lines.append("")
+    lines.append(f"{'Этап':<32}{'всего, мс':>12}{'p50, мс':>10}{'p95, мс':>10}")
+    for stage, s in report["stages"].items():
+        lines.append(f"{stage:<32}{s['total_ms']:>12.1f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}")
+    lines.append("")
+    lines.append(f"{'Чтение таблицы':<32}{'КиБ':>12}{'p50, мс':>10}{'p95, мс':>10}")
+    for name, s in report["loaders"].items():
+        lines.append(f"{name:<32}{s['kib']:>12.0f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}")
+    lines.append("")
+    lines.append(f"{'Обработчик':<32}{'p50, мс':>12}{'p95, мс':>10}{'память, КиБ':>14}")
+    for name, s in report["handlers"].items():
+        lines.append(f"{name:<32}{s['p50_ms']:>12.3f}{s['p95_ms']:>10.3f}{s['peak_kib']:>14.1f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк обработчиков scheduler_bot.")
+    parser.add_argument("--hubs", type=int, default=20, help="число хабов, включая тестовую таблицу")
+    parser.add_argument("--flows", type=int, default=5, help="потоков в синтетической таблице")
+    parser.add_argument("--groups", type=int, default=10, help="групп в потоке")
+    parser.add_argument("--repeat", type=int, default=50, help="вызовов каждого обработчика")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("xlsx", "csv"), default="xlsx", help="формат загрузки таблиц")
+    parser.add_argument("--json", help="сохранить отчет в JSON")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmark(args.hubs, args.flows, args.groups, args.repeat, args.seed, args.format))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
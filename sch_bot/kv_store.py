@@ -0,0 +1,438 @@
+"""
+Постоянное хранилище состояния бота: настройки пользователей, добавленные
+расписания (хабы) и состояния FSM aiogram.
+
+Данные лежат в хешах (имя -> поле -> строка). У бэкендов тот же набор
+методов, что и у redis-py (hget, hset, hsetnx, hgetall, hdel, pipeline), поэтому
+бэкенд выбирается адресом в open_kv:
+    sqlite:///bot_state.db  - SQLite (по умолчанию); файл может быть общим
+                              для нескольких процессов бота на одной машине
+    redis://host:6379/0     - Redis (нужен пакет redis)
+    memory://               - память процесса (тесты, замена Redis)
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    name  TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+
+def open_kv(url):
+    """Открывает хранилище по адресу sqlite:///путь, redis://... или memory://"""
+    if url.startswith("sqlite:///"):
+        return SQLiteKV(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Для хранилища Redis установите пакет redis: pip install redis")
+        return redis.Redis.from_url(url, decode_responses=True)
+    if url == "memory://":
+        return MemoryKV()
+    raise ValueError(f"Неизвестный адрес хранилища: {url}")
+
+
+class Pipeline:
+    """Очередь команд, которые выполняются одним вызовом execute() (как pipeline в redis-py)"""
+    def __init__(self, kv):
+        self._kv = kv
+        self._commands = []
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        self._commands.append(("hset", (name, key, value, mapping)))
+        return self
+
+    def hdel(self, name, *keys):
+        self._commands.append(("hdel", (name, *keys)))
+        return self
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return self._kv.execute_batch(commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._commands = []
+
+
+def _hset_items(key, value, mapping):
+    items = dict(mapping or {})
+    if key is not None:
+        items[key] = value
+    return {k: str(v) for k, v in items.items()}
+
+
+class MemoryKV:
+    """Хеши в памяти процесса. Ведет себя как redis.Redis(decode_responses=True)"""
+    def __init__(self):
+        self._hashes = {}
+
+    def hget(self, name, key):
+        return self._hashes.get(name, {}).get(key)
+
+    def hgetall(self, name):
+        return dict(self._hashes.get(name, {}))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = _hset_items(key, value, mapping)
+        fields = self._hashes.setdefault(name, {})
+        added = sum(1 for k in items if k not in fields)
+        fields.update(items)
+        return added
+
+    def hsetnx(self, name, key, value):
+        fields = self._hashes.setdefault(name, {})
+        if key in fields: return 0
+        fields[key] = str(value)
+        return 1
+
+    def hdel(self, name, *keys):
+        fields = self._hashes.get(name, {})
+        return sum(1 for k in keys if fields.pop(k, None) is not None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def execute_batch(self, commands):
+        return [getattr(self, method)(*args) for method, args in commands]
+
+    def close(self):
+        pass
+
+
+class SQLiteKV:
+    """
+    Хеши в таблице SQLite.
+
+    Журнал WAL позволяет нескольким процессам читать файл одновременно
+    с записью. Соединение общее для потоков процесса (сброс буфера BotStore
+    идет в пуле потоков), поэтому обращения к нему идут под блокировкой.
+    Pipeline выполняется одной транзакцией.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def hget(self, name, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM hashes WHERE name = ? AND key = ?", (name, key)).fetchone()
+        return row[0] if row else None
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, value FROM hashes WHERE name = ?", (name,)))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        return self.execute_batch([("hset", (name, key, value, mapping))])[0]
+
+    def hsetnx(self, name, key, value):
+        with self._lock, self._conn:
+            return self._conn.execute("INSERT OR IGNORE INTO hashes VALUES (?, ?, ?)", (name, key, str(value))).rowcount
+
+    def hdel(self, name, *keys):
+        return self.execute_batch([("hdel", (name, *keys))])[0]
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def execute_batch(self, commands):
+        with self._lock, self._conn:
+            return [self._apply(method, args) for method, args in commands]
+
+    def _apply(self, method, args):
+        if method == "hset":
+            name, key, value, mapping = args
+            added = 0
+            for k, v in _hset_items(key, value, mapping).items():
+                cur = self._conn.execute("UPDATE hashes SET value = ? WHERE name = ? AND key = ?", (v, name, k))
+                if cur.rowcount == 0:
+                    self._conn.execute("INSERT INTO hashes VALUES (?, ?, ?)", (name, k, v))
+                    added += 1
+            return added
+        name, *keys = args
+        return sum(
+            self._conn.execute("DELETE FROM hashes WHERE name = ? AND key = ?", (name, k)).rowcount
+            for k in keys
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __repr__(self):
+        return f"SQLiteKV('{self.path}')"
+
+
+def _loads(raw):
+    return json.loads(raw) if raw else None
+
+
+class BotStore:
+    """
+    Настройки пользователей, реестр хабов и FSM поверх KV-хранилища.
+
+    Запись буферизуется: изменения копятся в памяти (новая запись того же
+    поля заменяет старую) и уходят в хранилище одним pipeline не чаще раза
+    в flush_interval секунд, в пуле потоков executor (None - пул event loop
+    по умолчанию). Сбросы идут строго по очереди, чтобы более старая пачка
+    не перезаписала более новую. Чтение сначала смотрит буфер и пачки,
+    которые еще не записаны, поэтому процесс сразу видит свои изменения,
+    а другие процессы - после сброса. Вне event loop запись идет сразу.
+    Поля, которые другой процесс может прочитать уже следующим запросом
+    (состояния FSM), пишутся мимо буфера через awrite.
+    В event loop читать нужно через методы с префиксом a (ahget, aget_prefs
+    ...): обращение к хранилищу идет в том же пуле потоков.
+    """
+    PREFS = "prefs"
+    HUBS = "hubs"
+    SUBS = "subs"
+    NOTIFIED = "notified"
+    FSM_STATE = "fsm:state"
+    FSM_DATA = "fsm:data"
+
+    def __init__(self, kv, flush_interval=0.2, executor=None):
+        self.kv = kv
+        self.flush_interval = flush_interval
+        self.executor = executor
+        # (хеш, поле) -> значение; None - удалить поле
+        self._pending = {}
+        # Пачки, которые ждут очереди на запись или пишутся, от старых к новым
+        self._in_flight = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_handle = None
+
+    # --- Хеши с буфером записи ---
+
+    def hget(self, name, key):
+        found, value = self._buffered(name, key)
+        return value if found else self.kv.hget(name, key)
+
+    def hgetall(self, name):
+        return self._overlay(name, self.kv.hgetall(name), self._buffers())
+
+    async def ahget(self, name, key):
+        """hget для event loop: буферы смотрим сразу, хранилище читаем в пуле потоков"""
+        found, value = self._buffered(name, key)
+        if found: return value
+        value = await asyncio.get_running_loop().run_in_executor(self.executor, self.kv.hget, name, key)
+        # Пока шло чтение, поле могли записать снова
+        found, newer = self._buffered(name, key)
+        return newer if found else value
+
+    async def ahgetall(self, name):
+        """hgetall для event loop: хранилище читаем в пуле потоков, буферы накладываем в loop"""
+        # Пачка, записанная во время чтения, уже не будет в буферах - запоминаем их заранее
+        before = self._buffers()
+        data = await asyncio.get_running_loop().run_in_executor(self.executor, self.kv.hgetall, name)
+        return self._overlay(name, data, before + self._buffers())
+
+    def _buffers(self):
+        """Незаписанные изменения от старых к новым"""
+        return [*self._in_flight, self._pending]
+
+    def _buffered(self, name, key):
+        for buffer in reversed(self._buffers()):
+            if (name, key) in buffer:
+                return True, buffer[(name, key)]
+        return False, None
+
+    def _overlay(self, name, data, buffers):
+        for buffer in buffers:
+            for (buf_name, key), value in buffer.items():
+                if buf_name != name: continue
+                if value is None:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+        return data
+
+    def hset(self, name, key, value):
+        self._pending[(name, key)] = value
+        self._schedule_flush()
+
+    def hdel(self, name, key):
+        self._pending[(name, key)] = None
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_now()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, lambda: asyncio.ensure_future(self.flush()))
+
+    def _take_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _write(self, batch):
+        pipe = self.kv.pipeline()
+        for (name, key), value in batch.items():
+            if value is None:
+                pipe.hdel(name, key)
+            else:
+                pipe.hset(name, key, value)
+        pipe.execute()
+
+    async def flush(self):
+        """Сбрасывает буфер в хранилище (в пуле потоков, после предыдущих сбросов)"""
+        batch = self._take_pending()
+        if not batch: return
+        self._in_flight.append(batch)
+        try:
+            async with self._flush_lock:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self._write, batch)
+        except Exception as e:
+            logging.error(f"State store write error: {e}")
+            # Возвращаем в буфер то, что не успели перезаписать (в том числе более
+            # новые пачки в очереди), и пробуем позже
+            newer = self._in_flight[next(i for i, b in enumerate(self._in_flight) if b is batch) + 1:]
+            for item, value in batch.items():
+                if not any(item in b for b in newer):
+                    self._pending.setdefault(item, value)
+            self._schedule_flush()
+        finally:
+            self._in_flight = [b for b in self._in_flight if b is not batch]
+
+    async def awrite(self, name, key, value):
+        """
+        Записывает поле сразу, без ожидания flush_interval (value None - удалить
+        поле), и возвращается, когда запись дошла до хранилища. Запись идет после
+        уже отправленных пачек, чтобы они ее не перезаписали; ошибка выбрасывается.
+        """
+        # Более старое значение из буфера записывать уже не нужно
+        self._pending.pop((name, key), None)
+        batch = {(name, key): value}
+        self._in_flight.append(batch)
+        try:
+            async with self._flush_lock:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self._write, batch)
+        finally:
+            self._in_flight = [b for b in self._in_flight if b is not batch]
+
+    def flush_now(self):
+        """Синхронный сброс буфера (вне event loop и при остановке)"""
+        batch = self._take_pending()
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        self.flush_now()
+        self.kv.close()
+
+    # --- Настройки пользователей ---
+
+    def get_prefs(self, user_id):
+        return _loads(self.hget(self.PREFS, str(user_id)))
+
+    async def aget_prefs(self, user_id):
+        return _loads(await self.ahget(self.PREFS, str(user_id)))
+
+    def set_prefs(self, user_id, prefs):
+        self.hset(self.PREFS, str(user_id), json.dumps(prefs, ensure_ascii=False))
+
+    # --- Подписки на уведомления ---
+
+    def get_subscriptions(self):
+        """user_id -> {'hid', 'fid', 'gnum'}"""
+        return {int(uid): json.loads(sub) for uid, sub in self.hgetall(self.SUBS).items()}
+
+    async def aget_subscriptions(self):
+        return {int(uid): json.loads(sub) for uid, sub in (await self.ahgetall(self.SUBS)).items()}
+
+    def get_subscription(self, user_id):
+        return _loads(self.hget(self.SUBS, str(user_id)))
+
+    async def aget_subscription(self, user_id):
+        return _loads(await self.ahget(self.SUBS, str(user_id)))
+
+    def subscribe(self, user_id, group):
+        self.hset(self.SUBS, str(user_id), json.dumps(group, ensure_ascii=False))
+
+    def unsubscribe(self, user_id):
+        self.hdel(self.SUBS, str(user_id))
+
+    # --- Отметки об отправленных уведомлениях ---
+
+    async def claim_notification(self, day, mark):
+        """
+        Отмечает уведомление mark за день day (date) как отправленное.
+
+        True - отметку поставил этот вызов, и уведомление нужно отправить;
+        False - его уже отправил этот или другой процесс бота. Отметка пишется
+        сразу, мимо буфера, одной атомарной командой HSETNX.
+        """
+        field = f"{day.isoformat()}|{mark}"
+        loop = asyncio.get_running_loop()
+        return bool(await loop.run_in_executor(self.executor, self.kv.hsetnx, self.NOTIFIED, field, "1"))
+
+    async def expire_notifications(self, day):
+        """Удаляет отметки за дни до day"""
+        old = [field for field in await self.ahgetall(self.NOTIFIED) if field < day.isoformat()]
+        if old:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.kv.hdel, self.NOTIFIED, *old)
+
+    # --- Реестр хабов ---
+
+    def get_hubs(self):
+        return {hid: json.loads(conf) for hid, conf in self.hgetall(self.HUBS).items()}
+
+    async def aget_hubs(self):
+        return {hid: json.loads(conf) for hid, conf in (await self.ahgetall(self.HUBS)).items()}
+
+    def add_hub(self, hub_id, conf):
+        self.hset(self.HUBS, hub_id, json.dumps(conf, ensure_ascii=False))
+
+
+class KVStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram поверх BotStore: состояния и данные - в хешах fsm:state
+    и fsm:data. Запись идет сразу (BotStore.awrite): следующее сообщение чата
+    может попасть в другой процесс бота, и он должен увидеть новое состояние.
+    """
+    def __init__(self, store, key_builder=None):
+        self.store = store
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key, state=None):
+        field = self.key_builder.build(key)
+        value = state.state if isinstance(state, State) else state
+        await self.store.awrite(BotStore.FSM_STATE, field, value)
+
+    async def get_state(self, key):
+        return await self.store.ahget(BotStore.FSM_STATE, self.key_builder.build(key))
+
+    async def set_data(self, key, data):
+        field = self.key_builder.build(key)
+        value = json.dumps(dict(data), ensure_ascii=False) if data else None
+        await self.store.awrite(BotStore.FSM_DATA, field, value)
+
+    async def get_data(self, key):
+        raw = await self.store.ahget(BotStore.FSM_DATA, self.key_builder.build(key))
+        return json.loads(raw) if raw else {}
+
+    async def close(self):
+        await self.store.flush()
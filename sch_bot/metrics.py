@@ -0,0 +1,248 @@
+"""
+Метрики бота: счетчики, гистограммы и выгрузка в формате Prometheus.
+
+    METRICS.inc("hub_cache_total", result="hit")
+    METRICS.observe("sheet_download_bytes", len(content))
+    with METRICS.timer("sheet_sync_seconds"): ...
+
+    @METRICS.timed("sheet_parse_seconds", stage="layout")
+    def map_sheet_layout(df): ...
+
+Метрика - имя и набор меток (key=value), как в Prometheus. Гистограммы
+хранят число наблюдений по корзинам (SECONDS_BUCKETS, BYTES_BUCKETS), поэтому память не растет
+с числом запросов, а перцентили оцениваются по корзинам. render() отдает
+все метрики в текстовом формате Prometheus, dump() пишет его в файл (для
+textfile-коллектора node_exporter).
+
+Запись потокобезопасна. Наблюдения, сделанные в пуле процессов, теряются
+вместе с процессом - такие функции запускаются через collect(), который
+возвращает их вместе с результатом для merge() в основном процессе.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import SkipHandler
+
+# Корзины гистограмм: время в секундах и размеры в байтах
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (16_384, 65_536, 262_144, 1_048_576, 4_194_304, 16_777_216)
+
+
+class Histogram:
+    """Число наблюдений по корзинам (значение <= границы), их сумма и количество"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Оценка перцентиля q (0-1) линейной интерполяцией внутри корзины, как histogram_quantile"""
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    # Выше последней границы - точнее не оценить
+                    return self.buckets[-1]
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Реестр метрик: (имя, метки) -> число или Histogram"""
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        # Функции, которые при выгрузке возвращают [(имя, метки, значение)] - текущие значения
+        self.gauges = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _target(self):
+        # Внутри capture() наблюдения текущего потока идут в отдельный реестр
+        return getattr(self._local, "capture", None) or self
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        target = self._target()
+        key = (name, tuple(sorted(labels.items())))
+        with target._lock:
+            target.counters[key] = target.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        target = self._target()
+        key = (name, tuple(sorted(labels.items())))
+        with target._lock:
+            hist = target.histograms.get(key)
+            if hist is None:
+                hist = target.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """Декоратор: время каждого вызова функции в гистограмме name"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def add_gauges(self, source):
+        self.gauges.append(source)
+
+    @contextmanager
+    def capture(self):
+        """Наблюдения текущего потока внутри блока копятся в отдельном реестре (он и возвращается)"""
+        captured = Metrics()
+        previous = getattr(self._local, "capture", None)
+        self._local.capture = captured
+        try:
+            yield captured
+        finally:
+            self._local.capture = previous
+
+    def merge(self, other):
+        with self._lock:
+            for key, value in other.counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, hist in other.histograms.items():
+                own = self.histograms.get(key)
+                if own is None:
+                    own = self.histograms[key] = Histogram(hist.buckets)
+                own.merge(hist)
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def series(self, name, kind="counters"):
+        """[(метки, значение)] по всем наборам меток метрики name (kind: counters или histograms)"""
+        with self._lock:
+            return [(dict(labels), value) for (metric, labels), value in getattr(self, kind).items() if metric == name]
+
+    def __getstate__(self):
+        # Для передачи из пула процессов: блокировки не сериализуются
+        return {"counters": self.counters, "histograms": self.histograms}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.counters = state["counters"]
+        self.histograms = state["histograms"]
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        gauges = [(name, tuple(sorted(labels.items())), value)
+                  for source in self.gauges for name, labels, value in source()]
+
+        def header(name, kind):
+            if name in self.help: lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        last = None
+        for (name, labels), value in counters:
+            if name != last: header(name, "counter")
+            last = name
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, labels, value in sorted(gauges):
+            if name != last: header(name, "gauge")
+            last = name
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), hist in histograms:
+            if name != last: header(name, "histogram")
+            last = name
+            cumulative = 0
+            for bound, n in zip(hist.buckets + ("+Inf",), hist.counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(hist.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, text=None):
+        """Пишет render() (или готовый text) в файл через временный, чтобы коллектор не прочитал обрывок"""
+        if text is None: text = self.render()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def _labels(labels):
+    if not labels: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Общий реестр процесса
+METRICS = Metrics()
+
+def collect(func, *args):
+    """Выполняет func(*args) и возвращает (результат, реестр с наблюдениями этого вызова)"""
+    with METRICS.capture() as captured:
+        result = func(*args)
+    return result, captured
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время и ошибки хендлеров aiogram по имени функции-хендлера"""
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except SkipHandler:
+            # Хендлер отказался от события - его обработает следующий, время не считаем
+            started = None
+            raise
+        except Exception:
+            self.metrics.inc("handler_errors_total", handler=name)
+            raise
+        finally:
+            if started is not None:
+                self.metrics.observe("handler_seconds", time.perf_counter() - started, handler=name)
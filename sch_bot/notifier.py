@@ -0,0 +1,131 @@
+"""
+Рассылка уведомлений с учетом лимитов Telegram.
+
+Telegram принимает от бота около 30 сообщений в секунду (и примерно одно
+в секунду в один чат); при превышении отвечает 429 с retry_after.
+Notifier копит сообщения в очереди и отправляет их пачками на том же
+event loop, что и бот, не быстрее, чем позволяет TokenBucket.
+
+Клиент - любой объект с async send_message(chat_id, text, **kwargs),
+например aiogram.Bot; в тестах его заменяет запись отправленных сообщений.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity про запас.
+    clock и sleep подменяются в тестах, чтобы не ждать реального времени.
+    """
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n=1):
+        """
+        Забирает n токенов и ждет, если их не хватало. Токены берутся в долг
+        сразу, поэтому параллельные вызовы встают в очередь, а не соревнуются.
+        """
+        self._refill()
+        self.tokens -= n
+        if self.tokens < 0:
+            await self.sleep(-self.tokens / self.rate)
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов на seconds (после 429 от Telegram)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class Notifier:
+    """
+    Очередь исходящих уведомлений.
+
+    enqueue() только ставит сообщение в очередь. Сообщение с тем же
+    (chat_id, key), еще не отправленное, заменяется новым на том же месте
+    очереди - пользователь получит последнюю версию, а не все промежуточные.
+    Фоновая задача run() отправляет очередь пачками по batch_size сообщений
+    параллельно, беря токен на каждое. Пользователи, заблокировавшие бота, передаются в
+    on_blocked(chat_id); при 429 рассылка ждет retry_after и повторяет.
+    """
+    def __init__(self, client, rate=25, batch_size=25, on_blocked=None, bucket=None):
+        self.client = client
+        self.bucket = bucket or TokenBucket(rate)
+        self.batch_size = batch_size
+        self.on_blocked = on_blocked
+        # (chat_id, key) -> (chat_id, text, kwargs); dict хранит порядок постановки
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, chat_id, text, key=None, **kwargs):
+        item_key = (chat_id, key if key is not None else object())
+        self._pending[item_key] = (chat_id, text, kwargs)
+        self._wakeup.set()
+
+    def _take_batch(self):
+        return [(item_key, self._pending.pop(item_key)) for item_key in list(self._pending)[:self.batch_size]]
+
+    async def _send(self, item_key, item):
+        chat_id, text, kwargs = item
+        await self.bucket.acquire()
+        try:
+            await self.client.send_message(chat_id, text, **kwargs)
+            self.sent += 1
+        except TelegramRetryAfter as e:
+            logging.warning(f"Telegram flood limit, pause {e.retry_after}s")
+            self.bucket.pause(e.retry_after)
+            # Под тем же ключом: если уже стоит более новая версия, повторять старую не нужно
+            self._pending.setdefault(item_key, item)
+        except TelegramForbiddenError:
+            self.failed += 1
+            if self.on_blocked: self.on_blocked(chat_id)
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Notification to {chat_id} failed: {e}")
+
+    async def flush(self):
+        """Отправляет все, что сейчас в очереди (и то, что вернулось после 429)"""
+        while self._pending:
+            batch = self._take_batch()
+            await asyncio.gather(*(self._send(item_key, item) for item_key, item in batch))
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def stop(self):
+        """Досылает очередь и останавливает фоновую задачу"""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,11 +1,22 @@
 import asyncio
+import bisect
+import hashlib
 import logging
+import os
+import pickle
+import time
 import pandas as pd
 import io
-import requests
+import csv
+import zipfile
+import aiohttp
+from aiohttp import web
 import re
 import warnings
-from datetime import datetime, timedelta
+from xml.etree.ElementTree import iterparse
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+from datetime import datetime, timedelta, time as dtime
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
 from aiogram.types import (
@@ -13,12 +24,19 @@ from aiogram.types import (
 )
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from kv_store import BotStore, KVStorage, MemoryKV, open_kv
+from notifier import Notifier
+from workers import WorkerPools
+from metrics import BYTES_BUCKETS, METRICS, HandlerMetricsMiddleware, collect
 
 # Игнорируем предупреждения pandas о форматах
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 # --- КОНФИГУРАЦИЯ ---
 BOT_TOKEN = ""
+# Telegram id администраторов: им доступна команда /stats
+ADMIN_IDS = set()
 
 # Хранилище учебных планов (аналог COURSES)
 ACADEMIC_DATA = {
@@ -30,11 +48,83 @@ ACADEMIC_DATA = {
 }
 
 logging.basicConfig(level=logging.INFO)
-bot = Bot(token=BOT_TOKEN)
+# Bot создается в main(): без токена модуль можно импортировать (например, в тестах)
 dp = Dispatcher()
+# Время и ошибки каждого хендлера - в METRICS (см. /stats и METRICS_FILE)
+dp.message.middleware(HandlerMetricsMiddleware(METRICS))
+dp.callback_query.middleware(HandlerMetricsMiddleware(METRICS))
 
-# Глобальный кэш данных
+# Глобальный кэш данных: hub_id -> {"df", "layout", "index", "hash", "etag", "checked_at"}
 LOCAL_STORAGE = {}
+# Через сколько секунд расписание проверяется на изменения
+CACHE_TTL = 15 * 60
+# Идущие загрузки хабов: hub_id -> Task
+REFRESH_TASKS = {}
+# Хабы других процессов подтягиваются из хранилища не чаще раза в HUB_REGISTRY_TTL секунд
+HUB_REGISTRY_TTL = 60
+HUB_REGISTRY = {"loaded_at": None, "task": None}
+# Готовые тексты расписаний: hub_id -> {"version": хеш таблицы, "texts": {(fid, группа, день): текст}, "warm"}
+RENDER_CACHE = {}
+# Идущие подготовки текстов: hub_id -> Task
+RENDER_TASKS = {}
+# Подписчики на изменения расписания: async fn(hub_id, changes), changes - см. update_sheet
+CHANGE_LISTENERS = []
+
+# Уведомления подписчикам (/subscribe): напоминание за REMINDER_LEAD минут до пары,
+# расписание проверяется раз в REMINDER_TICK секунд. Рассылка создается в main()
+REMINDER_LEAD = 10
+REMINDER_TICK = 60
+NOTIFY_RATE = 25
+NOTIFIER = None
+# Уже отправленные сегодня напоминания: (hid, fid, группа, начало пары). Это кэш процесса:
+# кто отправит уведомление, процессы бота решают отметкой в хранилище (STORE.claim_notification)
+REMINDED = {"date": None, "sent": set()}
+
+# Загрузка таблиц: адрес экспорта, параллельность, таймаут и повторы.
+# SHEET_FORMAT - "xlsx" или "csv": CSV того же листа в несколько раз меньше и
+# читается на порядок быстрее, но числа и даты в нем уже отформатированы Google Таблицами
+SHEET_FORMAT = "xlsx"
+SHEETS_EXPORT_URL = "https://docs.google.com/spreadsheets/d/{sheet_id}/export?format={format}&gid={gid}"
+HTTP_CONCURRENCY = 4
+FETCH_TIMEOUT = 12
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+# Общая сессия aiohttp и семафор, ограничивающий число одновременных загрузок
+HTTP_CLIENT = {"session": None, "semaphore": None}
+
+# Разобранные таблицы на диске, чтобы после перезапуска отвечать без загрузки.
+# CACHE_FORMAT меняется при изменении структуры индекса - старые файлы игнорируются
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".schedule_cache")
+CACHE_FORMAT = 6
+
+# Пулы исполнителей (см. workers.py): потоки для диска и хранилища, процессы для
+# разбора таблиц (PARSE_PROCESSES), потоки для поисковых запросов. До init_pools() - только потоки
+IO_WORKERS = 4
+PARSE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# На одном ядре процессы только отнимают время у event loop, разбор тогда идет в потоках
+PARSE_PROCESSES = (os.cpu_count() or 1) > 1
+QUERY_WORKERS = 2
+POOLS = WorkerPools(IO_WORKERS, PARSE_WORKERS, QUERY_WORKERS)
+
+# Настройки пользователей, добавленные хабы и состояния FSM переживают перезапуск.
+# Адрес: sqlite:///путь (по умолчанию), redis://host:6379/0 или memory://
+STORAGE_URL = "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_state.db")
+
+# Получение обновлений. Пустой WEBHOOK_URL - long polling: с одним токеном может
+# работать только один процесс. Для нескольких процессов бота (с общим STORAGE_URL)
+# задайте WEBHOOK_URL - публичный https-адрес, на который Telegram шлет обновления.
+# Каждый процесс принимает их на WEBHOOK_HOST:WEBHOOK_PORT по пути WEBHOOK_PATH
+# (прокси перед ботом переводит на него путь из WEBHOOK_URL); процессы на одной машине делят
+# порт (SO_REUSEPORT), на разных - стоят за балансировщиком
+WEBHOOK_URL = ""
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = ""
+
+# Метрики в формате Prometheus пишутся в METRICS_FILE раз в METRICS_DUMP_INTERVAL секунд
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.prom")
+METRICS_DUMP_INTERVAL = 60
 
 # Маппинг временных интервалов
 WEEK_DAYS = {
@@ -43,8 +133,9 @@ WEEK_DAYS = {
 }
 SEARCH_DAYS_LOW = {k: v.lower() for k, v in WEEK_DAYS.items()}
 
-# Храним: user_id -> {'hid': ..., 'fid': ..., 'gnum': ..., 'col': ...}
-USER_PREFS = {}
+# Настройки (user_id -> {'hid', 'fid', 'gnum', 'col'}) и реестр хабов.
+# До init_storage() - в памяти, в main() подключается постоянное хранилище
+STORE = BotStore(MemoryKV())
 
 # --- СОСТОЯНИЯ ---
 class FormStates(StatesGroup):
@@ -55,15 +146,29 @@ class FormStates(StatesGroup):
     waiting_teacher_track = State()
 
 # --- ЛОГИКА ОБРАБОТКИ ТЕКСТА ---
+# Регулярки компилируются один раз при импорте
+DATE_RX = re.compile(r'\d{2}\.\d{2}')
+# Кабинет: строго 2-4 цифры + возможная буква
+ROOM_RX = re.compile(r'\b\d{2,4}[а-яА-Я]?\b')
+TIME_RX = re.compile(r'\d{1,2}[:.]\d{2}')
+TIME_PARTS_RX = re.compile(r'(\d{1,2})[:.](\d{2})')
+INITIALS_RX = re.compile(r'[А-Я]\.[А-Я]\.')
+DUP_LABEL_RX = re.compile(r'\s*\(\d+\)$')
+GARBAGE_PREFIXES = ("по ", "с ", "занятия", "кураторский", "в т.ч.")
+TEACHER_MARKS = ("доцент", "проф", "преп", "ассист")
+EMPTY_DATA = {"s": "", "t": "", "r": ""}
+
+def fold_text(text):
+    """Текст для поиска: нижний регистр, ё -> е"""
+    return text.lower().replace("ё", "е")
+
 def scrub_content(raw_val):
     """Базовая очистка ячейки"""
     if not raw_val or str(raw_val).lower() == "nan": return ""
     text = str(raw_val).strip()
     # Убираем даты и лишние приписки
-    text = re.sub(r'\d{2}\.\d{2}', '', text).strip()
-    garbage = ("по ", "с ", "занятия", "кураторский", "в т.ч.")
-    for word in garbage:
-        if text.lower().startswith(word): return ""
+    text = DATE_RX.sub('', text).strip()
+    if text.lower().startswith(GARBAGE_PREFIXES): return ""
     return text
 
 def extract_full_data(cell_text):
@@ -71,8 +176,6 @@ def extract_full_data(cell_text):
     clean_t = scrub_content(cell_text)
     if not clean_t: return {"s": "", "t": "", "r": ""}
 
-    # Регулярка для кабинета: строго 2-4 цифры + возможная буква
-    room_rx = re.compile(r'\b\d{2,4}[а-яА-Я]?\b')
     lines = [l.strip() for l in str(cell_text).split('\n') if l.strip()]
 
     res = {"s": "", "t": "", "r": ""}
@@ -81,18 +184,50 @@ def extract_full_data(cell_text):
         if not line_clean: continue
 
         # 1. Если это кабинет (короткое число)
-        rm = room_rx.search(line_clean)
+        rm = ROOM_RX.search(line_clean)
         # Кабинет обычно очень короткий. Кафедры типа "ФМО" или "ФПМИ" длиннее или не содержат цифр.
         if rm and len(line_clean) <= 6:
             res["r"] = rm.group()
         # 2. Если это препод (есть слова Доцент, Профессор или И.О.)
-        elif any(rank in line_clean.lower() for rank in ["доцент", "проф", "преп", "ассист"]) or re.search(r'[А-Я]\.[А-Я]\.', line_clean):
+        elif any(rank in line_clean.lower() for rank in TEACHER_MARKS) or INITIALS_RX.search(line_clean):
             res["t"] = line_clean
         else:
             # 3. Предмет (если это не техническая пометка кафедры типа "МСС", "ТП")
             if len(line_clean) > 2:
                 res["s"] = (res["s"] + " " + line_clean).strip()
     return res
+
+def normalise_cells(df, start_row=0, rows=None, parsed=None):
+    """
+    Разбирает непустые ячейки с данными (колонки со 2-й, строки со start_row
+    или только строки rows).
+
+    scrub_content, extract_full_data и fold_text вызываются один раз на каждый
+    уникальный текст - лекции потока и одинаковые предметы повторяются по
+    многим колонкам. parsed - общий кэш разбора {текст: (low, clean, data)},
+    через него повторный разбор таблицы пропускает уже знакомые тексты.
+    Возвращает {(строка, колонка): {"raw", "low", "clean", "data"}}.
+    Словари "data" у одинаковых ячеек общие, менять их нельзя.
+    """
+    if parsed is None: parsed = {}
+    values = df.values
+    cells = {}
+    for r in (range(start_row, len(values)) if rows is None else rows):
+        row = values[r]
+        for c in range(2, len(row)):
+            value = row[c]
+            text = str(value)
+            if text == "": continue
+            item = parsed.get(text)
+            if item is None:
+                item = parsed[text] = (fold_text(text), scrub_content(text), extract_full_data(text))
+            low, clean, data = item
+            # Нулевые числа scrub_content считает пустыми, в отличие от строки "0"
+            if not value:
+                clean, data = "", EMPTY_DATA
+            cells[(r, c)] = {"raw": text, "low": low, "clean": clean, "data": data}
+    return cells
+
 def validate_subject(content):
     """Отличаем название предмета от аудитории"""
     if not content or not any(c.isalpha() for c in content):
@@ -103,6 +238,18 @@ def validate_subject(content):
     return True
 
 # --- ЯДРО ПАРСЕРА ---
+# Строка с номерами групп ищется в первых HEADER_SCAN_ROWS строках
+HEADER_SCAN_ROWS = 30
+
+def find_group_row(df):
+    """Номер строки с номерами групп ("1 группа") или -1"""
+    for r in range(min(HEADER_SCAN_ROWS, len(df))):
+        row_str = [str(cell).lower() for cell in df.iloc[r].values]
+        if "1 группа" in row_str or ("1" in row_str and "группа" in row_str):
+            return r
+    return -1
+
+@METRICS.timed("sheet_parse_seconds", stage="layout")
 def map_sheet_layout(df):
     """
     Сканирует таблицу, находит потоки, группы и подгруппы.
@@ -110,13 +257,7 @@ def map_sheet_layout(df):
     с объединенными ячейками после df.fillna("").
     """
     # 1. Ищем строку с группами
-    group_row = -1
-    for r in range(30):
-        row_str = [str(cell).lower() for cell in df.iloc[r].values]
-        if "1 группа" in row_str or ("1" in row_str and "группа" in row_str):
-            group_row = r
-            break
-
+    group_row = find_group_row(df)
     if group_row == -1: return {}
 
     # 2. Ищем строку потоков (выше групп)
@@ -203,35 +344,887 @@ def map_sheet_layout(df):
 
     return layout
 
-def sync_data(hub_id):
-    """Загрузка и кэширование данных из Google Sheets"""
-    if hub_id in LOCAL_STORAGE:
-        return LOCAL_STORAGE[hub_id]["df"], LOCAL_STORAGE[hub_id]["layout"]
+# --- ИНДЕКС РАСПИСАНИЯ ---
+# Строки выше DATA_START_ROW - шапка таблицы; занятия групп начинаются с LESSONS_START_ROW
+DATA_START_ROW = 10
+LESSONS_START_ROW = 15
 
-    conf = ACADEMIC_DATA.get(hub_id)
-    if not conf: return None, None
+TEACHER_RANKS = {"доцент", "профессор", "преподаватель", "ассистент", "старший"}
+
+def teacher_surname(teacher):
+    """'доц. Петров П.П.' -> 'Петров' (звания и инициалы пропускаются)"""
+    for word in re.findall(r"[А-Яа-яЁёA-Za-z-]+\.?", teacher):
+        # Сокращения (доц., ст.преп., П.) заканчиваются точкой
+        if word.endswith(".") or word.lower() in TEACHER_RANKS or len(word) < 2:
+            continue
+        return word
+    return ""
 
-    path = f"https://docs.google.com/spreadsheets/d/{conf['sheet_id']}/export?format=xlsx&gid={conf['gid']}"
+def _column_owners(layout, n_cols):
+    """
+    Подписи владельца каждой колонки:
+    tag - для поиска преподавателя, owner и anchor - для поиска по аудитории.
+    """
+    owners = {}
+    for c in range(2, n_cols):
+        info = {"tag": "Неизв.", "owner": "Неизвестно", "anchor": -1}
+        for fid, flow_data in layout.items():
+            # Колонка потока важнее колонки группы
+            if c == flow_data["anchor_col"]:
+                info["tag"] = f"Поток ({flow_data['title']})"
+                info["owner"] = f"{flow_data['title']} (Поток)"
+                info["anchor"] = c
+                break
 
+            found_group = False
+            for g_num, groups in flow_data["map"].items():
+                for sub_label, sub_col in groups.items():
+                    if sub_col == c:
+                        # Очищаем " (2)" из названия
+                        clean_label = DUP_LABEL_RX.sub('', sub_label)
+                        is_common = "общая" in clean_label.lower()
+                        info["tag"] = f"Гр. {g_num}" + ("" if is_common else f" ({clean_label})")
+                        info["owner"] = f"Гр. {g_num}" + ("" if is_common or not clean_label else f" ({clean_label})")
+                        info["anchor"] = flow_data["anchor_col"]
+                        found_group = True
+                        break
+                if found_group: break
+            if found_group: break
+        owners[c] = info
+    return owners
+
+@METRICS.timed("sheet_parse_seconds", stage="index")
+def build_schedule_index(df, layout, hub_id=None, texts=None, hashes=None):
+    """
+    Разбирает таблицу один раз после загрузки, чтобы хендлеры не обходили DataFrame.
+
+    rows     - номер строки -> день, время, текст строки, кабинеты и предметы строки
+    cells    - (строка, колонка) -> непустая ячейка: raw, low, clean, data
+    lessons  - занятия: hub, row, day, time, start, end, col, flow, group, sub, s, t, r
+               (group=None - лекция всего потока)
+    by_day   - код дня -> строки этого дня
+    by_token - слово ячейки -> позиции ячеек (поиск подстроки без полного скана)
+    by_teacher, by_room, by_group, by_slot - фамилия / кабинет / (fid, группа) / (день, время) -> занятия
+    teacher_names - фамилия в by_teacher (fold_text) -> фамилия как в таблице
+    owners   - колонка -> подписи группы или потока (см. _column_owners)
+    row_hashes - хеши строк таблицы для сравнения со следующей версией (см. update_sheet)
+    texts    - текст ячейки -> (low, clean, data): кэш разбора для следующей версии
+    group_digests - (fid, группа) -> день -> хеш занятий группы (см. schedule_changes)
+
+    texts - кэш разбора текстов прошлой версии (update_sheet), он дополняется
+    новыми текстами; в индекс попадают только тексты этой версии. hashes можно
+    передать готовыми.
+    """
+    index = {
+        "rows": {}, "cells": {}, "lessons": [], "by_day": {}, "by_token": {},
+        "by_teacher": {}, "by_room": {}, "by_group": {}, "by_slot": {}, "teacher_names": {},
+        "owners": _column_owners(layout, len(df.columns)),
+        "row_hashes": hashes if hashes is not None else row_hashes(df),
+    }
+    rows = index["rows"]
+    if texts is None: texts = {}
+    cells = normalise_cells(df, DATA_START_ROW, parsed=texts)
+    index["cells"] = cells
+    index["texts"] = {cell["raw"]: texts[cell["raw"]] for cell in cells.values()}
+    n_cols = len(df.columns)
+    # Слова и проверка предмета тоже считаются один раз на уникальный текст
+    cell_tokens = {}
+    subject_ok = {}
+
+    for idx, values in enumerate(df.values.tolist()):
+        if idx < DATA_START_ROW: continue
+
+        day_low = str(values[0]).lower()
+        time_raw = str(values[1])
+        time_str = time_raw.replace("\n", " ").strip()
+        start, end = parse_time_range(time_raw)
+        row_text = " ".join([str(v) for v in values])
+
+        row = {
+            "idx": idx,
+            "day": str(values[0]).strip().upper(),
+            "days": [code for code, name in SEARCH_DAYS_LOW.items() if name in day_low],
+            "time_raw": time_raw,
+            "time": time_str,
+            "has_time": bool(TIME_RX.search(time_str)),
+            "start": start,
+            "end": end,
+            "text_low": fold_text(row_text),
+            "rooms": ROOM_RX.findall(row_text),
+            "subjects": [],
+        }
+        rows[idx] = row
+        for code in row["days"]:
+            index["by_day"].setdefault(code, []).append(row)
+
+        for c in range(2, n_cols):
+            cell = cells.get((idx, c))
+            if cell is None: continue
+            clean = cell["clean"]
+            if clean not in subject_ok:
+                subject_ok[clean] = validate_subject(clean)
+            if subject_ok[clean]:
+                row["subjects"].append(clean)
+            low = cell["low"]
+            if low not in cell_tokens:
+                cell_tokens[low] = set(low.split())
+            for token in cell_tokens[low]:
+                index["by_token"].setdefault(token, []).append((idx, c))
+
+        if idx >= LESSONS_START_ROW and row["days"] and row["has_time"]:
+            _index_row_lessons(index, row, layout, hub_id)
+
+    _index_timeline(index)
+    _index_search_terms(index)
+    index["group_digests"] = group_digests(index["by_group"])
+    return index
+
+def _index_row_lessons(index, row, layout, hub_id):
+    """Раскладывает строку таблицы на занятия потоков и групп."""
+    cells = index["cells"]
+    empty = {"clean": "", "data": {"s": "", "t": "", "r": ""}}
+
+    def add_lesson(fid, group, sub, col, data, groups):
+        lesson = {
+            "hub": hub_id, "row": row["idx"], "day": row["days"][0], "time": row["time"],
+            "start": row["start"], "end": row["end"], "col": col,
+            "flow": fid, "group": group, "sub": sub,
+            "s": data["s"], "t": data["t"], "r": data["r"],
+        }
+        index["lessons"].append(lesson)
+        for g_num in groups:
+            index["by_group"].setdefault((fid, g_num), []).append(lesson)
+        index["by_slot"].setdefault((lesson["day"], lesson["time"]), []).append(lesson)
+        if lesson["r"]:
+            index["by_room"].setdefault(lesson["r"], []).append(lesson)
+        surname = teacher_surname(lesson["t"])
+        if surname:
+            key = fold_text(surname)
+            index["by_teacher"].setdefault(key, []).append(lesson)
+            index["teacher_names"].setdefault(key, surname)
+
+    for fid, flow_data in layout.items():
+        anchor_col = flow_data["anchor_col"]
+        flow_cell = cells.get((row["idx"], anchor_col), empty)
+        data_flow = flow_cell["data"]
+
+        # Лекция потока: в якорной колонке есть занятие, а в остальных колонках
+        # потока либо пусто, либо тот же текст
+        if data_flow["s"] or data_flow["t"]:
+            is_conflict = False
+            for grp_data in flow_data["map"].values():
+                for check_col in grp_data.values():
+                    if check_col == anchor_col: continue
+                    other_text = cells.get((row["idx"], check_col), empty)["clean"]
+                    if other_text and other_text != flow_cell["clean"]:
+                        is_conflict = True
+                        break
+                if is_conflict: break
+            if not is_conflict:
+                add_lesson(fid, None, "", anchor_col, data_flow, flow_data["map"].keys())
+                continue
+
+        for g_num, groups in flow_data["map"].items():
+            # Проходим по всем подгруппам (КТС, МСС, ФМиИС...)
+            for sub_label, sub_col in groups.items():
+                cell_data = cells.get((row["idx"], sub_col), empty)["data"]
+                if cell_data["s"] or cell_data["t"]:
+                    # "МСС (2)" -> "МСС": соседние колонки (Предмет и Препод) попадут в один ключ
+                    add_lesson(fid, g_num, DUP_LABEL_RX.sub('', sub_label), sub_col, cell_data, (g_num,))
+
+# --- ПОИСК ---
+SUGGEST_LIMIT = 5
+SUGGEST_MIN_SCORE = 0.3
+
+def trigrams(word, pad=True):
+    """Триграммы слова; с pad учитываются начало и конец слова"""
+    if pad: word = f"  {word} "
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+def _index_search_terms(index):
+    """
+    Триграммные индексы для поиска:
+    token_trigrams - триграмма -> слова ячеек из by_token (поиск подстроки);
+    token_short    - каждая подстрока в 1-2 символа -> слова ячеек (короткие запросы);
+    terms[kind]    - фамилия преподавателя или кабинет (fold_text) -> (как в таблице, число триграмм);
+    term_trigrams[kind] - триграмма -> термины (подсказки при опечатках).
+    """
+    token_trigrams, token_short = {}, {}
+    for token in index["by_token"]:
+        for gram in trigrams(token, pad=False):
+            token_trigrams.setdefault(gram, set()).add(token)
+        for size in (1, 2):
+            for i in range(len(token) - size + 1):
+                token_short.setdefault(token[i:i + size], set()).add(token)
+    index["token_trigrams"], index["token_short"] = token_trigrams, token_short
+
+    sources = {
+        "teacher": index["teacher_names"],
+        "room": {fold_text(room): room for room in index["by_room"]},
+    }
+    index["terms"], index["term_trigrams"] = {}, {}
+    for kind, names in sources.items():
+        terms, grams = {}, {}
+        for key, name in names.items():
+            key_grams = trigrams(key)
+            terms[key] = (name, len(key_grams))
+            for gram in key_grams:
+                grams.setdefault(gram, set()).add(key)
+        index["terms"][kind], index["term_trigrams"][kind] = terms, grams
+
+def find_cells(index, query):
+    """
+    Позиции (строка, колонка) ячеек, содержащих query без учета регистра и ё/е, в порядке таблицы.
+
+    Слово ячейки, содержащее самое длинное слово запроса, содержит и все его
+    триграммы, поэтому кандидаты - пересечение списков token_trigrams. Если
+    все слова запроса короче 3 символов, кандидаты берутся из token_short.
+    Найденные ячейки затем проверяются на весь запрос целиком.
+    """
+    query = fold_text(query)
+    words = query.split()
+    if not words:
+        return sorted(pos for pos, cell in index["cells"].items() if query in cell["low"])
+
+    probe = max(words, key=len)
+    if len(probe) >= 3:
+        posting = sorted((index["token_trigrams"].get(gram, set()) for gram in trigrams(probe, pad=False)), key=len)
+        tokens = set.intersection(*posting) if posting[0] else set()
+    else:
+        tokens = index["token_short"].get(probe, ())
+
+    candidates = set()
+    for token in tokens:
+        if probe in token:
+            candidates.update(index["by_token"][token])
+    return sorted(pos for pos in candidates if query in index["cells"][pos]["low"])
+
+@METRICS.timed("query_seconds", query="suggest")
+def suggest_terms(indexes, query, kind, limit=SUGGEST_LIMIT):
+    """
+    Похожие на query фамилии преподавателей (kind="teacher") или кабинеты (kind="room")
+    по всем индексам, лучшие первыми. Сходство - коэффициент Дайса по триграммам,
+    поэтому опечатки, пропущенные буквы и ё/е не мешают.
+    """
+    key = fold_text(query).strip()
+    if not key: return []
+    query_grams = trigrams(key)
+
+    scores = {}
+    for index in indexes:
+        terms, term_grams = index["terms"][kind], index["term_trigrams"][kind]
+        shared = {}
+        for gram in query_grams:
+            for term in term_grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        for term, count in shared.items():
+            name, n_grams = terms[term]
+            score = 2 * count / (len(query_grams) + n_grams)
+            if score >= SUGGEST_MIN_SCORE and score > scores.get(name, 0):
+                scores[name] = score
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [name for name, _ in ranked[:limit]]
+
+# --- ВРЕМЕННЫЕ ИНТЕРВАЛЫ ---
+def _seconds(t):
+    """Время суток в секундах (для бинарного поиска по интервалам)"""
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+def _index_timeline(index):
+    """
+    Строит по каждому дню недели отсортированные по началу интервалы пар:
+    timeline[код дня] = {"starts", "ends", "rows", "rooms", "max_len"}.
+    rooms - битовая маска кабинетов, занятых в интервале (бит i - room_names[i]).
+    """
+    room_names = sorted({room for row in index["rows"].values() for room in row["rooms"]})
+    room_bits = {room: 1 << i for i, room in enumerate(room_names)}
+    index["room_names"] = room_names
+    index["all_rooms_mask"] = (1 << len(room_names)) - 1
+    index["timeline"] = {}
+
+    for code, day_rows in index["by_day"].items():
+        slots = {}
+        for row in day_rows:
+            if not (row["start"] and row["end"]): continue
+            key = (_seconds(row["start"]), _seconds(row["end"]))
+            slot = slots.setdefault(key, {"rows": [], "rooms": 0})
+            slot["rows"].append(row)
+            for room in row["rooms"]:
+                slot["rooms"] |= room_bits[room]
+
+        ordered = sorted(slots.items())
+        index["timeline"][code] = {
+            "starts": [start for (start, _), _ in ordered],
+            "ends": [end for (_, end), _ in ordered],
+            "rows": [slot["rows"] for _, slot in ordered],
+            "rooms": [slot["rooms"] for _, slot in ordered],
+            # Самый длинный интервал: дальше него назад от момента искать бессмысленно
+            "max_len": max([0] + [end - start for (start, end), _ in ordered]),
+        }
+
+def slots_between(index, day_code, t_from, t_to=None):
+    """
+    Номера интервалов дня, пересекающихся с [t_from, t_to] (границы включительно).
+    Без t_to - интервалы, идущие в момент t_from. O(log n + k) за счет bisect.
+    """
+    line = index["timeline"].get(day_code)
+    if not line: return []
+    lo, hi = _seconds(t_from), _seconds(t_to if t_to is not None else t_from)
+
+    pos = bisect.bisect_right(line["starts"], hi)
+    found = []
+    # Интервалы, начавшиеся раньше lo - max_len, закончились до lo
+    while pos > 0 and line["starts"][pos - 1] >= lo - line["max_len"]:
+        pos -= 1
+        if line["ends"][pos] >= lo:
+            found.append(pos)
+    found.reverse()
+    return found
+
+def rows_at(index, day_code, moment):
+    """Строки таблицы с парами, идущими в момент moment, в порядке таблицы"""
+    line = index["timeline"].get(day_code)
+    rows = [row for pos in slots_between(index, day_code, moment) for row in line["rows"][pos]]
+    return sorted(rows, key=lambda row: row["idx"])
+
+def next_slot_rows(index, day_code, moment):
+    """Строки ближайшего интервала, начинающегося после moment (или [])"""
+    line = index["timeline"].get(day_code)
+    if not line: return []
+    pos = bisect.bisect_right(line["starts"], _seconds(moment))
+    return line["rows"][pos] if pos < len(line["starts"]) else []
+
+def find_occupied_rooms(index, day_code, t_from, t_to=None):
+    """Кабинеты, занятые хотя бы в одном интервале, пересекающем [t_from, t_to]"""
+    line = index["timeline"].get(day_code)
+    mask = 0
+    for pos in slots_between(index, day_code, t_from, t_to):
+        mask |= line["rooms"][pos]
+    return rooms_from_mask(index, mask)
+
+def rooms_from_mask(index, mask):
+    names = index["room_names"]
+    return {names[i] for i in range(mask.bit_length()) if mask >> i & 1}
+
+# --- ЧТЕНИЕ ТАБЛИЦ ---
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+CELL_REF_RX = re.compile(r"([A-Z]+)(\d+)")
+# Строки шапки, в которых объединенные ячейки заполняются слева направо
+HEADER_ROWS = 15
+
+def _xlsx_path(target):
+    return target.lstrip("/") if target.startswith("/") else "xl/" + target
+
+def _xlsx_date_styles(book):
+    """Номера стилей ячеек (атрибут s), у которых формат даты или времени"""
     try:
-        resp = requests.get(path, timeout=12)
-        df = pd.read_excel(io.BytesIO(resp.content), header=None)
+        styles = book.open("xl/styles.xml")
+    except KeyError:
+        return set()
+    custom, xfs = {}, []
+    for _, el in iterparse(styles):
+        if el.tag == XLSX_NS + "numFmt":
+            custom[int(el.get("numFmtId"))] = el.get("formatCode", "")
+        elif el.tag == XLSX_NS + "cellXfs":
+            xfs = [int(xf.get("numFmtId", 0)) for xf in el.findall(XLSX_NS + "xf")]
+    return {
+        i for i, fmt_id in enumerate(xfs)
+        if is_date_format(custom.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id) or "")
+    }
 
-        # Предварительная обработка (заполнение пустот)
-        df.iloc[:15] = df.iloc[:15].ffill(axis=1)
-        df[0] = df[0].ffill()
-        df[1] = df[1].ffill(limit=2)
-        df = df.fillna("")
+def _xlsx_shared_strings(book):
+    try:
+        source = book.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    for _, el in iterparse(source):
+        if el.tag != XLSX_NS + "si": continue
+        # Форматированный текст разбит на фрагменты <r>; фонетические подсказки <rPh> пропускаем
+        runs = el.findall(XLSX_NS + "r")
+        if runs:
+            strings.append("".join(r.findtext(XLSX_NS + "t") or "" for r in runs))
+        else:
+            strings.append(el.findtext(XLSX_NS + "t") or "")
+        el.clear()
+    return strings
 
-        struct = map_sheet_layout(df)
-        LOCAL_STORAGE[hub_id] = {"df": df, "layout": struct}
+def read_xlsx_rows(content):
+    """
+    Потоковое чтение первого листа xlsx: {(строка, колонка): значение}.
+
+    Разбирается только XML листа, общих строк и стилей, без объектной модели
+    openpyxl - это в 3 раза быстрее pd.read_excel. Значения те же, что дает
+    read_excel: строки, целые и дробные числа, даты/время для ячеек с форматом
+    даты, bool. Ячейки с ошибками (#N/A) считаются пустыми.
+    """
+    book = zipfile.ZipFile(io.BytesIO(content))
+    workbook = {}
+    for _, el in iterparse(book.open("xl/workbook.xml")):
+        if el.tag == XLSX_NS + "workbookPr":
+            workbook["date1904"] = el.get("date1904") in ("1", "true")
+        elif el.tag == XLSX_NS + "sheet" and "sheet_rel" not in workbook:
+            workbook["sheet_rel"] = el.get(XLSX_REL_NS + "id")
+    sheet_path = "xl/worksheets/sheet1.xml"
+    for _, el in iterparse(book.open("xl/_rels/workbook.xml.rels")):
+        if el.tag.endswith("Relationship") and el.get("Id") == workbook.get("sheet_rel"):
+            sheet_path = _xlsx_path(el.get("Target"))
+
+    epoch = CALENDAR_MAC_1904 if workbook.get("date1904") else CALENDAR_WINDOWS_1900
+    strings = _xlsx_shared_strings(book)
+    date_styles = _xlsx_date_styles(book)
+    cells = {}
+    for _, el in iterparse(book.open(sheet_path)):
+        if el.tag != XLSX_NS + "row": continue
+        for c in el.iter(XLSX_NS + "c"):
+            kind = c.get("t", "n")
+            if kind == "inlineStr":
+                value = "".join(t.text or "" for t in c.iter(XLSX_NS + "t"))
+            else:
+                raw = c.findtext(XLSX_NS + "v")
+                if not raw or kind == "e": continue
+                if kind == "s":
+                    value = strings[int(raw)]
+                elif kind == "b":
+                    value = raw == "1"
+                elif kind in ("str", "d"):
+                    value = raw
+                else:
+                    number = float(raw)
+                    if c.get("s") and int(c.get("s")) in date_styles:
+                        value = from_excel(number, epoch)
+                    else:
+                        value = int(number) if number.is_integer() else number
+            if value == "": continue
+            letters, row = CELL_REF_RX.match(c.get("r")).groups()
+            col = 0
+            for ch in letters:
+                col = col * 26 + ord(ch) - 64
+            cells[(int(row) - 1, col - 1)] = value
+        el.clear()
+    return cells
+
+def read_csv_rows(content):
+    """Чтение CSV-экспорта листа: {(строка, колонка): текст}"""
+    reader = csv.reader(io.StringIO(content.decode("utf-8-sig")))
+    return {(r, c): value for r, row in enumerate(reader) for c, value in enumerate(row) if value != ""}
+
+SHEET_READERS = {"xlsx": read_xlsx_rows, "csv": read_csv_rows}
+
+def fill_merged_cells(cells):
+    """
+    Собирает таблицу из непустых ячеек и за один проход заполняет пустоты
+    объединенных ячеек: шапку (первые HEADER_ROWS строк) - слева направо,
+    колонку дней - сверху вниз, колонку времени - вниз не больше чем на 2 строки
+    (пара занимает до трех строк). Пустые ячейки - "".
+    """
+    if not cells: return pd.DataFrame()
+    n_rows = max(r for r, _ in cells) + 1
+    n_cols = max(c for _, c in cells) + 1
+    rows = []
+    day, time_value, time_gap = "", "", 0
+    for r in range(n_rows):
+        row = [cells.get((r, c), "") for c in range(n_cols)]
+        if r < HEADER_ROWS:
+            for c in range(1, n_cols):
+                if row[c] == "": row[c] = row[c - 1]
+        if row[0] == "": row[0] = day
+        day = row[0]
+        if n_cols > 1:
+            if row[1] != "":
+                time_value, time_gap = row[1], 0
+            elif time_gap < 2:
+                row[1] = time_value
+                time_gap += 1
+        rows.append(row)
+    return pd.DataFrame(rows, dtype=object)
+
+@METRICS.timed("sheet_parse_seconds", stage="read")
+def read_sheet(content, sheet_format=None):
+    """Читает таблицу (xlsx или csv) и заполняет пустоты объединенных ячеек"""
+    return fill_merged_cells(SHEET_READERS[sheet_format or SHEET_FORMAT](content))
+
+def parse_sheet(content):
+    """Разбирает xlsx-файл расписания: таблица, структура потоков и групп"""
+    df = read_sheet(content)
+    return df, map_sheet_layout(df)
+
+class SheetNotModified(Exception):
+    """Сервер ответил 304: таблица не менялась с прошлой загрузки"""
+
+async def get_http_session():
+    """Общая сессия aiohttp с пулом соединений (создается при первом запросе)"""
+    if HTTP_CLIENT["session"] is None or HTTP_CLIENT["session"].closed:
+        HTTP_CLIENT["session"] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_CONCURRENCY, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+        )
+        HTTP_CLIENT["semaphore"] = asyncio.Semaphore(HTTP_CONCURRENCY)
+    return HTTP_CLIENT["session"]
+
+async def close_http_session():
+    session = HTTP_CLIENT["session"]
+    HTTP_CLIENT["session"] = HTTP_CLIENT["semaphore"] = None
+    if session is not None:
+        await session.close()
+
+async def download_sheet(conf, etag=None):
+    """
+    Скачивает xlsx-файл таблицы. Возвращает (содержимое, ETag).
+
+    Одновременно идет не больше HTTP_CONCURRENCY загрузок. Сетевые ошибки,
+    429 и 5xx повторяются до FETCH_RETRIES раз с экспоненциальной паузой.
+    """
+    session = await get_http_session()
+    url = SHEETS_EXPORT_URL.format(sheet_id=conf["sheet_id"], gid=conf["gid"], format=SHEET_FORMAT)
+    headers = {"If-None-Match": etag} if etag else {}
+
+    for attempt in range(FETCH_RETRIES):
+        try:
+            async with HTTP_CLIENT["semaphore"]:
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status == 304 and etag:
+                        raise SheetNotModified()
+                    if resp.status != 429 and resp.status < 500:
+                        resp.raise_for_status()
+                        return await resp.read(), resp.headers.get("ETag")
+                    error = f"HTTP {resp.status}"
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+
+        if attempt + 1 < FETCH_RETRIES:
+            delay = FETCH_BACKOFF * 2 ** attempt
+            logging.warning(f"Sheet download failed ({error}), retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise ConnectionError(f"Sheet download failed after {FETCH_RETRIES} attempts: {error}")
+
+def index_sheet(content, hub_id):
+    """Разбор таблицы и построение индекса (выполняется в пуле процессов)"""
+    df, struct = parse_sheet(content)
+    return df, struct, build_schedule_index(df, struct, hub_id)
+
+# --- ИЗМЕНЕНИЯ ТАБЛИЦЫ ---
+def row_hashes(df):
+    """Хеши строк таблицы. Не зависят от PYTHONHASHSEED, поэтому годятся и для дискового кэша"""
+    return [
+        hashlib.blake2b("\x1f".join(map(str, values)).encode(), digest_size=8).digest()
+        for values in df.values.tolist()
+    ]
+
+def diff_rows(old_hashes, new_hashes):
+    """
+    Сопоставляет строки новой версии таблицы со старой по хешам.
+    Возвращает ({новая строка: старая строка} для неизменных строк, измененные строки).
+    Строка, сдвинутая вставкой или удалением выше, считается неизменной.
+    """
+    positions = {}
+    for r in range(len(old_hashes) - 1, -1, -1):
+        positions.setdefault(old_hashes[r], []).append(r)
+    same, changed = {}, []
+    for r, h in enumerate(new_hashes):
+        old = positions.get(h)
+        if old:
+            same[r] = old.pop()
+        else:
+            changed.append(r)
+    return same, changed
+
+def group_digests(by_group):
+    """
+    (fid, группа) -> день -> хеш занятий группы за день в порядке строк таблицы
+    (то, что видно в расписании). Хеши компактнее самих занятий, поэтому прошлая
+    версия передается в update_sheet только ими.
+    """
+    digests = {}
+    for key, lessons in by_group.items():
+        days = {}
+        for lesson in lessons:
+            days.setdefault(lesson["day"], []).append((lesson["time"], lesson["sub"], lesson["s"], lesson["t"], lesson["r"]))
+        digests[key] = {day: hashlib.blake2b(repr(items).encode(), digest_size=8).digest() for day, items in days.items()}
+    return digests
+
+def schedule_changes(old_digests, new_digests):
+    """Группы, у которых изменились занятия: (fid, группа) -> дни с изменениями"""
+    changes = {}
+    for key in old_digests.keys() | new_digests.keys():
+        before, after = old_digests.get(key, {}), new_digests.get(key, {})
+        days = {day for day in before.keys() | after.keys() if before.get(day) != after.get(day)}
+        if days: changes[key] = days
+    return changes
+
+def update_basis(hub):
+    """
+    То, что нужно update_sheet от прошлой версии хаба: ширина и структура таблицы,
+    хеши строк, кэш разбора текстов и хеши занятий групп. DataFrame и индекс
+    целиком в пул процессов не передаются - их сериализация дороже самого разбора.
+    """
+    index = hub["index"]
+    return {
+        "width": len(hub["df"].columns), "layout": hub["layout"], "row_hashes": index["row_hashes"],
+        "texts": index["texts"], "group_digests": index["group_digests"],
+    }
+
+def update_sheet(content, hub_id, previous):
+    """
+    Разбор новой версии таблицы с опорой на прошлую (выполняется в пуле процессов).
+
+    previous - update_basis(прошлая версия хаба). Тексты ячеек, которые были
+    в прошлой версии, берутся из ее кэша разбора, разбираются только новые.
+    Строки сравниваются по хешам, чтобы сообщить, какие из них изменились.
+    map_sheet_layout читает строки только до строки групп включительно: если
+    они и ширина таблицы те же, структура потоков не пересчитывается.
+    Возвращает (df, layout, index, changes), где changes:
+        layout - изменилась ли структура потоков и групп
+        rows   - измененные строки новой таблицы
+        groups - (fid, группа) -> коды дней, в которые изменились занятия группы
+    """
+    df = read_sheet(content)
+    hashes = row_hashes(df)
+    old_hashes = previous["row_hashes"]
+    same_width = len(df.columns) == previous["width"]
+
+    group_row = find_group_row(df)
+    header_end = group_row + 1 if group_row >= 0 else HEADER_SCAN_ROWS
+    same_header = same_width and hashes[:header_end] == old_hashes[:header_end]
+    layout = previous["layout"] if same_header else map_sheet_layout(df)
+
+    same, changed = diff_rows(old_hashes, hashes)
+    if not same_width:
+        same, changed = {}, list(range(len(hashes)))
+    # Строка, сдвинутая из шапки в область данных, для расписания новая
+    moved_in = [r for r, old_r in same.items() if old_r < DATA_START_ROW <= r]
+    if moved_in:
+        changed = sorted(changed + moved_in)
+
+    # Кэш копируется: при разборе в потоке он общий с индексом прошлой версии
+    index = build_schedule_index(df, layout, hub_id, texts=dict(previous["texts"]), hashes=hashes)
+    groups = schedule_changes(previous["group_digests"], index["group_digests"])
+    changes = {"layout": not same_header, "rows": changed, "groups": groups}
+    return df, layout, index, changes
+
+async def sync_data(hub_id, force=False):
+    """
+    Загрузка и кэширование данных из Google Sheets.
+
+    Пока запись в LOCAL_STORAGE моложе CACHE_TTL, возвращается кэш. Иначе
+    (или при force) таблица скачивается заново; если сервер ответил 304
+    по ETag или содержимое не изменилось (тот же sha256), повторный разбор
+    пропускается. При ошибке загрузки остаются старые данные.
+
+    Исход каждой проверки считается в sheet_sync_total (loaded, updated,
+    unchanged, not_modified, error), ее время - в sheet_sync_seconds.
+    """
+    cached = LOCAL_STORAGE.get(hub_id)
+    if cached and not force and time.monotonic() - cached["checked_at"] < CACHE_TTL:
+        METRICS.inc("hub_cache_total", result="hit")
+        return cached["df"], cached["layout"]
+
+    if hub_id not in ACADEMIC_DATA: await load_hub_registry(force=True)
+    conf = ACADEMIC_DATA.get(hub_id)
+    if not conf: return None, None
+
+    started = time.perf_counter()
+    try:
+        with METRICS.timer("sheet_download_seconds"):
+            content, etag = await download_sheet(conf, cached["etag"] if cached else None)
+        METRICS.observe("sheet_download_bytes", len(content), buckets=BYTES_BUCKETS)
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        if cached and cached["hash"] == content_hash:
+            METRICS.inc("sheet_sync_total", result="unchanged")
+            cached["checked_at"] = time.monotonic()
+            schedule_prerender(hub_id)
+            return cached["df"], cached["layout"]
+
+        # Разбор тяжелый (pandas + регулярки) и держит GIL, поэтому идет в пуле процессов.
+        # Новая версия сравнивается с прошлой: разбираются только новые тексты ячеек.
+        # Время этапов разбора возвращается из пула через collect
+        changes = None
+        if cached:
+            (df, struct, index, changes), parse_metrics = await POOLS.run(
+                "cpu", "parse", collect, update_sheet, content, hub_id, update_basis(cached))
+        else:
+            (df, struct, index), parse_metrics = await POOLS.run("cpu", "parse", collect, index_sheet, content, hub_id)
+        METRICS.merge(parse_metrics)
+        METRICS.inc("sheet_sync_total", result="updated" if cached else "loaded")
+        # Запись заменяется целиком, чтобы хендлеры не увидели наполовину обновленные данные
+        entry = {
+            "df": df, "layout": struct, "index": index,
+            "hash": content_hash, "etag": etag, "checked_at": time.monotonic(),
+        }
+        LOCAL_STORAGE[hub_id] = entry
+        if changes is not None:
+            carry_render_cache(hub_id, cached, entry, changes)
+        schedule_prerender(hub_id)
+        await POOLS.run("io", "disk_cache", save_disk_cache, conf, entry)
+        if changes is not None:
+            await publish_changes(hub_id, changes)
         return df, struct
+    except SheetNotModified:
+        METRICS.inc("sheet_sync_total", result="not_modified")
+        cached["checked_at"] = time.monotonic()
+        schedule_prerender(hub_id)
+        return cached["df"], cached["layout"]
     except Exception as e:
+        METRICS.inc("sheet_sync_total", result="error")
         logging.error(f"Sync error: {e}")
+        if cached:
+            # Следующая попытка - через CACHE_TTL, пока отдаем старое расписание
+            cached["checked_at"] = time.monotonic()
+            return cached["df"], cached["layout"]
         return None, None
+    finally:
+        METRICS.observe("sheet_sync_seconds", time.perf_counter() - started)
+
+async def publish_changes(hub_id, changes):
+    """Передает изменения расписания подписчикам из CHANGE_LISTENERS"""
+    logging.info(f"Hub {hub_id} changed: {len(changes['rows'])} rows, {len(changes['groups'])} groups"
+                 + (", new layout" if changes["layout"] else ""))
+    for listener in CHANGE_LISTENERS:
+        try:
+            await listener(hub_id, changes)
+        except Exception as e:
+            logging.error(f"Change listener error: {e}")
+
+def disk_cache_path(conf):
+    return os.path.join(CACHE_DIR, f"{conf['sheet_id']}_{conf['gid']}.pkl")
+
+def save_disk_cache(conf, entry):
+    """Сохраняет разобранную таблицу на диск (через временный файл, чтобы не оставить обрывок)"""
+    path = disk_cache_path(conf)
+    tmp_path = path + ".tmp"
+    data = {
+        "format": CACHE_FORMAT, "sheet_id": conf["sheet_id"], "gid": conf["gid"],
+        "hash": entry["hash"], "etag": entry["etag"],
+        "df": entry["df"], "layout": entry["layout"], "index": entry["index"],
+    }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError) as e:
+        logging.error(f"Disk cache write error: {e}")
+
+def load_disk_cache():
+    """
+    Загружает в LOCAL_STORAGE сохраненные таблицы хабов из ACADEMIC_DATA.
+    Загруженные записи считаются устаревшими: первый же запрос отдаст их
+    сразу и запустит проверку таблицы в фоне. Возвращает число хабов.
+    """
+    loaded = 0
+    for hid, conf in ACADEMIC_DATA.items():
+        path = disk_cache_path(conf)
+        if hid in LOCAL_STORAGE or not os.path.exists(path): continue
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logging.error(f"Disk cache read error ({path}): {e}")
+            continue
+        if data.get("format") != CACHE_FORMAT or (data.get("sheet_id"), data.get("gid")) != (conf["sheet_id"], conf["gid"]):
+            continue
+
+        LOCAL_STORAGE[hid] = {
+            "df": data["df"], "layout": data["layout"], "index": data["index"],
+            "hash": data["hash"], "etag": data["etag"], "checked_at": -CACHE_TTL,
+        }
+        loaded += 1
+    return loaded
+
+def refresh_hub(hub_id):
+    """
+    Запускает загрузку хаба отдельной задачей.
+    Пока загрузка идет, повторные вызовы получают ту же задачу (single-flight).
+    """
+    task = REFRESH_TASKS.get(hub_id)
+    if task is None or task.done():
+        task = asyncio.ensure_future(sync_data(hub_id, force=True))
+        REFRESH_TASKS[hub_id] = task
+    return task
+
+def init_pools(processes=None):
+    """Пересоздает пулы исполнителей; с processes=True таблицы разбираются в отдельных процессах"""
+    global POOLS
+    POOLS.shutdown(wait=False)
+    if processes is None: processes = PARSE_PROCESSES
+    POOLS = WorkerPools(IO_WORKERS, PARSE_WORKERS, QUERY_WORKERS, processes=processes)
+
+def init_storage(url):
+    """Подключает постоянное хранилище и добавляет в ACADEMIC_DATA сохраненные хабы"""
+    global STORE
+    STORE = BotStore(open_kv(url), executor=POOLS.io)
+    # При запуске - синхронно: бот еще не принимает запросы
+    ACADEMIC_DATA.update(STORE.get_hubs())
+    HUB_REGISTRY["loaded_at"] = time.monotonic()
+    logging.info(f"State store: {STORE.kv!r}")
+
+def hub_registry_stale():
+    loaded_at = HUB_REGISTRY["loaded_at"]
+    return loaded_at is None or time.monotonic() - loaded_at >= HUB_REGISTRY_TTL
+
+async def load_hub_registry(force=False):
+    """Подтягивает хабы, добавленные пользователями (в том числе другими процессами бота)"""
+    if not force and not hub_registry_stale(): return
+    HUB_REGISTRY["loaded_at"] = time.monotonic()
+    ACADEMIC_DATA.update(await STORE.aget_hubs())
+
+def refresh_hub_registry():
+    """Обновляет реестр хабов в фоне, если он устарел: меню строится по тому, что уже есть"""
+    task = HUB_REGISTRY["task"]
+    if hub_registry_stale() and (task is None or task.done()):
+        HUB_REGISTRY["task"] = asyncio.ensure_future(load_hub_registry())
+
+async def prefetch_hubs():
+    """
+    Готовит хабы при запуске бота: сначала берет разобранные таблицы с диска,
+    затем параллельно загружает недостающие. Хабы из дискового кэша
+    проверяются на изменения в фоне, не задерживая запуск.
+    """
+    started = time.perf_counter()
+    from_disk = load_disk_cache()
+    cold = [hid for hid in ACADEMIC_DATA if hid not in LOCAL_STORAGE]
+    for hid in ACADEMIC_DATA:
+        if hid not in cold: refresh_hub(hid)
+    await asyncio.gather(*(refresh_hub(hid) for hid in cold))
+    logging.info(f"Loaded {from_disk} hubs from disk cache")
+    logging.info(f"Prefetched {len(LOCAL_STORAGE)}/{len(ACADEMIC_DATA)} hubs in {time.perf_counter() - started:.2f}s")
+
+async def hub_indexes(hub_ids):
+    """
+    Индексы тех хабов из hub_ids, что удалось загрузить (в том же порядке).
+    Холодные хабы загружаются параллельно: число одновременных загрузок
+    ограничивает семафор HTTP_CLIENT, разбор - пул cpu.
+    """
+    # Копия: пока ждем загрузку, в ACADEMIC_DATA могут добавиться хабы
+    hubs = await asyncio.gather(*(get_hub_data(hid) for hid in list(hub_ids)))
+    return [hub["index"] for hub in hubs if hub]
+
+async def get_hub_data(hub_id):
+    """
+    Данные хаба из LOCAL_STORAGE (df, layout, index ...) или None.
+
+    Холодный хаб загружается один раз, сколько бы пользователей ни ждали его
+    одновременно. Устаревшие данные отдаются сразу, а обновление идет в фоне
+    (stale-while-revalidate).
+    """
+    cached = LOCAL_STORAGE.get(hub_id)
+    if cached is None:
+        METRICS.inc("hub_cache_total", result="miss")
+        await refresh_hub(hub_id)
+        return LOCAL_STORAGE.get(hub_id)
+    if time.monotonic() - cached["checked_at"] >= CACHE_TTL:
+        METRICS.inc("hub_cache_total", result="stale")
+        refresh_hub(hub_id)
+    else:
+        METRICS.inc("hub_cache_total", result="hit")
+    return cached
 
 # --- ИНТЕРФЕЙС (КЛАВИАТУРЫ) ---
 def ui_main_menu():
+    refresh_hub_registry()
     kb = []
     for hid, info in ACADEMIC_DATA.items():
         kb.append([InlineKeyboardButton(text=f"📘 {info['label']}", callback_data=f"hub:{hid}")])
@@ -265,6 +1258,20 @@ def ui_post_control(mode="general"):
         kb[0].append(InlineKeyboardButton(text="🔎 Поиск препода", callback_data="find_proff"))
 
     return InlineKeyboardMarkup(inline_keyboard=kb)
+def ui_suggestions(names, data_prefix, mode):
+    """Кнопки с вариантами поиска ("Возможно, вы искали ...") и навигацией"""
+    kb, row = [], []
+    for name in names:
+        data = f"{data_prefix}{name}"
+        # Telegram ограничивает callback_data 64 байтами
+        if len(data.encode()) > 64: continue
+        row.append(InlineKeyboardButton(text=f"🔎 {name}", callback_data=data))
+        if len(row) == 2:
+            kb.append(row); row = []
+    if row: kb.append(row)
+    kb.extend(ui_post_control(mode).inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
 def ui_flow_select(hid, struct):
     kb = []
     for fid in sorted(struct.keys()):
@@ -296,57 +1303,39 @@ def ui_day_select(hid, fid, cluster, col):
 
 def parse_time_range(time_str):
     """Превращает '10:45 - 12:20' в объекты time"""
-    try:
-        times = re.findall(r"(\d{1,2}[:.]\d{2})", time_str)
-        if len(times) >= 2:
-            start = datetime.strptime(times[0].replace('.', ':'), "%H:%M").time()
-            end = datetime.strptime(times[1].replace('.', ':'), "%H:%M").time()
-            return start, end
-    except:
-        pass
+    times = TIME_PARTS_RX.findall(time_str)
+    if len(times) >= 2:
+        try:
+            return dtime(int(times[0][0]), int(times[0][1])), dtime(int(times[1][0]), int(times[1][1]))
+        except ValueError:
+            pass
     return None, None
 
-async def render_schedule_output(message: Message, day_code: str, hid: str, fid: str, gnum: str, col: str):
-    if hid not in LOCAL_STORAGE:
-        await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-
-    df, layout = LOCAL_STORAGE[hid]["df"], LOCAL_STORAGE[hid]["layout"]
-
-    # Карты колонок
-    group_columns_map = layout[fid]["map"][int(gnum)]
-    anchor_col = layout[fid]["anchor_col"]
-
-    # Собираем все колонки потока
-    all_flow_columns = []
-    for grp_data in layout[fid]["map"].values():
-        all_flow_columns.extend(grp_data.values())
-
-    if day_code not in SEARCH_DAYS_LOW:
-        await message.answer("🗓 <b>Сегодня воскресенье!</b>\nЗанятий нет, отдыхайте.", parse_mode="HTML", reply_markup=ui_post_control())
-        return
-
-    day_query = SEARCH_DAYS_LOW if day_code == "all" else {day_code: SEARCH_DAYS_LOW[day_code]}
+def build_schedule_text(hub, day_code, fid, gnum):
+    """
+    HTML-текст расписания группы на день (day_code или "all" - вся неделя).
+    Возвращает None, если занятий нет.
+    """
+    index = hub["index"]
     output = [f"🏛 <b>ГРУППА {gnum}</b>\n"]
     has_data = False
 
+    # Занятия группы (вместе с лекциями потока), сгруппированные по строкам таблицы
+    group_lessons = {}
+    for lesson in index["by_group"].get((fid, int(gnum)), []):
+        group_lessons.setdefault(lesson["row"], []).append(lesson)
+
     # Структура daily_data теперь хранит сырые наборы данных (sets), а не готовые строки
     # daily_data[day][time] = { "is_flow": False, "groups": { "МСС": {s:set, t:set, r:set}, ... } }
     daily_data = {}
+    day_rows = index["rows"].values() if day_code == "all" else index["by_day"].get(day_code, [])
 
-    for idx, row in df.iterrows():
-        if idx < 15: continue
+    for row in day_rows:
+        if row["idx"] < LESSONS_START_ROW or not row["days"] or not row["has_time"]: continue
 
         # --- 1. День и Время ---
-        d_val = str(row[0]).strip().lower()
-        target_day_name = ""
-        for k, v in day_query.items():
-            if v in d_val:
-                target_day_name = v.upper()
-                break
-        if not target_day_name: continue
-
-        time_str = str(row[1]).replace("\n", " ").strip()
-        if not re.search(r'\d{1,2}[:.]\d{2}', time_str): continue
+        target_day_name = SEARCH_DAYS_LOW[row["days"][0] if day_code == "all" else day_code].upper()
+        time_str = row["time"]
 
         if target_day_name not in daily_data: daily_data[target_day_name] = {}
         if time_str not in daily_data[target_day_name]:
@@ -354,51 +1343,20 @@ async def render_schedule_output(message: Message, day_code: str, hid: str, fid:
 
         slot = daily_data[target_day_name][time_str]
 
-        # --- 2. Проверка ПОТОКА ---
-        cell_flow = row[anchor_col]
-        flow_text = scrub_content(cell_flow)
-        data_flow = extract_full_data(cell_flow)
+        # --- 2. Сбор данных в словарь (Агрегация) ---
+        for lesson in group_lessons.get(row["idx"], []):
+            if lesson["group"] is None:
+                # Для потока используем пустой ключ ""
+                slot["is_flow"] = True
+            label = lesson["sub"]
+            if label not in slot["groups"]:
+                slot["groups"][label] = {"s": set(), "t": set(), "r": set()}
 
-        is_global_flow = False
-        if data_flow["s"] or data_flow["t"]:
-            is_conflict = False
-            for check_col in all_flow_columns:
-                if check_col == anchor_col: continue
-                other_text = scrub_content(row[check_col])
-                if other_text and other_text != flow_text:
-                    is_conflict = True
-                    break
-            if not is_conflict:
-                is_global_flow = True
-
-        # --- 3. Сбор данных в словарь (Агрегация) ---
-
-        if is_global_flow:
-            slot["is_flow"] = True
-            # Для потока используем пустой ключ ""
-            if "" not in slot["groups"]: slot["groups"][""] = {"s": set(), "t": set(), "r": set()}
-
-            if data_flow["s"]: slot["groups"][""]["s"].add(data_flow["s"])
-            if data_flow["t"]: slot["groups"][""]["t"].add(data_flow["t"])
-            if data_flow["r"]: slot["groups"][""]["r"].add(data_flow["r"])
-        else:
-            # Проходим по всем подгруппам (КТС, МСС, ФМиИС...)
-            for sub_label, sub_col_idx in group_columns_map.items():
-                cell_data = extract_full_data(row[sub_col_idx])
-
-                if cell_data["s"] or cell_data["t"]:
-                    # Очищаем метку от цифр дубликатов: "МСС (2)" -> "МСС"
-                    # Благодаря этому данные из соседних колонок (Предмет и Препод) попадут в ОДИН ключ
-                    real_label = re.sub(r'\s*\(\d+\)$', '', sub_label)
-
-                    if real_label not in slot["groups"]:
-                        slot["groups"][real_label] = {"s": set(), "t": set(), "r": set()}
+            if lesson["s"]: slot["groups"][label]["s"].add(lesson["s"])
+            if lesson["t"]: slot["groups"][label]["t"].add(lesson["t"])
+            if lesson["r"]: slot["groups"][label]["r"].add(lesson["r"])
 
-                    if cell_data["s"]: slot["groups"][real_label]["s"].add(cell_data["s"])
-                    if cell_data["t"]: slot["groups"][real_label]["t"].add(cell_data["t"])
-                    if cell_data["r"]: slot["groups"][real_label]["r"].add(cell_data["r"])
-
-    # --- 4. Генерация итогового текста ---
+    # --- 3. Генерация итогового текста ---
     for day, times in daily_data.items():
         output.append(f"\n📅 <b>{day}</b>")
         for time, data in times.items():
@@ -434,12 +1392,254 @@ async def render_schedule_output(message: Message, day_code: str, hid: str, fid:
 
             output.append(f"<code>{time:12}</code> | {final_str}{tag}")
 
-    if not has_data:
+    return "\n".join(output)[:4000] if has_data else None
+
+def schedule_text(hid, hub, day_code, fid, gnum):
+    """
+    Готовый текст расписания из RENDER_CACHE; при промахе строится и запоминается.
+    Кэш хаба привязан к хешу таблицы: после обновления данных он сбрасывается.
+    """
+    cache = RENDER_CACHE.get(hid)
+    if cache is None or cache["version"] != hub["hash"]:
+        cache = RENDER_CACHE[hid] = {"version": hub["hash"], "texts": {}}
+    key = (fid, str(gnum), day_code)
+    if key not in cache["texts"]:
+        METRICS.inc("render_cache_total", result="miss")
+        cache["texts"][key] = build_schedule_text(hub, day_code, fid, gnum)
+    else:
+        METRICS.inc("render_cache_total", result="hit")
+    return cache["texts"][key]
+
+def prerender_schedules(hub, known=()):
+    """Тексты расписаний всех групп хаба на каждый день недели: (fid, группа, день) -> текст; known пропускаются"""
+    return {
+        (fid, str(g_num), day_code): build_schedule_text(hub, day_code, fid, g_num)
+        for fid, flow_data in hub["layout"].items()
+        for g_num in flow_data["map"]
+        for day_code in SEARCH_DAYS_LOW
+        if (fid, str(g_num), day_code) not in known
+    }
+
+def carry_render_cache(hub_id, old_hub, new_hub, changes):
+    """
+    Переносит готовые тексты на новую версию хаба, кроме групп из changes["groups"].
+    При новой структуре потоков кэш сбрасывается целиком, тексты на всю неделю -
+    всегда (в них видны дни всей таблицы). Возвращает число перенесенных текстов.
+    """
+    cache = RENDER_CACHE.get(hub_id)
+    if not cache or cache["version"] != old_hub["hash"] or changes["layout"]: return 0
+    texts = {
+        key: text for key, text in cache["texts"].items()
+        if key[2] != "all" and (key[0], int(key[1])) not in changes["groups"]
+    }
+    RENDER_CACHE[hub_id] = {"version": new_hub["hash"], "texts": texts}
+    return len(texts)
+
+async def warm_render_cache(hub_id):
+    """Заранее готовит тексты расписаний хаба, если данные изменились (в пуле запросов)"""
+    hub = LOCAL_STORAGE.get(hub_id)
+    if not hub: return
+    cache = RENDER_CACHE.get(hub_id)
+    if cache and cache["version"] == hub["hash"] and cache.get("warm"): return
+    # Перенесенные с прошлой версии тексты (carry_render_cache) не перестраиваются
+    known = set(cache["texts"]) if cache and cache["version"] == hub["hash"] else set()
+    texts = await POOLS.run("query", "prerender", prerender_schedules, hub, known)
+    # Пока шла подготовка, хаб мог обновиться еще раз - тогда результат уже не нужен
+    if LOCAL_STORAGE.get(hub_id) is not hub: return
+    cache = RENDER_CACHE.get(hub_id)
+    if cache and cache["version"] == hub["hash"]:
+        # Тексты, построенные по запросам за это время (например, на всю неделю)
+        texts.update(cache["texts"])
+    RENDER_CACHE[hub_id] = {"version": hub["hash"], "texts": texts, "warm": True}
+
+def schedule_prerender(hub_id):
+    """Запускает warm_render_cache отдельной задачей (одна задача на хаб)"""
+    task = RENDER_TASKS.get(hub_id)
+    if task is None or task.done():
+        RENDER_TASKS[hub_id] = asyncio.ensure_future(warm_render_cache(hub_id))
+
+async def render_schedule_output(message: Message, day_code: str, hid: str, fid: str, gnum: str, col: str):
+    hub = await get_hub_data(hid)
+    if not hub:
+        await message.answer("❌ Ошибка загрузки данных.", reply_markup=ui_main_menu())
+        return
+
+    if day_code not in SEARCH_DAYS_LOW:
+        await message.answer("🗓 <b>Сегодня воскресенье!</b>\nЗанятий нет, отдыхайте.", parse_mode="HTML", reply_markup=ui_post_control())
+        return
+
+    text = schedule_text(hid, hub, day_code, fid, gnum)
+    if text is None:
         await message.answer("🏖 <b>Занятий не найдено.</b>", parse_mode="HTML", reply_markup=ui_post_control())
     else:
-        await message.answer("\n".join(output)[:4000], parse_mode="HTML")
+        await message.answer(text, parse_mode="HTML")
         await message.answer("⚙️ <b>Навигация:</b>", reply_markup=ui_post_control(), parse_mode="HTML")
 
+# --- ПОИСКОВЫЕ ЗАПРОСЫ ---
+# Работают только с готовыми индексами. Поиск по тексту ячеек (преподаватель, аудитория,
+# похожие слова) идет в пуле запросов, чтобы поиск по всем хабам не останавливал event loop
+# для остальных пользователей. Свободные кабинеты и текущие пары - бинарный поиск и битовые
+# маски за доли миллисекунды: переход в пул стоил бы дороже, они выполняются на месте
+@METRICS.timed("query_seconds", query="teacher")
+def find_teacher_events(indexes, name, target_days):
+    """Занятия преподавателя name: день -> время -> строки описания"""
+    found_events = {}
+    for index in indexes:
+        # Ячейки с фамилией берем из индекса слов, а не сканируем всю таблицу
+        for r_idx, c_idx in find_cells(index, name):
+            if r_idx < LESSONS_START_ROW: continue
+            row = index["rows"][r_idx]
+
+            # Проверка дня и времени
+            if not any(code in row["days"] for code in target_days): continue
+            if not row["has_time"]: continue
+
+            grp_tag = index["owners"][c_idx]["tag"]
+
+            # Формируем описание
+            content_data = index["cells"][(r_idx, c_idx)]["data"]
+            # Если extract_full_data вернул пустоту (например, там только фамилия), берем сырой текст
+            subj_text = content_data["s"] if content_data["s"] else content_data["t"]
+
+            # Красивое форматирование строки
+            day_name = row["day"]
+            time_name = row["time"]
+
+            # Собираем инфо: Предмет [Кабинет] (Группа)
+            room_part = f" [🚪 {content_data['r']}]" if content_data['r'] else ""
+            full_desc = f"▫️ {subj_text}{room_part} — *{grp_tag}*"
+
+            if day_name not in found_events: found_events[day_name] = {}
+            if time_name not in found_events[day_name]: found_events[day_name][time_name] = []
+
+            # Избегаем дубликатов (если препод записан и в Subject и в Teacher ячейках одной строки)
+            if full_desc not in found_events[day_name][time_name]:
+                found_events[day_name][time_name].append(full_desc)
+    return found_events
+
+@METRICS.timed("query_seconds", query="room")
+def find_room_schedule(indexes, query):
+    """Занятия в аудитории query: день -> время -> строки описания"""
+    found_schedule = {}
+    for index in indexes:
+        cells = index["cells"]
+
+        # Ячейки с номером кабинета берем из индекса слов
+        for idx, col_idx in find_cells(index, query):
+            if idx < LESSONS_START_ROW: continue
+
+            # 1. ВЛАДЕЛЕЦ И ЯКОРНАЯ КОЛОНКА (Anchor) ПОСЧИТАНЫ ПРИ ПОСТРОЕНИИ ИНДЕКСА
+            owner = index["owners"][col_idx]
+            owner_name = owner["owner"]
+            current_anchor_col = owner["anchor"]
+
+            # 2. СОБИРАЕМ ТЕКСТ (Subject/Teacher)
+            # Смотрим:
+            # А) В текущей колонке (вверх на 2 строки)
+            # Б) В ЯКОРНОЙ колонке (вверх на 2 строки) - потому что название лекции часто там!
+
+            context_parts = []
+            rows_to_check = [idx]
+            if idx > 15: rows_to_check.insert(0, idx - 1)
+            if idx > 16: rows_to_check.insert(0, idx - 2)
+
+            # Колонки для сканирования: текущая + якорная (если она отличается)
+            cols_to_scan = {col_idx}
+            if current_anchor_col != -1:
+                cols_to_scan.add(current_anchor_col)
+
+            for r_i in rows_to_check:
+                for c_i in cols_to_scan:
+                    cell = cells.get((r_i, c_i))
+                    val = cell["raw"].strip() if cell else ""
+                    if val and val.lower() != "nan":
+                        context_parts.append(val)
+
+            full_context_text = "\n".join(context_parts)
+            data = extract_full_data(full_context_text)
+
+            if not data["s"] and not data["t"]:
+                continue
+
+            # 3. ИЩЕМ ВРЕМЯ
+            time_s = ""
+            day = ""
+            for r_i in reversed(rows_to_check):
+                row = index["rows"][r_i]
+                if row["has_time"]:
+                    time_s = row["time"]
+                    day = row["day"]
+                    break
+
+            if not time_s or not day: continue
+
+            # 4. СОХРАНЯЕМ
+            subj_teach = f"{data['s']} {data['t']}".strip()
+
+            if day not in found_schedule: found_schedule[day] = {}
+            if time_s not in found_schedule[day]: found_schedule[day][time_s] = []
+
+            entry = f"{subj_teach} — <b>{owner_name}</b>"
+            if entry not in found_schedule[day][time_s]:
+                found_schedule[day][time_s].append(entry)
+    return found_schedule
+
+@METRICS.timed("query_seconds", query="teacher_now")
+def find_teacher_now(indexes, name_query, day_code, moment):
+    """Строка таблицы с парой, которая идет в момент moment и где упомянут name_query (или None)"""
+    for index in indexes:
+        # Только строки с парами, идущими сейчас (бинарный поиск по интервалам дня)
+        for row in rows_at(index, day_code, moment):
+            # Проверяем всю строку
+            if name_query in row["text_low"]:
+                return row
+    return None
+
+@METRICS.timed("query_seconds", query="free_rooms")
+def find_free_rooms(indexes, day_code, t_from, t_to=None):
+    """Кабинеты, свободные в момент t_from (или весь интервал [t_from, t_to]), по алфавиту"""
+    all_rooms, occupied_rooms = set(), set()
+    for index in indexes:
+        # Кабинеты строк (и 521а, и 105) уже найдены при построении индекса,
+        # занятые в каждом интервале хранятся битовой маской
+        all_rooms.update(index["room_names"])
+        occupied_rooms.update(find_occupied_rooms(index, day_code, t_from, t_to))
+    return sorted(all_rooms - occupied_rooms)
+
+@METRICS.timed("query_seconds", query="near_event")
+def find_near_events(indexes, now):
+    """Строки отчета "Что сейчас идет?": текущие пары, а если их нет - ближайшие сегодня"""
+    current_time = now.time()
+    current_code = now.strftime('%a').lower()
+    report = []
+    upcoming = []
+
+    for index in indexes:
+        # Пары, идущие ПРЯМО СЕЙЧАС (бинарный поиск по интервалам дня)
+        for row in rows_at(index, current_code, current_time):
+            # Считаем разницу
+            end_dt = datetime.combine(now.date(), row["end"])
+            remains = end_dt - now
+            minutes_left = int(remains.total_seconds() // 60)
+
+            # Предметы строки отобраны через validate_subject при построении индекса
+            for cell in row["subjects"]:
+                report.append(f"<b>СЕЙЧАС:</b>\n🕒 <code>{row['time_raw']}</code> | {cell}")
+                report.append(f"⏳ <i>До конца осталось: {minutes_left} мин.</i>\n")
+
+        upcoming.extend(next_slot_rows(index, current_code, current_time))
+
+    # Если сейчас пар нет - показываем ближайшие сегодня
+    if not report and upcoming:
+        first_start = min(row["start"] for row in upcoming)
+        minutes_to = int((datetime.combine(now.date(), first_start) - now).total_seconds() // 60)
+        for row in upcoming:
+            if row["start"] != first_start: continue
+            for cell in row["subjects"]:
+                report.append(f"<b>СКОРО:</b>\n🕒 <code>{row['time_raw']}</code> | {cell}")
+                report.append(f"⏳ <i>Начало через {minutes_to} мин.</i>\n")
+    return report
+
 async def run_proff_search(msg, scope, name, day_code):
     try:
         await msg.delete()
@@ -450,84 +1650,19 @@ async def run_proff_search(msg, scope, name, day_code):
     target_days = SEARCH_DAYS_LOW if day_code == "all" else {day_code: SEARCH_DAYS_LOW[day_code]}
     targets = list(ACADEMIC_DATA.keys()) if scope == "global" else [scope]
 
-    found_events = {}
-    time_rx = re.compile(r"\d{1,2}[:.]\d{2}")
-
-    for hid in targets:
-        df, layout = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-        if df is None: continue
-
-        for idx, row in df.iterrows():
-            if idx < 15: continue
-
-            # Проверка дня
-            d_val = str(row[0]).lower()
-            if not any(v in d_val for v in target_days.values()): continue
-
-            # Проверка времени
-            t_val = str(row[1])
-            if not time_rx.search(t_val): continue
-
-            # Проход по колонкам
-            for c_idx in range(2, len(row)):
-                cell_raw = str(row[c_idx])
-
-                # Если фамилия найдена
-                if name.lower() in cell_raw.lower():
-
-                    grp_tag = "Неизв."
-
-                    # --- ИСПРАВЛЕННАЯ ЛОГИКА ОПРЕДЕЛЕНИЯ ГРУППЫ/ПОТОКА ---
-                    for fid, flow_data in layout.items():
-
-                        # 1. ПРИОРИТЕТ: Проверяем, не является ли это колонкой ПОТОКА
-                        if c_idx == flow_data["anchor_col"]:
-                            # Проверяем, действительно ли это поток (нет конфликтов в других колонках)
-                            # Хотя для поиска можно упростить: если препод в главной колонке - считаем потоком
-                            # или пишем "Гр. 1 (Поток)"
-                            grp_tag = f"Поток ({flow_data['title']})"
-                            break
-
-                        # 2. Если не поток, ищем конкретную группу
-                        found_group = False
-                        for g_num, groups in flow_data["map"].items():
-                            for sub_label, sub_col in groups.items():
-                                if sub_col == c_idx:
-                                    # Очищаем " (2)" из названия
-                                    clean_label = re.sub(r'\s*\(\d+\)$', '', sub_label)
-                                    label_str = f" ({clean_label})" if "общая" not in clean_label.lower() else ""
-                                    grp_tag = f"Гр. {g_num}{label_str}"
-                                    found_group = True
-                                    break
-                            if found_group: break
-
-                        if found_group: break
-                    # -----------------------------------------------------
-
-                    # Формируем описание
-                    content_data = extract_full_data(cell_raw)
-                    # Если extract_full_data вернул пустоту (например, там только фамилия), берем сырой текст
-                    subj_text = content_data["s"] if content_data["s"] else content_data["t"]
-
-                    # Красивое форматирование строки
-                    day_name = str(row[0]).strip().upper()
-                    time_name = t_val.replace("\n", " ").strip()
-
-                    # Собираем инфо: Предмет [Кабинет] (Группа)
-                    room_part = f" [🚪 {content_data['r']}]" if content_data['r'] else ""
-                    full_desc = f"▫️ {subj_text}{room_part} — *{grp_tag}*"
-
-                    if day_name not in found_events: found_events[day_name] = {}
-                    if time_name not in found_events[day_name]: found_events[day_name][time_name] = []
-
-                    # Избегаем дубликатов (если препод записан и в Subject и в Teacher ячейках одной строки)
-                    if full_desc not in found_events[day_name][time_name]:
-                        found_events[day_name][time_name].append(full_desc)
+    indexes = await hub_indexes(targets)
+    found_events = await POOLS.run("query", "teacher_search", find_teacher_events, indexes, name, target_days)
 
     await loading.delete()
 
     if not found_events:
-        await msg.answer(f"🤷‍♂️ *Ничего не найдено для:* {name}", reply_markup=ui_post_control("proff"), parse_mode="Markdown")
+        # Возможно, в фамилии опечатка - предлагаем похожие
+        suggestions = await POOLS.run("query", "suggest", suggest_terms, indexes, name, "teacher")
+        if suggestions:
+            await msg.answer(f"🤷‍♂️ *Ничего не найдено для:* {name}\nВозможно, вы искали:",
+                             reply_markup=ui_suggestions(suggestions, f"p_scope:{scope}:", "proff"), parse_mode="Markdown")
+        else:
+            await msg.answer(f"🤷‍♂️ *Ничего не найдено для:* {name}", reply_markup=ui_post_control("proff"), parse_mode="Markdown")
         return
 
     report = [f"👨‍🏫 *Результаты для:* {name}"]
@@ -560,7 +1695,8 @@ async def go_home(cb: CallbackQuery, state: FSMContext):
 async def hub_click(cb: CallbackQuery):
     hid = cb.data.split(":")[1]
     await cb.message.edit_text("⏳ _Загрузка расписания..._", parse_mode="Markdown")
-    df, struct = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
+    hub = await get_hub_data(hid)
+    struct = hub["layout"] if hub else None
     if not struct:
         await cb.message.edit_text("❌ Ошибка загрузки данных.", reply_markup=ui_main_menu())
         return
@@ -570,17 +1706,26 @@ async def hub_click(cb: CallbackQuery):
 @dp.callback_query(F.data.startswith("flow:"))
 async def flow_click(cb: CallbackQuery):
     _, hid, fid = cb.data.split(":")
-    struct = LOCAL_STORAGE[hid]["layout"]
+    hub = await get_hub_data(hid)
+    struct = hub["layout"] if hub else None
+    # Кнопка могла остаться от старой версии таблицы, где был другой набор потоков
+    if not struct or fid not in struct:
+        await cb.message.edit_text("❌ Ошибка загрузки данных.", reply_markup=ui_main_menu())
+        return
     await cb.message.edit_text("👥 *Выберите вашу группу:*",
                                reply_markup=ui_cluster_select(hid, fid, struct), parse_mode="Markdown")
 
 @dp.callback_query(F.data.startswith("cls:"))
 async def cluster_click(cb: CallbackQuery):
     _, hid, fid, gnum = cb.data.split(":")
-    struct = LOCAL_STORAGE[hid]["layout"]
+    hub = await get_hub_data(hid)
+    struct = hub["layout"] if hub else None
+    subgroups = struct.get(fid, {}).get("map", {}).get(int(gnum)) if struct else None
+    if not subgroups:
+        await cb.message.edit_text("❌ Ошибка загрузки данных.", reply_markup=ui_main_menu())
+        return
 
     # По умолчанию берем первую подгруппу/колонку для этой группы
-    subgroups = struct[fid]["map"][int(gnum)]
     first_col = list(subgroups.values())[0]
 
     await cb.message.edit_text("🗓 *На какой день нужно расписание?*",
@@ -589,14 +1734,17 @@ async def cluster_click(cb: CallbackQuery):
 @dp.callback_query(F.data.startswith("get:"))
 async def get_schedule(cb: CallbackQuery):
     _, d, h, f, g, c = cb.data.split(":")
-    USER_PREFS[cb.from_user.id] = {'hid': h, 'fid': f, 'gnum': g, 'col': c}
+    STORE.set_prefs(cb.from_user.id, {'hid': h, 'fid': f, 'gnum': g, 'col': c})
+    # Подписка на уведомления следует за выбранной группой
+    if await STORE.aget_subscription(cb.from_user.id):
+        STORE.subscribe(cb.from_user.id, {'hid': h, 'fid': f, 'gnum': g})
     await cb.answer()
     await render_schedule_output(cb.message, d, h, f, g, c)
 
 # --- ДОБАВЛЕНИЕ КУРСОВ ---
 @dp.callback_query(F.data == "today_sch")
 async def cb_today(cb: CallbackQuery):
-    p = USER_PREFS.get(cb.from_user.id)
+    p = await STORE.aget_prefs(cb.from_user.id)
     if not p:
         await cb.answer("❌ Выберите группу в меню!", show_alert=True)
         return
@@ -607,7 +1755,7 @@ async def cb_today(cb: CallbackQuery):
 
 @dp.callback_query(F.data == "tomorrow_sch")
 async def cb_tomorrow(cb: CallbackQuery):
-    p = USER_PREFS.get(cb.from_user.id)
+    p = await STORE.aget_prefs(cb.from_user.id)
     if not p:
         await cb.answer("❌ Выберите группу!", show_alert=True)
         return
@@ -619,6 +1767,7 @@ async def cb_tomorrow(cb: CallbackQuery):
     tomorrow = now + timedelta(days=1)
     d = tomorrow.strftime('%a').lower()[:3]
     await render_schedule_output(cb.message, d, p['hid'], p['fid'], p['gnum'], p['col'])
+@dp.callback_query(F.data == "setup_hub")
 async def add_hub_start(cb: CallbackQuery, state: FSMContext):
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Отмена", callback_data="home")]
@@ -646,12 +1795,15 @@ async def add_hub_final(msg: Message, state: FSMContext):
         return
 
     data = await state.get_data()
-    new_id = f"edu_{len(ACADEMIC_DATA)+1}"
-    ACADEMIC_DATA[new_id] = {
+    conf = {
         "label": data['title'],
         "sheet_id": sid.group(1),
         "gid": gid.group(1) if gid else "0"
     }
+    # ID из адреса таблицы: одинаковый во всех процессах бота и не занятый после перезапуска
+    new_id = "edu_" + hashlib.sha1(f"{conf['sheet_id']}:{conf['gid']}".encode()).hexdigest()[:8]
+    ACADEMIC_DATA[new_id] = conf
+    STORE.add_hub(new_id, conf)
     await state.clear()
     await msg.answer(f"✅ Расписание *{data['title']}* успешно добавлено!",
                      reply_markup=ui_main_menu(), parse_mode="Markdown")
@@ -670,35 +1822,25 @@ async def cb_track_teacher_start(cb: CallbackQuery, state: FSMContext):
 # В обработчик поиска (где ты ищешь преподавателя), добавь логику проверки времени:
 @dp.message(FormStates.waiting_teacher_track)
 async def process_teacher_tracking(msg: Message, state: FSMContext):
-    name_query = msg.text.strip().lower()
+    name_query = fold_text(msg.text.strip())
     await state.clear()
     now = datetime.now()
     curr_time = now.time()
-    curr_day = WEEK_DAYS.get(now.strftime('%a').lower(), "").lower()
-
-    found = False
-    for hid in ACADEMIC_DATA:
-        df, _ = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-        for idx, row in df.iterrows():
-            if idx < 10 or curr_day not in str(row[0]).lower(): continue
-
-            start, end = parse_time_range(str(row[1]))
-            if start and end and start <= curr_time <= end:
-                # Проверяем всю строку
-                row_str = " ".join([str(v) for v in row.values]).lower()
-                if name_query in row_str:
-                    found = True
-                    # Пытаемся найти кабинет в этой строке
-                    room_m = re.search(r'\b\d{2,4}[а-яА-Я]?\b', " ".join([str(v) for v in row.values]))
-                    room = room_m.group() if room_m else "не указана"
-
-                    await msg.answer(
-                        f"📍 <b>{msg.text}</b> сейчас на паре.\n"
-                        f"🚪 Аудитория: <b>{room}</b>\n"
-                        f"🕒 До конца: {end.strftime('%H:%M')}",
-                        parse_mode="HTML", reply_markup=ui_post_control("track")
-                    )
-                    return
+    curr_code = now.strftime('%a').lower()
+
+    indexes = await hub_indexes(ACADEMIC_DATA)
+    row = find_teacher_now(indexes, name_query, curr_code, curr_time)
+    if row:
+        # Первый кабинет в этой строке
+        room = row["rooms"][0] if row["rooms"] else "не указана"
+
+        await msg.answer(
+            f"📍 <b>{msg.text}</b> сейчас на паре.\n"
+            f"🚪 Аудитория: <b>{room}</b>\n"
+            f"🕒 До конца: {row['end'].strftime('%H:%M')}",
+            parse_mode="HTML", reply_markup=ui_post_control("track")
+        )
+        return
 
     await msg.answer("😴 У этого преподавателя сейчас нет пар.", reply_markup=ui_post_control("track"))
 
@@ -709,7 +1851,7 @@ async def cb_free_rooms(cb: CallbackQuery):
 
     now = datetime.now()
     curr_time = now.time()
-    curr_day = WEEK_DAYS.get(now.strftime('%a').lower(), "").lower()
+    curr_code = now.strftime('%a').lower()
 
     # 2. Указываем рабочие часы (с 8 утра до 9 вечера)
     work_start = datetime.strptime("08:00", "%H:%M").time()
@@ -723,26 +1865,8 @@ async def cb_free_rooms(cb: CallbackQuery):
     # Отправляем временное сообщение, чтобы пользователь видел прогресс
     status_msg = await cb.message.answer("🔍 _Сканирую все расписания, секунду..._", parse_mode="Markdown")
 
-    all_rooms = set()
-    occupied_rooms = set()
-
-    for hid in ACADEMIC_DATA:
-        # Используем run_in_executor, чтобы не фризить бота
-        df, _ = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-        for idx, row in df.iterrows():
-            if idx < 10: continue
-
-            # Улучшенный поиск комнат (теперь видит и 521а, и 105)
-            row_text = " ".join([str(v) for v in row.values])
-            rooms = re.findall(r'\b\d{2,4}[а-яА-Я]?\b', row_text)
-            all_rooms.update(rooms)
-
-            if curr_day in str(row[0]).lower():
-                start, end = parse_time_range(str(row[1]))
-                if start and end and start <= curr_time <= end:
-                    occupied_rooms.update(rooms)
-
-    free_rooms = sorted(list(all_rooms - occupied_rooms))
+    indexes = await hub_indexes(ACADEMIC_DATA)
+    free_rooms = find_free_rooms(indexes, curr_code, curr_time)
     await status_msg.delete() # Удаляем «загрузку»
 
     if not free_rooms:
@@ -751,6 +1875,27 @@ async def cb_free_rooms(cb: CallbackQuery):
         # Выводим первые 50 комнат
         text = "🟢 <b>Свободные кабинеты сейчас:</b>\n\n" + ", ".join(free_rooms[:50])
         await cb.message.answer(text, parse_mode="HTML",  reply_markup=ui_post_control("free"))
+@dp.message(Command("free"))
+async def free_rooms_range(msg: Message):
+    """/free 12:00 14:00 - кабинеты, свободные сегодня весь интервал; /free 14:00 - с текущего момента"""
+    now = datetime.now()
+    times = [dtime(int(h), int(m)) for h, m in TIME_PARTS_RX.findall(msg.text or "") if int(h) < 24 and int(m) < 60]
+    if len(times) == 1:
+        times.insert(0, now.time().replace(second=0, microsecond=0))
+    if len(times) < 2 or times[0] > times[1]:
+        await msg.answer("🕒 Укажите интервал: <code>/free 12:00 14:00</code>", parse_mode="HTML")
+        return
+
+    day_code = now.strftime('%a').lower()
+    indexes = await hub_indexes(ACADEMIC_DATA)
+    free_rooms = find_free_rooms(indexes, day_code, times[0], times[1])
+    period = f"с {times[0].strftime('%H:%M')} до {times[1].strftime('%H:%M')}"
+    if not free_rooms:
+        await msg.answer(f"😱 Кабинетов, свободных {period}, не найдено!", reply_markup=ui_post_control("free"))
+    else:
+        await msg.answer(f"🟢 <b>Свободны сегодня {period}:</b>\n\n" + ", ".join(free_rooms[:50]),
+                         parse_mode="HTML", reply_markup=ui_post_control("free"))
+
 @dp.message(FormStates.input_lecturer_name)
 
 async def proff_search_name(msg: Message, state: FSMContext):
@@ -781,112 +1926,29 @@ async def find_room_start(cb: CallbackQuery, state: FSMContext):
 async def process_room_search(message: Message, state: FSMContext):
     query = message.text.strip().lower()
     await state.clear()
+    await run_room_search(message, query)
 
-    wait_msg = await message.answer(f"🔍 Ищу занятия в аудитории <b>{query}</b>...", parse_mode="HTML")
+@dp.callback_query(F.data.startswith("room:"))
+async def room_suggestion_click(cb: CallbackQuery):
+    await cb.answer()
+    await run_room_search(cb.message, cb.data.split(":", 1)[1].lower())
 
-    found_schedule = {}
-    time_pattern = re.compile(r'\d{1,2}[:.]\d{2}')
+async def run_room_search(message: Message, query: str):
+    wait_msg = await message.answer(f"🔍 Ищу занятия в аудитории <b>{query}</b>...", parse_mode="HTML")
 
-    for hid in ACADEMIC_DATA:
-        df, layout = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-        if df is None: continue
-
-        for idx, row in df.iterrows():
-            if idx < 15: continue
-
-            # Быстрая проверка строки
-            row_str = " ".join([str(x) for x in row.values]).lower()
-            if query not in row_str: continue
-
-            # Проходим по колонкам
-            for col_idx in range(2, len(row)):
-                cell_raw = str(row[col_idx]).strip()
-
-                # Если нашли кабинет в ячейке
-                if query in cell_raw.lower():
-
-                    # 1. ОПРЕДЕЛЯЕМ ВЛАДЕЛЬЦА И ЯКОРНУЮ КОЛОНКУ (Anchor)
-                    owner_name = "Неизвестно"
-                    current_anchor_col = -1
-
-                    for fid, flow_data in layout.items():
-                        # Проверяем, входит ли эта колонка в этот поток
-                        # (либо как anchor, либо как одна из групп)
-                        if col_idx == flow_data["anchor_col"]:
-                            owner_name = f"{flow_data['title']} (Поток)"
-                            current_anchor_col = flow_data["anchor_col"]
-                            break
-
-                        found_grp = False
-                        for g_num, groups in flow_data["map"].items():
-                            if col_idx in groups.values():
-                                # Нашли группу
-                                for sub_label, sub_col in groups.items():
-                                    if sub_col == col_idx:
-                                        clean_label = re.sub(r'\s*\(\d+\)$', '', sub_label)
-                                        label_part = f" ({clean_label})" if clean_label and "общая" not in clean_label.lower() else ""
-                                        owner_name = f"Гр. {g_num}{label_part}"
-                                        break
-                                # Запоминаем якорь этого потока, чтобы искать там название предмета
-                                current_anchor_col = flow_data["anchor_col"]
-                                found_grp = True
-                                break
-                        if found_grp: break
-
-                    # 2. СОБИРАЕМ ТЕКСТ (Subject/Teacher)
-                    # Смотрим:
-                    # А) В текущей колонке (вверх на 2 строки)
-                    # Б) В ЯКОРНОЙ колонке (вверх на 2 строки) - потому что название лекции часто там!
-
-                    context_parts = []
-                    rows_to_check = [idx]
-                    if idx > 15: rows_to_check.insert(0, idx - 1)
-                    if idx > 16: rows_to_check.insert(0, idx - 2)
-
-                    # Колонки для сканирования: текущая + якорная (если она отличается)
-                    cols_to_scan = {col_idx}
-                    if current_anchor_col != -1:
-                        cols_to_scan.add(current_anchor_col)
-
-                    for r_i in rows_to_check:
-                        for c_i in cols_to_scan:
-                            val = str(df.iloc[r_i, c_i]).strip()
-                            if val and val.lower() != "nan":
-                                context_parts.append(val)
-
-                    full_context_text = "\n".join(context_parts)
-                    data = extract_full_data(full_context_text)
-
-                    if not data["s"] and not data["t"]:
-                        continue
-
-                    # 3. ИЩЕМ ВРЕМЯ
-                    time_s = ""
-                    day = ""
-                    for r_i in reversed(rows_to_check):
-                        t_candidate = str(df.iloc[r_i, 1]).replace('\n', ' ').strip()
-                        if time_pattern.search(t_candidate):
-                            time_s = t_candidate
-                            day = str(df.iloc[r_i, 0]).strip().upper()
-                            break
-
-                    if not time_s or not day: continue
-
-                    # 4. СОХРАНЯЕМ
-                    subj_teach = f"{data['s']} {data['t']}".strip()
-
-                    if day not in found_schedule: found_schedule[day] = {}
-                    if time_s not in found_schedule[day]: found_schedule[day][time_s] = []
-
-                    entry = f"{subj_teach} — <b>{owner_name}</b>"
-                    if entry not in found_schedule[day][time_s]:
-                        found_schedule[day][time_s].append(entry)
+    indexes = await hub_indexes(ACADEMIC_DATA)
+    found_schedule = await POOLS.run("query", "room_search", find_room_schedule, indexes, query)
 
     await wait_msg.delete()
 
     if not found_schedule:
-        await message.answer(f"🤷‍♂️ В ауд. <b>{query}</b> занятий не найдено.",
-                            reply_markup=ui_post_control("room"), parse_mode="HTML")
+        suggestions = await POOLS.run("query", "suggest", suggest_terms, indexes, query, "room")
+        if suggestions:
+            await message.answer(f"🤷‍♂️ В ауд. <b>{query}</b> занятий не найдено.\nПохожие аудитории:",
+                                 reply_markup=ui_suggestions(suggestions, "room:", "room"), parse_mode="HTML")
+        else:
+            await message.answer(f"🤷‍♂️ В ауд. <b>{query}</b> занятий не найдено.",
+                                reply_markup=ui_post_control("room"), parse_mode="HTML")
         return
 
     # ВЫВОД
@@ -912,48 +1974,254 @@ async def process_room_search(message: Message, state: FSMContext):
 @dp.callback_query(F.data == "near_event")
 async def cb_near_event(cb: CallbackQuery):
     now = datetime.now()
-    current_time = now.time()
-    current_day = WEEK_DAYS.get(now.strftime('%a').lower(), "").lower()
+    indexes = await hub_indexes(ACADEMIC_DATA)
+    report = find_near_events(indexes, now)
 
-    found = False
-    report = ["⚡️ <b>Сейчас или скоро по расписанию:</b>\n"]
-
-    for hid in ACADEMIC_DATA:
-        df, layout = await asyncio.get_event_loop().run_in_executor(None, sync_data, hid)
-        if df is None: continue
-
-        for idx, row in df.iterrows():
-            if idx < 10: continue
-            day_cell = str(row[0]).lower()
-            if current_day not in day_cell: continue
-
-            time_str = str(row[1])
-            start, end = parse_time_range(time_str)
-
-            if start and end:
-                # Если пара идет ПРЯМО СЕЙЧАС
-                if start <= current_time <= end:
-                    # Считаем разницу
-                    end_dt = datetime.combine(now.date(), end)
-                    remains = end_dt - now
-                    minutes_left = int(remains.total_seconds() // 60)
-
-                    for col_idx in range(2, len(row)):
-                        cell = scrub_content(row[col_idx])
-                        if validate_subject(cell):
-                            found = True
-                            report.append(f"<b>СЕЙЧАС:</b>\n🕒 <code>{time_str}</code> | {cell}")
-                            report.append(f"⏳ <i>До конца осталось: {minutes_left} мин.</i>\n")
-    if not found:
+    if not report:
         await cb.message.answer("🏖 Сейчас по расписанию пар нет.")
     else:
+        report.insert(0, "⚡️ <b>Сейчас или скоро по расписанию:</b>\n")
         await cb.message.answer("\n".join(report), parse_mode="HTML", reply_markup=ui_post_control())
 
+# --- УВЕДОМЛЕНИЯ ---
+@dp.message(Command("subscribe"))
+async def subscribe_cmd(msg: Message):
+    p = await STORE.aget_prefs(msg.from_user.id)
+    if not p:
+        await msg.answer("❌ Сначала выберите свою группу в меню.", reply_markup=ui_main_menu())
+        return
+    STORE.subscribe(msg.from_user.id, {'hid': p['hid'], 'fid': p['fid'], 'gnum': p['gnum']})
+    await msg.answer(f"🔔 Уведомления для <b>группы {p['gnum']}</b> включены: изменения в расписании "
+                     f"и напоминание за {REMINDER_LEAD} минут до пары.\nОтключить: /unsubscribe",
+                     parse_mode="HTML", reply_markup=ui_post_control())
+
+@dp.message(Command("unsubscribe"))
+async def unsubscribe_cmd(msg: Message):
+    STORE.unsubscribe(msg.from_user.id)
+    await msg.answer("🔕 Уведомления отключены. Включить снова: /subscribe", reply_markup=ui_post_control())
+
+async def group_subscribers():
+    """(hid, fid, группа) -> id подписчиков"""
+    groups = {}
+    for user_id, sub in (await STORE.aget_subscriptions()).items():
+        groups.setdefault((sub['hid'], sub['fid'], str(sub['gnum'])), []).append(user_id)
+    return groups
+
+def days_from(today_code, days):
+    """Коды дней по порядку, начиная с сегодняшнего"""
+    codes = list(WEEK_DAYS)
+    start = codes.index(today_code) if today_code in codes else 0
+    return sorted(days, key=lambda d: (codes.index(d) - start) % len(codes))
+
+async def notify_schedule_changes(hub_id, changes):
+    """Слушатель CHANGE_LISTENERS: присылает подписчикам новое расписание групп, у которых оно изменилось"""
+    if NOTIFIER is None or not changes["groups"]: return
+    hub = LOCAL_STORAGE.get(hub_id)
+    subscribers = await group_subscribers()
+    now = datetime.now()
+    today = now.strftime('%a').lower()
+    for (fid, g_num), days in changes["groups"].items():
+        users = subscribers.get((hub_id, fid, str(g_num)))
+        if not users: continue
+        # Ту же новую версию таблицы находит каждый процесс бота - рассылает первый
+        version = hub["hash"] if hub else None
+        if not await STORE.claim_notification(now.date(), f"changes|{hub_id}|{version}|{fid}|{g_num}"): continue
+        parts = ["🔔 <b>Расписание изменилось!</b>\n"]
+        for day in days_from(today, days):
+            parts.append(schedule_text(hub_id, hub, day, fid, g_num)
+                         or f"📅 <b>{SEARCH_DAYS_LOW[day].upper()}</b>: занятий нет.")
+        text = "\n\n".join(parts)[:4000]
+        for user_id in users:
+            # Несколько изменений подряд до отправки - пользователь получит последнее
+            NOTIFIER.enqueue(user_id, text, key=("changes", hub_id, fid, g_num), parse_mode="HTML")
+
+def upcoming_lessons(index, fid, g_num, day_code, now_time, lead_minutes):
+    """Занятия группы, которые начнутся в ближайшие lead_minutes: начало -> занятия"""
+    now_s = _seconds(now_time)
+    slots = {}
+    for lesson in index["by_group"].get((fid, int(g_num)), []):
+        if lesson["day"] != day_code or lesson["start"] is None: continue
+        if 0 < _seconds(lesson["start"]) - now_s <= lead_minutes * 60:
+            slots.setdefault(lesson["start"], []).append(lesson)
+    return slots
+
+async def send_reminders(now=None):
+    """Ставит в очередь напоминания о парах подписчиков. Возвращает число сообщений"""
+    now = now or datetime.now()
+    day_code = now.strftime('%a').lower()
+    if REMINDED["date"] != now.date():
+        REMINDED.update(date=now.date(), sent=set())
+        await STORE.expire_notifications(now.date())
+
+    queued = 0
+    for (hid, fid, g_num), users in (await group_subscribers()).items():
+        # Через get_hub_data: заодно раз в CACHE_TTL проверяются изменения таблицы
+        hub = await get_hub_data(hid)
+        if not hub: continue
+        for start, lessons in upcoming_lessons(hub["index"], fid, g_num, day_code, now.time(), REMINDER_LEAD).items():
+            mark = (hid, fid, g_num, start)
+            if mark in REMINDED["sent"]: continue
+            REMINDED["sent"].add(mark)
+            # Напоминание мог уже отправить другой процесс бота
+            if not await STORE.claim_notification(now.date(), f"remind|{hid}|{fid}|{g_num}|{start:%H:%M}"): continue
+
+            minutes = int((datetime.combine(now.date(), start) - now).total_seconds() // 60)
+            lines = [f"⏰ <b>Через {minutes} мин.</b> <code>{lessons[0]['time']}</code>"]
+            for lesson in lessons:
+                room = f" [📍 <b>{lesson['r']}</b>]" if lesson["r"] else ""
+                label = f" ({lesson['sub']})" if lesson["sub"] and "общая" not in lesson["sub"].lower() else ""
+                lines.append(f"{lesson['s']} {lesson['t']}{label}{room}".strip())
+            text = "\n".join(lines)
+            for user_id in users:
+                NOTIFIER.enqueue(user_id, text, parse_mode="HTML")
+                queued += 1
+    return queued
+
+async def reminder_loop():
+    while True:
+        try:
+            await send_reminders()
+        except Exception as e:
+            logging.error(f"Reminder error: {e}")
+        await asyncio.sleep(REMINDER_TICK)
+
+def start_notifications(client):
+    """Запускает рассылку поверх client (Bot) и цикл напоминаний; возвращает задачу цикла"""
+    global NOTIFIER
+    NOTIFIER = Notifier(client, rate=NOTIFY_RATE, on_blocked=STORE.unsubscribe)
+    NOTIFIER.start()
+    if notify_schedule_changes not in CHANGE_LISTENERS:
+        CHANGE_LISTENERS.append(notify_schedule_changes)
+    return asyncio.ensure_future(reminder_loop())
+
+async def stop_notifications(reminders):
+    reminders.cancel()
+    if NOTIFIER is not None:
+        await NOTIFIER.stop()
+
+# --- СТАТИСТИКА ---
+def runtime_gauges():
+    """Текущие значения для выгрузки метрик: очереди пулов, загруженные хабы, очередь рассылки"""
+    for stage, stats in POOLS.stats().items():
+        labels = {"pool": stats["pool"], "stage": stage}
+        yield "pool_queued_tasks", labels, stats["queued"]
+        yield "pool_running_tasks", labels, stats["running"]
+    yield "hubs_loaded", {}, len(LOCAL_STORAGE)
+    if NOTIFIER is not None:
+        yield "notifications_queued", {}, len(NOTIFIER)
+
+METRICS.add_gauges(runtime_gauges)
+METRICS.describe("handler_seconds", "Handler latency by aiogram handler")
+METRICS.describe("hub_cache_total", "LOCAL_STORAGE lookups: hit, stale (refreshed in background), miss")
+METRICS.describe("render_cache_total", "RENDER_CACHE lookups")
+METRICS.describe("sheet_sync_total", "Sheet checks by outcome")
+METRICS.describe("sheet_download_bytes", "Downloaded sheet size")
+METRICS.describe("sheet_parse_seconds", "Sheet parsing time by stage: read, layout, index")
+METRICS.describe("query_seconds", "Search query time over hub indexes")
+
+def _ratio(part, total):
+    return f"{part / total:.0%}" if total else "-"
+
+def format_stats():
+    """Сводка метрик для /stats (HTML)"""
+    lines = ["📊 <b>Статистика бота</b>", "", "<b>Хендлеры</b> (вызовов, p50 / p95 мс, ошибок):"]
+    errors = {labels["handler"]: n for labels, n in METRICS.series("handler_errors_total")}
+    handlers = sorted(METRICS.series("handler_seconds", "histograms"), key=lambda item: -item[1].count)
+    for labels, hist in handlers[:15]:
+        name = labels["handler"]
+        lines.append(f"<code>{name[:24]:<24} {hist.count:>6} {hist.quantile(0.5) * 1000:>7.1f} / "
+                     f"{hist.quantile(0.95) * 1000:>7.1f} {errors.get(name, 0):>3}</code>")
+    if not handlers:
+        lines.append("<i>запросов еще не было</i>")
+
+    hub = {labels["result"]: n for labels, n in METRICS.series("hub_cache_total")}
+    render = {labels["result"]: n for labels, n in METRICS.series("render_cache_total")}
+    lines.append("")
+    lines.append(f"<b>Кэш хабов:</b> попаданий {hub.get('hit', 0)}, устаревших {hub.get('stale', 0)}, "
+                 f"промахов {hub.get('miss', 0)} ({_ratio(hub.get('hit', 0), sum(hub.values()))} попаданий)")
+    lines.append(f"<b>Кэш текстов:</b> попаданий {render.get('hit', 0)}, промахов {render.get('miss', 0)} "
+                 f"({_ratio(render.get('hit', 0), sum(render.values()))})")
+
+    syncs = {labels["result"]: n for labels, n in METRICS.series("sheet_sync_total")}
+    if syncs:
+        lines.append("<b>Проверки таблиц:</b> " + ", ".join(f"{result} {n}" for result, n in sorted(syncs.items())))
+    for labels, hist in METRICS.series("sheet_download_bytes", "histograms"):
+        lines.append(f"<b>Загрузки:</b> {hist.count}, в среднем {hist.sum / hist.count / 1024:.0f} КиБ")
+    parse = sorted(METRICS.series("sheet_parse_seconds", "histograms"), key=lambda item: item[0]["stage"])
+    if parse:
+        lines.append("<b>Разбор, p50 мс:</b> " + ", ".join(
+            f"{labels['stage']} {hist.quantile(0.5) * 1000:.0f}" for labels, hist in parse))
+
+    pools = POOLS.stats()
+    if pools:
+        lines.append("")
+        lines.append("<b>Пулы</b> (очередь / макс., выполнено, мс в очереди / выполнения):")
+        for stage, stats in sorted(pools.items()):
+            lines.append(f"<code>{stage[:14]:<14} {stats['pool']:<5} {stats['queued']:>3} / {stats['max_queued']:<3}"
+                         f" {stats['done']:>6} {stats['wait_avg_ms']:>7.1f} / {stats['avg_ms']:>7.1f}</code>")
+    return "\n".join(lines)[:4000]
+
+@dp.message(Command("stats"))
+async def stats_cmd(msg: Message):
+    if msg.from_user.id not in ADMIN_IDS: return
+    await msg.answer(format_stats(), parse_mode="HTML")
+
+async def metrics_loop():
+    """Раз в METRICS_DUMP_INTERVAL секунд выгружает метрики в METRICS_FILE"""
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            # render - на event loop (он читает очереди пулов), запись файла - в пуле io
+            await POOLS.run("io", "metrics_dump", METRICS.dump, METRICS_FILE, METRICS.render())
+        except Exception as e:
+            logging.error(f"Metrics dump error: {e}")
+
 # --- ЗАПУСК ---
+def build_webhook_app(bot):
+    """Приложение aiohttp, передающее обновления из WEBHOOK_PATH в dp"""
+    app = web.Application()
+    SimpleRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET or None).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(bot):
+    """
+    Принимает обновления по webhook до остановки процесса. Адрес регистрируется
+    каждым процессом: повторный set_webhook с тем же адресом ничего не меняет,
+    а очередь обновлений Telegram при этом не сбрасывается.
+    """
+    runner = web.AppRunner(build_webhook_app(bot), access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=True).start()
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None,
+                              allowed_updates=dp.resolve_used_update_types())
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 async def main():
+    bot = Bot(token=BOT_TOKEN)
+    init_pools()
+    init_storage(STORAGE_URL)
+    dp.fsm.storage = KVStorage(STORE)
+    await prefetch_hubs()
+    reminders = start_notifications(bot)
+    metrics_task = asyncio.ensure_future(metrics_loop())
     print("🚀 Бот запущен и готов к работе!")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(bot)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        metrics_task.cancel()
+        await stop_notifications(reminders)
+        await close_http_session()
+        STORE.close()
+        METRICS.dump(METRICS_FILE)
+        POOLS.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
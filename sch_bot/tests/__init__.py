@@ -0,0 +1,5 @@
+"""
+Пакет с тестами для бота расписания.
+
+Тесты запускаются из папки sch_bot: python -m pytest tests
+"""
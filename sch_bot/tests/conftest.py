@@ -0,0 +1,50 @@
+# tests/conftest.py
+import json
+from pathlib import Path
+
+import pytest
+import scheduler_bot
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+@pytest.fixture(scope="session")
+def sheet_bytes() -> bytes:
+    """xlsx-файл расписания: 2 потока по 2 группы, подгруппы КТС и МСС."""
+    return (FIXTURES / "schedule.xlsx").read_bytes()
+
+@pytest.fixture(scope="session")
+def golden() -> dict:
+    """Эталонный разбор ячеек и структура потоков для schedule.xlsx."""
+    return json.loads((FIXTURES / "schedule_golden.json").read_text(encoding="utf-8"))
+
+@pytest.fixture(scope="session")
+def parsed_sheet(sheet_bytes):
+    """(df, layout, index) для тестового расписания."""
+    return scheduler_bot.index_sheet(sheet_bytes, "test_hub")
+
+@pytest.fixture
+def hub(parsed_sheet):
+    """Загруженный хаб из тестового расписания - запись LOCAL_STORAGE, которая не устаревает."""
+    df, layout, index = parsed_sheet
+    return {"df": df, "layout": layout, "index": index, "hash": "v1", "etag": None, "checked_at": float("inf")}
+
+@pytest.fixture
+def isolated_bot(sheet_bytes, monkeypatch):
+    """
+    Бот без сети и диска: один хаб "h" и пустые кэши. Загрузка таблицы
+    отдает sheet["content"] и sheet["etag"], запросы копятся в sheet["calls"].
+    """
+    sheet = {"content": sheet_bytes, "etag": None, "calls": []}
+
+    async def fake_download(conf, etag=None):
+        sheet["calls"].append(etag)
+        return sheet["content"], sheet["etag"]
+
+    monkeypatch.setattr(scheduler_bot, "download_sheet", fake_download)
+    monkeypatch.setattr(scheduler_bot, "save_disk_cache", lambda conf, entry: None)
+    monkeypatch.setattr(scheduler_bot, "ACADEMIC_DATA", {"h": {"label": "Тест", "sheet_id": "s", "gid": "0"}})
+    monkeypatch.setattr(scheduler_bot, "LOCAL_STORAGE", {})
+    monkeypatch.setattr(scheduler_bot, "REFRESH_TASKS", {})
+    monkeypatch.setattr(scheduler_bot, "RENDER_CACHE", {})
+    monkeypatch.setattr(scheduler_bot, "RENDER_TASKS", {})
+    return sheet
@@ -0,0 +1,21 @@
+# tests/test_bench.py
+import asyncio
+
+import scheduler_bot
+from bench_scheduler import STAGES, format_report, make_sheet, run_benchmark
+
+def test_synthetic_sheet_layout():
+    df, layout = scheduler_bot.parse_sheet(make_sheet(seed=1, flows=2, groups=3))
+    assert len(layout) == 2
+    assert all(sorted(flow["map"]) == [1, 2, 3] for flow in layout.values())
+    assert all(list(subs) == ["КТС", "МСС"] for flow in layout.values() for subs in flow["map"].values())
+
+def test_benchmark_smoke():
+    before = dict(scheduler_bot.ACADEMIC_DATA)
+    report = asyncio.run(run_benchmark(hubs=2, flows=1, groups=2, repeat=3))
+    assert set(report["stages"]) == set(STAGES)
+    assert all(s["count"] == 2 for s in report["stages"].values())
+    assert report["handlers"] and all(h["count"] == 3 and h["p95_ms"] >= h["p50_ms"] for h in report["handlers"].values())
+    assert "run_proff_search" in format_report(report)
+    # Бенчмарк не оставляет своих хабов в глобальном состоянии бота
+    assert scheduler_bot.ACADEMIC_DATA == before
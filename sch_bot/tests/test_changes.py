@@ -0,0 +1,138 @@
+# tests/test_changes.py
+import asyncio
+import io
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+import scheduler_bot
+from scheduler_bot import carry_render_cache, diff_rows, index_sheet, read_sheet, update_basis, update_sheet
+
+def to_xlsx(df):
+    buf = io.BytesIO()
+    df.replace("", np.nan).to_excel(buf, header=False, index=False)
+    return buf.getvalue()
+
+def snapshot(index):
+    """То, что видят обработчики: ячейки и занятия"""
+    cells = {pos: (c["raw"], c["low"], c["clean"], c["data"]) for pos, c in index["cells"].items()}
+    return cells, index["lessons"], sorted(index["by_token"].items())
+
+@pytest.fixture
+def previous(sheet_bytes):
+    df, layout, index = index_sheet(sheet_bytes, "h")
+    return {"df": df, "layout": layout, "index": index, "hash": "v1"}
+
+@pytest.fixture
+def group_lesson(previous):
+    """Занятие подгруппы (не лекция потока) и его ключ (fid, группа)"""
+    for (fid, g_num), lessons in previous["index"]["by_group"].items():
+        for lesson in lessons:
+            if lesson["group"] is not None:
+                return (fid, g_num), lesson
+
+def test_diff_rows_follows_shifted_rows():
+    same, changed = diff_rows([b"a", b"b", b"c"], [b"a", b"x", b"b", b"c"])
+    assert same == {0: 0, 2: 1, 3: 2} and changed == [1]
+    # Одинаковые строки сопоставляются по порядку
+    assert diff_rows([b"e", b"e"], [b"e", b"e", b"e"]) == ({0: 0, 1: 1}, [2])
+
+def test_update_basis_is_compact(previous):
+    """В пул процессов уходят хеши и кэш разбора, а не DataFrame и индекс целиком."""
+    basis = update_basis(previous)
+    assert "df" not in basis and "index" not in basis
+    assert len(pickle.dumps(basis)) * 3 < len(pickle.dumps(previous))
+
+def test_unchanged_sheet(sheet_bytes, previous):
+    df, layout, index, changes = update_sheet(sheet_bytes, "h", update_basis(previous))
+    assert changes == {"layout": False, "rows": [], "groups": {}}
+    assert layout is previous["layout"]
+    assert snapshot(index) == snapshot(previous["index"])
+
+def test_changed_cell(sheet_bytes, previous, group_lesson):
+    key, lesson = group_lesson
+    df = read_sheet(sheet_bytes)
+    df.iat[lesson["row"], lesson["col"]] = "Новый предмет\nдоц. Новиков Н.Н.\n777"
+    content = to_xlsx(df)
+
+    _, layout, index, changes = update_sheet(content, "h", update_basis(previous))
+    _, full_layout, full_index = index_sheet(content, "h")
+    assert layout == full_layout and snapshot(index) == snapshot(full_index)
+    assert changes["layout"] is False
+    assert changes["rows"] == [lesson["row"]]
+    assert changes["groups"] == {key: {lesson["day"]}}
+
+def test_inserted_row_keeps_lessons(sheet_bytes, previous):
+    df = read_sheet(sheet_bytes)
+    blank = pd.DataFrame([[""] * len(df.columns)], dtype=object)
+    last = max(previous["index"]["rows"])
+    # Пустая строка в конце таблицы сдвигает только хвост
+    content = to_xlsx(pd.concat([df.iloc[:last], blank, df.iloc[last:]], ignore_index=True))
+
+    _, _, index, changes = update_sheet(content, "h", update_basis(previous))
+    _, _, full_index = index_sheet(content, "h")
+    assert snapshot(index) == snapshot(full_index)
+    assert changes["rows"] == [last]
+
+def test_row_shifted_into_data_is_parsed(sheet_bytes):
+    """Строка над DATA_START_ROW, сдвинутая вставкой в область данных, разбирается заново."""
+    df = read_sheet(sheet_bytes)
+    row = scheduler_bot.DATA_START_ROW - 1
+    for c in range(5, 10):
+        df.iat[row, c] = f"Примечание {c}"
+    df, layout, index = index_sheet(to_xlsx(df), "h")
+    previous = {"df": df, "layout": layout, "index": index}
+
+    blank = pd.DataFrame([[""] * len(df.columns)], dtype=object)
+    content = to_xlsx(pd.concat([blank, df], ignore_index=True))
+    _, _, index, changes = update_sheet(content, "h", update_basis(previous))
+    _, _, full_index = index_sheet(content, "h")
+    assert [index["cells"][(row + 1, c)]["raw"] for c in range(5, 10)] == [f"Примечание {c}" for c in range(5, 10)]
+    assert snapshot(index) == snapshot(full_index)
+    assert row + 1 in changes["rows"]
+
+def test_header_change_rebuilds_layout(sheet_bytes, previous):
+    df = read_sheet(sheet_bytes)
+    fid, flow = next(iter(previous["layout"].items()))
+    group_row = scheduler_bot.find_group_row(df)
+    df.iat[group_row - 1, flow["anchor_col"]] = "Новая кафедра"
+    content = to_xlsx(df)
+
+    _, layout, _, changes = update_sheet(content, "h", update_basis(previous))
+    assert changes["layout"] is True
+    assert layout == index_sheet(content, "h")[1]
+
+def test_carry_render_cache(previous, group_lesson, monkeypatch):
+    (fid, g_num), _ = group_lesson
+    monkeypatch.setattr(scheduler_bot, "RENDER_CACHE", {"h": {"version": "v1", "texts": {
+        (fid, str(g_num), "mon"): "старый", (fid, "99", "mon"): "другая группа", (fid, "99", "all"): "неделя",
+    }}})
+    changes = {"layout": False, "rows": [20], "groups": {(fid, g_num): {"mon"}}}
+    assert carry_render_cache("h", previous, {"hash": "v2"}, changes) == 1
+    assert scheduler_bot.RENDER_CACHE["h"] == {"version": "v2", "texts": {(fid, "99", "mon"): "другая группа"}}
+
+    # Новая структура потоков - переносить нечего
+    assert carry_render_cache("h", {"hash": "v2"}, {"hash": "v3"}, dict(changes, layout=True)) == 0
+
+def test_sync_publishes_changes(sheet_bytes, previous, group_lesson, isolated_bot, monkeypatch):
+    key, lesson = group_lesson
+    df = read_sheet(sheet_bytes)
+    df.iat[lesson["row"], lesson["col"]] = "Новый предмет"
+    isolated_bot["content"] = to_xlsx(df)
+
+    published = []
+    async def listener(hub_id, changes):
+        published.append((hub_id, changes))
+
+    scheduler_bot.LOCAL_STORAGE["h"] = dict(previous, etag=None, checked_at=0)
+    monkeypatch.setattr(scheduler_bot, "CHANGE_LISTENERS", [listener])
+
+    async def scenario():
+        await scheduler_bot.sync_data("h", force=True)
+        await asyncio.gather(*scheduler_bot.RENDER_TASKS.values())
+
+    asyncio.run(scenario())
+    assert [hub_id for hub_id, _ in published] == ["h"]
+    assert published[0][1]["groups"] == {key: {lesson["day"]}}
+    assert scheduler_bot.RENDER_CACHE["h"]["warm"]
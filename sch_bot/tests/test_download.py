@@ -0,0 +1,110 @@
+# tests/test_download.py
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import scheduler_bot
+from scheduler_bot import SheetNotModified, close_http_session, download_sheet
+
+CONF = {"label": "h", "sheet_id": "s", "gid": "0"}
+
+async def serve(handler):
+    """Сервер-заглушка экспорта таблиц: GET /{sheet_id}/{gid} -> handler(request)"""
+    app = web.Application()
+    app.router.add_get("/{sheet_id}/{gid}", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    scheduler_bot.SHEETS_EXPORT_URL = f"http://127.0.0.1:{runner.addresses[0][1]}/{{sheet_id}}/{{gid}}"
+    return runner
+
+def scripted(*statuses):
+    """Обработчик, отвечающий по очереди статусами statuses (дальше - 200); запросы копятся в requests"""
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get("If-None-Match"))
+        status = statuses[len(requests) - 1] if len(requests) <= len(statuses) else 200
+        if status == 200:
+            return web.Response(body=b"sheet", headers={"ETag": '"v2"'})
+        return web.Response(status=status)
+
+    return handler, requests
+
+def fetch(handler, etag=None):
+    async def scenario():
+        runner = await serve(handler)
+        try:
+            return await download_sheet(CONF, etag)
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+    return asyncio.run(scenario())
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(scheduler_bot, "SHEETS_EXPORT_URL", scheduler_bot.SHEETS_EXPORT_URL)
+    monkeypatch.setattr(scheduler_bot, "HTTP_CLIENT", {"session": None, "semaphore": None})
+    monkeypatch.setattr(scheduler_bot, "FETCH_BACKOFF", 0)
+
+def test_download_returns_content_and_etag():
+    handler, requests = scripted()
+    assert fetch(handler) == (b"sheet", '"v2"')
+    assert requests == [None]
+
+def test_not_modified_with_etag():
+    handler, requests = scripted(304)
+    with pytest.raises(SheetNotModified):
+        fetch(handler, etag='"v1"')
+    assert requests == ['"v1"']
+
+def test_retries_on_429_and_5xx():
+    handler, requests = scripted(429, 503)
+    assert fetch(handler) == (b"sheet", '"v2"')
+    assert len(requests) == 3
+
+def test_gives_up_after_fetch_retries():
+    handler, requests = scripted(*[500] * scheduler_bot.FETCH_RETRIES)
+    with pytest.raises(ConnectionError, match="HTTP 500"):
+        fetch(handler)
+    assert len(requests) == scheduler_bot.FETCH_RETRIES
+
+def test_client_errors_are_not_retried():
+    handler, requests = scripted(404)
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch(handler)
+    assert len(requests) == 1
+
+def test_cold_hubs_download_concurrently(sheet_bytes, isolated_bot, monkeypatch):
+    """hub_indexes загружает холодные хабы параллельно, не больше HTTP_CONCURRENCY за раз."""
+    active, peak = 0, 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return web.Response(body=sheet_bytes)
+
+    hubs = {f"h{i}": dict(CONF, gid=str(i)) for i in range(3)}
+    monkeypatch.setattr(scheduler_bot, "HTTP_CONCURRENCY", 2)
+    monkeypatch.setattr(scheduler_bot, "ACADEMIC_DATA", hubs)
+    # Настоящая загрузка - с сервера-заглушки, а не заглушка isolated_bot
+    monkeypatch.setattr(scheduler_bot, "download_sheet", download_sheet)
+
+    async def scenario():
+        runner = await serve(handler)
+        try:
+            indexes = await scheduler_bot.hub_indexes(hubs)
+            await asyncio.gather(*scheduler_bot.RENDER_TASKS.values())
+            return indexes
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    indexes = asyncio.run(scenario())
+    assert [index["lessons"][0]["hub"] for index in indexes] == list(hubs)
+    assert peak == 2
@@ -0,0 +1,86 @@
+# tests/test_hub_cache.py
+import asyncio
+import os
+
+import pytest
+import scheduler_bot
+# Настоящая запись на диск: isolated_bot подменяет scheduler_bot.save_disk_cache
+from scheduler_bot import disk_cache_path, load_disk_cache, save_disk_cache
+
+@pytest.fixture
+def downloads(isolated_bot, monkeypatch):
+    """Загрузки таблицы через заглушку isolated_bot, каждая ждет release"""
+    isolated_bot.update(etag='"v2"', release=None)
+    stub = scheduler_bot.download_sheet
+
+    async def held_download(conf, etag=None):
+        await isolated_bot["release"].wait()
+        return await stub(conf, etag)
+
+    monkeypatch.setattr(scheduler_bot, "download_sheet", held_download)
+    return isolated_bot
+
+def test_cold_hub_is_downloaded_once(downloads):
+    async def scenario():
+        downloads["release"] = asyncio.Event()
+        requests = [asyncio.ensure_future(scheduler_bot.get_hub_data("h")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        downloads["release"].set()
+        hubs = await asyncio.gather(*requests)
+        await asyncio.gather(*scheduler_bot.RENDER_TASKS.values())
+        return hubs
+
+    hubs = asyncio.run(scenario())
+    assert downloads["calls"] == [None]
+    assert all(hub is hubs[0] for hub in hubs) and hubs[0]["etag"] == '"v2"'
+
+def test_stale_hub_served_while_refreshing(downloads, hub):
+    stale = dict(hub, etag='"v1"', checked_at=-scheduler_bot.CACHE_TTL)
+    scheduler_bot.LOCAL_STORAGE["h"] = stale
+
+    async def scenario():
+        downloads["release"] = asyncio.Event()
+        first = await scheduler_bot.get_hub_data("h")
+        await asyncio.sleep(0.01)
+        # Обновление идет, а запросы получают старые данные и не запускают новую загрузку
+        second = await scheduler_bot.get_hub_data("h")
+        running = not scheduler_bot.REFRESH_TASKS["h"].done()
+        downloads["release"].set()
+        await scheduler_bot.REFRESH_TASKS["h"]
+        await asyncio.gather(*scheduler_bot.RENDER_TASKS.values())
+        return first, second, running
+
+    first, second, running = asyncio.run(scenario())
+    assert first is stale and second is stale and running
+    assert downloads["calls"] == ['"v1"']
+    fresh = scheduler_bot.LOCAL_STORAGE["h"]
+    assert fresh is not stale and fresh["etag"] == '"v2"' and fresh["hash"] != "v1"
+
+@pytest.fixture
+def cache_dir(tmp_path, hub, isolated_bot, monkeypatch):
+    monkeypatch.setattr(scheduler_bot, "CACHE_DIR", str(tmp_path))
+    return dict(hub, etag='"e1"')
+
+def test_disk_cache_roundtrip(cache_dir):
+    save_disk_cache(scheduler_bot.ACADEMIC_DATA["h"], cache_dir)
+    assert load_disk_cache() == 1
+
+    loaded = scheduler_bot.LOCAL_STORAGE["h"]
+    assert (loaded["hash"], loaded["etag"]) == ("v1", '"e1"')
+    assert loaded["layout"] == cache_dir["layout"] and loaded["index"]["lessons"] == cache_dir["index"]["lessons"]
+    assert loaded["df"].equals(cache_dir["df"])
+    # Запись с диска сразу считается устаревшей и будет проверена в фоне
+    assert scheduler_bot.time.monotonic() - loaded["checked_at"] >= scheduler_bot.CACHE_TTL
+
+def test_disk_cache_rejects_other_format_or_sheet(cache_dir, monkeypatch):
+    conf = scheduler_bot.ACADEMIC_DATA["h"]
+    save_disk_cache(conf, cache_dir)
+    with monkeypatch.context() as m:
+        m.setattr(scheduler_bot, "CACHE_FORMAT", scheduler_bot.CACHE_FORMAT + 1)
+        assert load_disk_cache() == 0
+
+    # Под именем файла этой таблицы лежит разбор другого листа
+    other = dict(conf, gid="5")
+    save_disk_cache(other, cache_dir)
+    os.replace(disk_cache_path(other), disk_cache_path(conf))
+    assert load_disk_cache() == 0 and scheduler_bot.LOCAL_STORAGE == {}
@@ -0,0 +1,220 @@
+# tests/test_kv_store.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from kv_store import BotStore, KVStorage, MemoryKV, SQLiteKV, open_kv
+
+@pytest.fixture(params=["memory", "sqlite"])
+def kv(request, tmp_path):
+    """Оба бэкенда: тесты проверяют, что они ведут себя одинаково."""
+    backend = MemoryKV() if request.param == "memory" else SQLiteKV(str(tmp_path / "state.db"))
+    yield backend
+    backend.close()
+
+def test_hash_commands(kv):
+    assert kv.hset("h", "a", "1") == 1
+    assert kv.hset("h", mapping={"a": "2", "b": 3}) == 1
+    assert kv.hget("h", "a") == "2"
+    assert kv.hgetall("h") == {"a": "2", "b": "3"}
+    assert kv.hdel("h", "a", "нет") == 1
+    assert kv.hgetall("h") == {"b": "3"}
+    assert kv.hget("пусто", "a") is None and kv.hgetall("пусто") == {}
+
+def test_hsetnx(kv):
+    assert kv.hsetnx("h", "a", "1") == 1
+    assert kv.hsetnx("h", "a", "2") == 0
+    assert kv.hget("h", "a") == "1"
+
+def test_pipeline(kv):
+    pipe = kv.pipeline()
+    pipe.hset("h", "a", "1").hset("h", "b", "2").hdel("h", "a")
+    assert kv.hgetall("h") == {}
+    assert pipe.execute() == [1, 1, 1]
+    assert kv.hgetall("h") == {"b": "2"}
+
+def test_open_kv(tmp_path):
+    assert isinstance(open_kv("memory://"), MemoryKV)
+    sqlite_kv = open_kv(f"sqlite:///{tmp_path / 'a.db'}")
+    assert isinstance(sqlite_kv, SQLiteKV)
+    sqlite_kv.close()
+    with pytest.raises(ValueError):
+        open_kv("ftp://host")
+
+def test_sqlite_file_shared_between_processes(tmp_path):
+    """Два соединения с одним файлом видят записи друг друга."""
+    path = str(tmp_path / "state.db")
+    first, second = BotStore(SQLiteKV(path)), BotStore(SQLiteKV(path))
+    first.set_prefs(42, {"hid": "edu_1", "col": "7"})
+    second.add_hub("edu_x", {"label": "Курс", "sheet_id": "s", "gid": "0"})
+    assert second.get_prefs(42) == {"hid": "edu_1", "col": "7"}
+    assert first.get_hubs() == {"edu_x": {"label": "Курс", "sheet_id": "s", "gid": "0"}}
+    first.close()
+    second.close()
+
+def test_writes_are_batched(tmp_path):
+    """В event loop записи копятся, повторы одного поля схлопываются, сброс - одним pipeline."""
+    calls = []
+
+    class CountingKV(MemoryKV):
+        def execute_batch(self, commands):
+            calls.append(commands)
+            return super().execute_batch(commands)
+
+    kv = CountingKV()
+    store = BotStore(kv, flush_interval=0.01)
+
+    async def scenario():
+        for col in range(100):
+            store.set_prefs(1, {"col": col})
+        store.set_prefs(2, {"col": 0})
+        # Свои записи видны сразу, в хранилище их еще нет
+        assert store.get_prefs(1) == {"col": 99}
+        assert kv.hgetall(BotStore.PREFS) == {}
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert len(calls) == 1 and len(calls[0]) == 2
+    assert BotStore(kv).get_prefs(1) == {"col": 99}
+
+def test_flushes_are_serialised():
+    """Следующий сброс ждет предыдущий: старая пачка не перезаписывает новую."""
+    release = threading.Event()
+    order = []
+
+    class SlowKV(MemoryKV):
+        def execute_batch(self, commands):
+            if not order: release.wait(1)
+            order.append(commands)
+            return super().execute_batch(commands)
+
+    kv = SlowKV()
+    executor = ThreadPoolExecutor(2)
+    store = BotStore(kv, flush_interval=10, executor=executor)
+
+    async def scenario():
+        store.set_prefs(1, {"col": "old"})
+        store.set_prefs(2, {"col": "x"})
+        first = asyncio.ensure_future(store.flush())
+        await asyncio.sleep(0.01)
+        store.set_prefs(1, {"col": "new"})
+        second = asyncio.ensure_future(store.flush())
+        await asyncio.sleep(0.05)
+        # Обе пачки еще не записаны, но видны при чтении
+        assert len(order) == 0
+        assert store.get_prefs(1) == {"col": "new"} and store.get_prefs(2) == {"col": "x"}
+        assert set(store.hgetall(BotStore.PREFS)) == {"1", "2"}
+        release.set()
+        await asyncio.gather(first, second)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert len(order) == 2
+    assert BotStore(kv).get_prefs(1) == {"col": "new"}
+
+def test_fsm_storage_roundtrip(kv):
+    key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+    other = StorageKey(bot_id=1, chat_id=11, user_id=11)
+
+    async def scenario():
+        storage = KVStorage(BotStore(kv))
+        await storage.set_state(key, "FormStates:input_hub_title")
+        await storage.set_data(key, {"title": "Матфак 1 курс"})
+        await storage.close()
+        # Новое хранилище поверх тех же данных - как после перезапуска бота
+        restored = KVStorage(BotStore(kv))
+        assert await restored.get_state(key) == "FormStates:input_hub_title"
+        assert await restored.get_data(key) == {"title": "Матфак 1 курс"}
+        assert await restored.get_state(other) is None and await restored.get_data(other) == {}
+        await restored.set_state(key, None)
+        await restored.set_data(key, {})
+        await restored.close()
+        assert await restored.get_state(key) is None and await restored.get_data(key) == {}
+
+    asyncio.run(scenario())
+    assert kv.hgetall(BotStore.FSM_STATE) == {} and kv.hgetall(BotStore.FSM_DATA) == {}
+
+def test_fsm_state_written_through(tmp_path):
+    """Состояние FSM сразу видно другому процессу бота, буфер его не задерживает."""
+    path = str(tmp_path / "state.db")
+    key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+    async def scenario():
+        store_a, store_b = BotStore(SQLiteKV(path), flush_interval=10), BotStore(SQLiteKV(path), flush_interval=10)
+        fsm_a, fsm_b = KVStorage(store_a), KVStorage(store_b)
+        # Старое значение того же поля ждет в буфере и не должно перезаписать новое
+        store_a.hset(BotStore.FSM_STATE, fsm_a.key_builder.build(key), "old")
+        await fsm_a.set_state(key, "FormStates:input_room_number")
+        await fsm_a.set_data(key, {"room": "521"})
+        assert await fsm_b.get_state(key) == "FormStates:input_room_number"
+        assert await fsm_b.get_data(key) == {"room": "521"}
+        await store_a.flush()
+        assert await fsm_b.get_state(key) == "FormStates:input_room_number"
+        store_a.close()
+        store_b.close()
+
+    asyncio.run(scenario())
+
+def test_async_reads_go_to_executor():
+    """aget_* читают хранилище в пуле потоков и видят незаписанный буфер."""
+    threads = []
+
+    class ThreadKV(MemoryKV):
+        def hget(self, name, key):
+            threads.append(threading.current_thread().name)
+            return super().hget(name, key)
+
+        def hgetall(self, name):
+            threads.append(threading.current_thread().name)
+            return super().hgetall(name)
+
+    kv = ThreadKV()
+    kv.hset(BotStore.PREFS, "1", '{"col": "7"}')
+    kv.hset(BotStore.SUBS, "2", '{"hid": "h", "fid": "f", "gnum": "1"}')
+    executor = ThreadPoolExecutor(1, thread_name_prefix="kv-read")
+    store = BotStore(kv, flush_interval=10, executor=executor)
+
+    async def scenario():
+        store.subscribe(3, {"hid": "h", "fid": "f", "gnum": "2"})
+        store.unsubscribe(2)
+        assert await store.aget_prefs(1) == {"col": "7"}
+        assert await store.aget_prefs(5) is None
+        assert await store.aget_subscription(3) == {"hid": "h", "fid": "f", "gnum": "2"}
+        assert list(await store.aget_subscriptions()) == [3]
+        store._take_pending()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    # Подписка 3 нашлась в буфере без обращения к хранилищу
+    assert len(threads) == 3 and all(name.startswith("kv-read") for name in threads)
+
+def test_main_menu_uses_cached_hub_registry(monkeypatch):
+    import scheduler_bot
+    reads = []
+
+    class CountingStore(BotStore):
+        async def aget_hubs(self):
+            reads.append(1)
+            return {"edu_new": {"label": "Новый", "sheet_id": "s", "gid": "0"}}
+
+    monkeypatch.setattr(scheduler_bot, "STORE", CountingStore(MemoryKV()))
+    monkeypatch.setattr(scheduler_bot, "ACADEMIC_DATA", {})
+    monkeypatch.setattr(scheduler_bot, "HUB_REGISTRY", {"loaded_at": None, "task": None})
+
+    async def scenario():
+        scheduler_bot.ui_main_menu()
+        await scheduler_bot.HUB_REGISTRY["task"]
+        for _ in range(5):
+            menu = scheduler_bot.ui_main_menu()
+        return menu
+
+    menu = asyncio.run(scenario())
+    assert len(reads) == 1
+    assert any(row[0].callback_data == "hub:edu_new" for row in menu.inline_keyboard)
@@ -0,0 +1,44 @@
+# tests/test_loader.py
+import io
+from datetime import datetime, time
+
+import openpyxl
+import pandas as pd
+from bench_scheduler import read_sheet_pandas, sheet_as_csv
+from scheduler_bot import fill_merged_cells, read_sheet, read_xlsx_rows
+
+def test_xlsx_reader_matches_read_excel(sheet_bytes):
+    """Потоковое чтение дает ту же таблицу, что и pd.read_excel с заполнением пустот."""
+    expected = read_sheet_pandas(sheet_bytes).astype(str)
+    got = read_sheet(sheet_bytes, "xlsx").astype(str)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+def test_csv_export_matches_xlsx(sheet_bytes):
+    got = read_sheet(sheet_bytes, "xlsx").astype(str)
+    pd.testing.assert_frame_equal(read_sheet(sheet_as_csv(sheet_bytes), "csv").astype(str), got)
+
+def test_xlsx_cell_types():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"], ws["B1"], ws["C1"] = "Понедельник", time(9, 0), datetime(2025, 9, 12)
+    ws["D1"], ws["E1"], ws["F1"], ws["G1"] = 402, 1.5, True, "=1/0"
+    ws["B3"] = ""
+    buf = io.BytesIO()
+    wb.save(buf)
+
+    assert read_xlsx_rows(buf.getvalue()) == {
+        (0, 0): "Понедельник", (0, 1): time(9, 0), (0, 2): datetime(2025, 9, 12),
+        (0, 3): 402, (0, 4): 1.5, (0, 5): True,
+    }
+
+def test_fill_merged_cells():
+    cells = {(0, 2): "1 поток", (0, 5): "2 поток", (15, 0): "Понедельник", (15, 1): "9:00",
+             (19, 1): "10:45", (22, 0): "Вторник"}
+    df = fill_merged_cells(cells)
+    assert df.shape == (23, 6)
+    # Шапка - слева направо
+    assert list(df.iloc[0]) == ["", "", "1 поток", "1 поток", "1 поток", "2 поток"]
+    # Дни - вниз до следующего дня, время - вниз не больше чем на 2 строки
+    assert list(df[0][15:23]) == ["Понедельник"] * 7 + ["Вторник"]
+    assert list(df[1][15:23]) == ["9:00", "9:00", "9:00", "", "10:45", "10:45", "10:45", ""]
+    assert fill_merged_cells({}).empty
@@ -0,0 +1,100 @@
+# tests/test_metrics.py
+import asyncio
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+import scheduler_bot
+from metrics import METRICS, HandlerMetricsMiddleware, Histogram, Metrics, collect
+
+def test_histogram_quantile():
+    hist = Histogram((1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        hist.observe(value)
+    assert hist.counts == [1, 2, 1, 1]
+    assert (hist.count, hist.sum) == (5, 16.5)
+    # Медиана - третье наблюдение, вторая половина корзины (1, 2]
+    assert hist.quantile(0.5) == pytest.approx(1.75)
+    assert hist.quantile(0.99) == 4
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.describe("hub_cache_total", "Lookups")
+    metrics.inc("hub_cache_total", result="hit")
+    metrics.inc("hub_cache_total", 2, result="hit")
+    metrics.observe("handler_seconds", 0.003, buckets=(0.001, 0.01), handler='say "hi"')
+    metrics.add_gauges(lambda: [("hubs_loaded", {}, 3)])
+
+    assert metrics.render().splitlines() == [
+        "# HELP hub_cache_total Lookups",
+        "# TYPE hub_cache_total counter",
+        'hub_cache_total{result="hit"} 3',
+        "# TYPE hubs_loaded gauge",
+        "hubs_loaded 3",
+        "# TYPE handler_seconds histogram",
+        'handler_seconds_bucket{handler="say \\"hi\\"",le="0.001"} 0',
+        'handler_seconds_bucket{handler="say \\"hi\\"",le="0.01"} 1',
+        'handler_seconds_bucket{handler="say \\"hi\\"",le="+Inf"} 1',
+        'handler_seconds_sum{handler="say \\"hi\\""} 0.003',
+        'handler_seconds_count{handler="say \\"hi\\""} 1',
+    ]
+
+def test_collect_returns_observations_of_call():
+    """Как из пула процессов: наблюдения вызова приходят с результатом, а не в общий реестр"""
+    @METRICS.timed("test_collect_seconds")
+    def work(x):
+        METRICS.inc("test_collect_total")
+        return x * 2
+
+    result, captured = pickle.loads(pickle.dumps(collect(work, 21)))
+    assert result == 42
+    assert METRICS.counter("test_collect_total") == 0
+    assert captured.counter("test_collect_total") == 1
+
+    metrics = Metrics()
+    metrics.merge(captured)
+    metrics.merge(captured)
+    assert metrics.counter("test_collect_total") == 2
+    assert metrics.histograms[("test_collect_seconds", ())].count == 2
+
+def test_handler_middleware():
+    metrics = Metrics()
+    middleware = HandlerMetricsMiddleware(metrics)
+
+    async def cb_ok(event, data): return "ok"
+    async def cb_fail(event, data): raise RuntimeError("boom")
+
+    async def scenario():
+        assert await middleware(cb_ok, object(), {"handler": SimpleNamespace(callback=cb_ok)}) == "ok"
+        with pytest.raises(RuntimeError):
+            await middleware(cb_fail, object(), {"handler": SimpleNamespace(callback=cb_fail)})
+
+    asyncio.run(scenario())
+    counts = {labels["handler"]: hist.count for labels, hist in metrics.series("handler_seconds", "histograms")}
+    assert counts == {"cb_ok": 1, "cb_fail": 1}
+    assert metrics.counter("handler_errors_total", handler="cb_fail") == 1
+
+def test_sync_and_cache_counters(sheet_bytes, isolated_bot, monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(scheduler_bot, "METRICS", metrics)
+
+    async def scenario():
+        await scheduler_bot.get_hub_data("h")
+        await scheduler_bot.get_hub_data("h")
+        await scheduler_bot.sync_data("h", force=True)
+        await asyncio.gather(*scheduler_bot.RENDER_TASKS.values())
+
+    asyncio.run(scenario())
+    assert metrics.counter("hub_cache_total", result="miss") == 1
+    assert metrics.counter("hub_cache_total", result="hit") == 1
+    assert metrics.counter("sheet_sync_total", result="loaded") == 1
+    assert metrics.counter("sheet_sync_total", result="unchanged") == 1
+    assert metrics.histograms[("sheet_download_bytes", ())].sum == 2 * len(sheet_bytes)
+    # Этапы разбора пришли из пула через collect
+    stages = {labels["stage"] for labels, _ in metrics.series("sheet_parse_seconds", "histograms")}
+    assert stages == {"read", "layout", "index"}
+
+    monkeypatch.setattr(scheduler_bot, "POOLS", scheduler_bot.WorkerPools())
+    text = scheduler_bot.format_stats()
+    assert "Кэш хабов:</b> попаданий 1" in text and "loaded 1" in text
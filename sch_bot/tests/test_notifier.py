@@ -0,0 +1,182 @@
+# tests/test_notifier.py
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import scheduler_bot
+from kv_store import BotStore, MemoryKV
+from notifier import Notifier, TokenBucket
+
+class FakeClock:
+    """Время для TokenBucket: sleep только сдвигает часы."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+class FakeBot:
+    """Записывает отправленные сообщения; errors[chat_id] - исключение для первой отправки."""
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = dict(errors or {})
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.errors.pop(chat_id, None)
+        if error: raise error
+        self.sent.append((chat_id, text))
+
+def method(chat_id):
+    return SendMessage(chat_id=chat_id, text="-")
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(30, clock=clock, sleep=clock.sleep)
+
+    async def scenario():
+        for _ in range(90):
+            await bucket.acquire()
+
+    asyncio.run(scenario())
+    # 30 токенов есть сразу, остальные 60 - со скоростью 30 в секунду
+    assert clock.now == pytest.approx(2.0)
+
+def test_enqueue_coalesces_by_key():
+    bot = FakeBot()
+    notifier = Notifier(bot, rate=1000)
+    notifier.enqueue(1, "старое", key="changes")
+    notifier.enqueue(1, "новое", key="changes")
+    notifier.enqueue(2, "другой чат", key="changes")
+    notifier.enqueue(1, "без ключа")
+    notifier.enqueue(1, "без ключа")
+    assert len(notifier) == 4
+
+    asyncio.run(notifier.flush())
+    # Замененное сообщение сохраняет место в очереди
+    assert bot.sent == [(1, "новое"), (2, "другой чат"), (1, "без ключа"), (1, "без ключа")]
+
+def test_retry_after_and_blocked_users():
+    clock = FakeClock()
+    bot = FakeBot({
+        1: TelegramRetryAfter(method=method(1), message="flood", retry_after=3),
+        2: TelegramForbiddenError(method=method(2), message="blocked"),
+    })
+    blocked = []
+    notifier = Notifier(bot, on_blocked=blocked.append, batch_size=1,
+                        bucket=TokenBucket(10, clock=clock, sleep=clock.sleep))
+    for chat_id in (1, 2, 3):
+        notifier.enqueue(chat_id, f"msg {chat_id}")
+
+    asyncio.run(notifier.flush())
+    # После 429 сообщение повторено, а рассылка подождала retry_after
+    assert sorted(bot.sent) == [(1, "msg 1"), (3, "msg 3")]
+    assert clock.now >= 3
+    assert blocked == [2]
+    assert (notifier.sent, notifier.failed) == (2, 1)
+
+@pytest.fixture
+def subscribed(hub, isolated_bot, monkeypatch):
+    """Хаб из тестовой таблицы, две подписки на одну группу и рассылка на FakeBot."""
+    layout = hub["layout"]
+    fid = next(iter(layout))
+    gnum = str(next(iter(layout[fid]["map"])))
+
+    store = BotStore(MemoryKV())
+    for user_id in (10, 11):
+        store.subscribe(user_id, {"hid": "h", "fid": fid, "gnum": gnum})
+    store.subscribe(12, {"hid": "h", "fid": fid, "gnum": "999"})
+
+    bot = FakeBot()
+    scheduler_bot.LOCAL_STORAGE["h"] = hub
+    monkeypatch.setattr(scheduler_bot, "STORE", store)
+    monkeypatch.setattr(scheduler_bot, "NOTIFIER", Notifier(bot, rate=1000))
+    monkeypatch.setattr(scheduler_bot, "REMINDED", {"date": None, "sent": set()})
+    return bot, hub, fid, gnum
+
+def test_changes_are_sent_to_group_subscribers(subscribed):
+    bot, hub, fid, gnum = subscribed
+    changes = {"layout": False, "rows": [40], "groups": {(fid, gnum): {"tue"}, (fid, "998"): {"mon"}}}
+
+    asyncio.run(scheduler_bot.notify_schedule_changes("h", changes))
+    assert len(scheduler_bot.NOTIFIER) == 2
+    asyncio.run(scheduler_bot.NOTIFIER.flush())
+
+    assert sorted(chat for chat, _ in bot.sent) == [10, 11]
+    day_text = scheduler_bot.schedule_text("h", hub, "tue", fid, gnum) or "занятий нет"
+    assert all("Расписание изменилось" in text and day_text in text for _, text in bot.sent)
+
+def test_reminder_before_lesson_sent_once(subscribed):
+    bot, hub, fid, gnum = subscribed
+    lesson = next(l for l in hub["index"]["by_group"][(fid, int(gnum))] if l["start"] and l["s"])
+    # Ближайший день недели занятия, за 5 минут до начала
+    monday = datetime(2025, 9, 15)
+    day = monday + timedelta(days=list(scheduler_bot.WEEK_DAYS).index(lesson["day"]))
+    now = datetime.combine(day.date(), lesson["start"]) - timedelta(minutes=5)
+
+    async def scenario():
+        first = await scheduler_bot.send_reminders(now)
+        second = await scheduler_bot.send_reminders(now + timedelta(minutes=1))
+        await scheduler_bot.NOTIFIER.flush()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first, second) == (2, 0)
+    assert sorted(chat for chat, _ in bot.sent) == [10, 11]
+    assert all("Через 5 мин." in text and lesson["s"] in text for _, text in bot.sent)
+
+def test_other_process_does_not_repeat_notifications(subscribed):
+    """Второй процесс бота с тем же хранилищем, но своим REMINDED, не дублирует уведомления."""
+    bot, hub, fid, gnum = subscribed
+    lesson = next(l for l in hub["index"]["by_group"][(fid, int(gnum))] if l["start"] and l["s"])
+    day = datetime(2025, 9, 15) + timedelta(days=list(scheduler_bot.WEEK_DAYS).index(lesson["day"]))
+    now = datetime.combine(day.date(), lesson["start"]) - timedelta(minutes=5)
+    changes = {"layout": False, "rows": [40], "groups": {(fid, gnum): {"tue"}}}
+
+    async def scenario():
+        first = await scheduler_bot.send_reminders(now)
+        await scheduler_bot.notify_schedule_changes("h", changes)
+        # Другой процесс: свой кэш отметок, общее хранилище
+        scheduler_bot.REMINDED.update(date=None, sent=set())
+        second = await scheduler_bot.send_reminders(now)
+        await scheduler_bot.notify_schedule_changes("h", changes)
+        await scheduler_bot.NOTIFIER.flush()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first, second) == (2, 0)
+    assert len(bot.sent) == 4
+
+    # На следующий день отметки прошлых дней удаляются (об изменениях - с сегодняшней датой)
+    asyncio.run(scheduler_bot.STORE.expire_notifications(date.today() + timedelta(days=1)))
+    assert scheduler_bot.STORE.kv.hgetall(BotStore.NOTIFIED) == {}
+
+def test_retry_after_keeps_coalescing_key():
+    """Сообщение после 429 возвращается под своим ключом и не перебивает более новую версию."""
+    clock = FakeClock()
+    notifier = None
+
+    class FloodBot(FakeBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            if text == "v1" and not self.sent and len(notifier) == 0:
+                # Пока первая версия отправлялась, пришла новая
+                notifier.enqueue(chat_id, "v2", key="changes")
+                raise TelegramRetryAfter(method=method(chat_id), message="flood", retry_after=1)
+            await super().send_message(chat_id, text, **kwargs)
+
+    bot = FloodBot()
+    notifier = Notifier(bot, batch_size=1, bucket=TokenBucket(10, clock=clock, sleep=clock.sleep))
+    notifier.enqueue(1, "v1", key="changes")
+    asyncio.run(notifier.flush())
+    assert bot.sent == [(1, "v2")]
+
+    # Без новой версии повторяется то же сообщение, и тоже под своим ключом
+    bot.errors[1] = TelegramRetryAfter(method=method(1), message="flood", retry_after=1)
+    notifier.enqueue(1, "v3", key="changes")
+    asyncio.run(notifier._send(*notifier._take_batch()[0]))
+    assert list(notifier._pending) == [(1, "changes")]
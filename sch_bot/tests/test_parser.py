@@ -0,0 +1,55 @@
+# tests/test_parser.py
+import pandas as pd
+import scheduler_bot
+from scheduler_bot import extract_full_data, scrub_content, normalise_cells, find_cells, fold_text
+
+def test_layout_matches_golden(parsed_sheet, golden):
+    """Структура потоков и групп совпадает с эталоном."""
+    _, layout, _ = parsed_sheet
+    expected = golden["layout"]
+    assert list(layout) == list(expected)
+    for fid, flow in layout.items():
+        assert flow["title"] == expected[fid]["title"]
+        assert flow["anchor_col"] == expected[fid]["anchor_col"]
+        assert {str(g): subs for g, subs in flow["map"].items()} == expected[fid]["map"]
+        assert {str(c): label for c, label in flow["labels"].items()} == expected[fid]["labels"]
+
+def test_normalised_cells_match_golden(parsed_sheet, golden):
+    """Построчная нормализация с кэшем разбора текстов дает те же clean/s/t/r, что и разбор по ячейкам."""
+    df, _, _ = parsed_sheet
+    cells = normalise_cells(df, scheduler_bot.DATA_START_ROW)
+
+    got = {f"{r}:{c}": [cell["clean"], cell["data"]["s"], cell["data"]["t"], cell["data"]["r"]]
+           for (r, c), cell in cells.items()}
+    assert got == golden["cells"]
+
+def test_index_uses_normalised_cells(parsed_sheet):
+    _, _, index = parsed_sheet
+    for (r, c), cell in index["cells"].items():
+        assert cell["low"] == fold_text(cell["raw"])
+        assert cell["data"] == extract_full_data(cell["raw"])
+
+def test_repeated_cells_parsed_once():
+    """Одинаковые тексты разбираются один раз и делят результат."""
+    lecture = "Физика (лекция)\nдоц. Петров П.П.\n402"
+    df = pd.DataFrame([["Понедельник", "9:00-10:35", lecture, lecture, "", 0]])
+    cells = normalise_cells(df)
+
+    assert set(cells) == {(0, 2), (0, 3), (0, 5)}
+    assert cells[(0, 2)]["data"] is cells[(0, 3)]["data"]
+    assert cells[(0, 2)]["data"] == {"s": "Физика (лекция)", "t": "доц. Петров П.П.", "r": "402"}
+    # Числовой ноль, как и в scrub_content, считается пустой ячейкой
+    assert cells[(0, 5)]["raw"] == "0" and cells[(0, 5)]["clean"] == scrub_content(0) == ""
+
+def test_scrub_content_filters_dates_and_notes():
+    assert scrub_content("Физика 12.09") == "Физика"
+    assert scrub_content("по четным неделям") == ""
+    assert scrub_content("Кураторский час") == ""
+    assert scrub_content(float("nan")) == ""
+
+def test_find_cells_is_case_insensitive_substring(parsed_sheet):
+    _, _, index = parsed_sheet
+    expected = sorted(pos for pos, cell in index["cells"].items() if "петров п" in cell["low"])
+    assert expected
+    assert find_cells(index, "ПЕТРОВ П") == expected
+    assert find_cells(index, "етро") == sorted(pos for pos, cell in index["cells"].items() if "етро" in cell["low"])
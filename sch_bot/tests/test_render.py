@@ -0,0 +1,70 @@
+# tests/test_render.py
+import asyncio
+
+import pytest
+import scheduler_bot
+from scheduler_bot import SEARCH_DAYS_LOW, build_schedule_text, prerender_schedules, schedule_text
+
+pytestmark = pytest.mark.usefixtures("isolated_bot")
+
+def groups(layout):
+    return [(fid, str(g)) for fid, flow in layout.items() for g in flow["map"]]
+
+def test_prerender_covers_every_group_and_day(hub):
+    texts = prerender_schedules(hub)
+    assert len(texts) == len(groups(hub["layout"])) * len(SEARCH_DAYS_LOW)
+    assert any(text and "<b>ГРУППА" in text for text in texts.values())
+    for (fid, gnum, day), text in texts.items():
+        assert text == build_schedule_text(hub, day, fid, gnum)
+
+def test_schedule_text_is_cached_per_version(hub, monkeypatch):
+    fid, gnum = groups(hub["layout"])[0]
+    first = schedule_text("h", hub, "mon", fid, gnum)
+
+    calls = []
+    monkeypatch.setattr(scheduler_bot, "build_schedule_text", lambda *args: calls.append(args) or "new")
+    assert schedule_text("h", hub, "mon", fid, gnum) == first
+    assert not calls
+
+    # Новая версия таблицы сбрасывает кэш хаба
+    updated = dict(hub, hash="v2")
+    assert schedule_text("h", updated, "mon", fid, gnum) == "new"
+    assert len(calls) == 1
+
+def test_warm_render_cache_after_sync(hub):
+    scheduler_bot.LOCAL_STORAGE["h"] = hub
+    fid, gnum = groups(hub["layout"])[0]
+
+    async def scenario():
+        week = schedule_text("h", hub, "all", fid, gnum)
+        await scheduler_bot.warm_render_cache("h")
+        return week
+
+    week = asyncio.run(scenario())
+    cache = scheduler_bot.RENDER_CACHE["h"]
+    assert cache["version"] == "v1" and cache["warm"]
+    assert cache["texts"][(fid, gnum, "tue")] == build_schedule_text(hub, "tue", fid, gnum)
+    # Построенное по запросу до прогрева не теряется
+    assert cache["texts"][(fid, gnum, "all")] == week
+
+def test_group_buttons_load_hub(hub):
+    """Кнопки потока и группы берут хаб через get_hub_data и не падают на выгруженном хабе."""
+    from bench_scheduler import FakeCallbackQuery
+    fid, gnum = groups(hub["layout"])[0]
+
+    async def click(handler, data):
+        cb = FakeCallbackQuery(data)
+        await handler(cb)
+        return cb.message.sent[-1]
+
+    async def scenario():
+        missing = await click(scheduler_bot.flow_click, "flow:gone:1")
+        scheduler_bot.LOCAL_STORAGE["h"] = hub
+        flow = await click(scheduler_bot.flow_click, f"flow:h:{fid}")
+        group = await click(scheduler_bot.cluster_click, f"cls:h:{fid}:{gnum}")
+        stale = await click(scheduler_bot.cluster_click, f"cls:h:{fid}:999")
+        return missing, flow, group, stale
+
+    missing, flow, group, stale = asyncio.run(scenario())
+    assert missing == stale == "❌ Ошибка загрузки данных."
+    assert "Выберите вашу группу" in flow and "На какой день" in group
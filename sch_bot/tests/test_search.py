@@ -0,0 +1,42 @@
+# tests/test_search.py
+import pytest
+from scheduler_bot import find_cells, suggest_terms, fold_text, teacher_surname
+
+@pytest.mark.parametrize("query", ["петров", "ПЕТРОВ П.П.", "ов", "лекция", "521", "12", "матем анализ", "Ёлкин", "нет такого"])
+def test_find_cells_matches_full_scan(parsed_sheet, query):
+    """Отбор кандидатов по триграммам не теряет ячеек по сравнению с полным перебором."""
+    _, _, index = parsed_sheet
+    expected = sorted(pos for pos, cell in index["cells"].items() if fold_text(query) in cell["low"])
+    assert find_cells(index, query) == expected
+
+@pytest.mark.parametrize("query", ["а", "5", "д. п", "zz"])
+def test_short_query_matches_full_scan(parsed_sheet, query):
+    """Короткие слова запроса ищутся по token_short, а не перебором всех слов ячеек."""
+    _, _, index = parsed_sheet
+    expected = sorted(pos for pos, cell in index["cells"].items() if fold_text(query) in cell["low"])
+    assert find_cells(index, query) == expected
+    for probe in ("а", "ов", "5"):
+        assert index["token_short"].get(probe, set()) == {token for token in index["by_token"] if probe in token}
+
+def test_find_cells_ignores_yo(parsed_sheet):
+    _, _, index = parsed_sheet
+    found = find_cells(index, "Елкин")
+    assert found and found == find_cells(index, "ёлкин")
+    assert all("Ёлкин" in index["cells"][pos]["raw"] for pos in found)
+
+def test_teacher_surname():
+    assert teacher_surname("доц. Петров П.П.") == "Петров"
+    assert teacher_surname("ст.преп. Ёлкин Е.Е.") == "Ёлкин"
+    assert teacher_surname("доцент Смирнова О.Л.") == "Смирнова"
+    assert teacher_surname("") == ""
+
+def test_suggest_teachers_with_typos(parsed_sheet):
+    _, _, index = parsed_sheet
+    assert suggest_terms([index], "Петоров", "teacher")[0] == "Петров"
+    assert suggest_terms([index], "елкин", "teacher") == ["Ёлкин"]
+    assert suggest_terms([index], "zzz", "teacher") == []
+
+def test_suggest_rooms(parsed_sheet):
+    _, _, index = parsed_sheet
+    assert "521а" in suggest_terms([index], "521", "room")
+    assert len(suggest_terms([index], "1", "room", limit=2)) <= 2
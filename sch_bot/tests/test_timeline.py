@@ -0,0 +1,46 @@
+# tests/test_timeline.py
+from datetime import time
+
+import pytest
+from scheduler_bot import rows_at, next_slot_rows, find_occupied_rooms, rooms_from_mask, parse_time_range
+
+MOMENTS = [time(h, m, s) for h in range(7, 21) for m in range(0, 60, 5) for s in (0, 30)]
+
+def linear_rows(index, day_code, moment):
+    """Прежний способ: проход по всем строкам дня."""
+    return [row for row in index["by_day"].get(day_code, [])
+            if row["start"] and row["end"] and row["start"] <= moment <= row["end"]]
+
+def test_parse_time_range():
+    assert parse_time_range("10:45 - 12:20") == (time(10, 45), time(12, 20))
+    assert parse_time_range("9.00-10.35") == (time(9, 0), time(10, 35))
+    assert parse_time_range("25:00-26:00") == (None, None)
+    assert parse_time_range("после обеда") == (None, None)
+
+@pytest.mark.parametrize("day_code", ["mon", "wed", "sat", "sun"])
+def test_rows_at_matches_linear_scan(parsed_sheet, day_code):
+    _, _, index = parsed_sheet
+    for moment in MOMENTS:
+        assert rows_at(index, day_code, moment) == linear_rows(index, day_code, moment)
+
+def test_next_slot_rows(parsed_sheet):
+    _, _, index = parsed_sheet
+    rows = next_slot_rows(index, "mon", time(7, 0))
+    assert rows and all(row["start"] == time(9, 0) for row in rows)
+    assert next_slot_rows(index, "mon", time(22, 0)) == []
+
+def test_occupied_rooms_range(parsed_sheet):
+    _, _, index = parsed_sheet
+    t_from, t_to = time(10, 0), time(13, 0)
+    expected = {room for row in index["by_day"]["tue"]
+                if row["start"] and row["end"] and row["start"] <= t_to and row["end"] >= t_from
+                for room in row["rooms"]}
+    assert expected
+    assert find_occupied_rooms(index, "tue", t_from, t_to) == expected
+    # Момент - вырожденный интервал
+    assert find_occupied_rooms(index, "tue", t_from) == {room for row in linear_rows(index, "tue", t_from) for room in row["rooms"]}
+
+def test_room_mask_roundtrip(parsed_sheet):
+    _, _, index = parsed_sheet
+    assert rooms_from_mask(index, index["all_rooms_mask"]) == set(index["room_names"])
+    assert rooms_from_mask(index, 0) == set()
@@ -0,0 +1,38 @@
+# tests/test_webhook.py
+import asyncio
+
+from aiogram import Bot
+from aiohttp.test_utils import TestClient, TestServer
+
+import scheduler_bot
+
+UPDATE = {"update_id": 1, "message": {
+    "message_id": 1, "date": 0, "chat": {"id": 10, "type": "private"}, "text": "/start",
+}}
+
+def test_webhook_feeds_dispatcher(monkeypatch):
+    """Обновление, пришедшее на WEBHOOK_PATH с верным секретом, попадает в dp."""
+    fed = []
+
+    async def feed_raw_update(bot, update, **kwargs):
+        fed.append(update["update_id"])
+
+    monkeypatch.setattr(scheduler_bot, "WEBHOOK_SECRET", "s3cret")
+    monkeypatch.setattr(scheduler_bot.dp, "feed_raw_update", feed_raw_update)
+
+    async def scenario():
+        bot = Bot(token="42:TEST")
+        client = TestClient(TestServer(scheduler_bot.build_webhook_app(bot)))
+        await client.start_server()
+        try:
+            path = scheduler_bot.WEBHOOK_PATH
+            wrong = await client.post(path, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+            right = await client.post(path, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            await asyncio.sleep(0.01)
+            return wrong.status, right.status
+        finally:
+            await client.close()
+            await bot.session.close()
+
+    assert asyncio.run(scenario()) == (401, 200)
+    assert fed == [1]
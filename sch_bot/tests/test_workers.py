@@ -0,0 +1,73 @@
+# tests/test_workers.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+import scheduler_bot
+from bench_scheduler import FakeMessage, FakeState
+from workers import WorkerPools
+
+@pytest.fixture
+def pools():
+    pools = WorkerPools(io_workers=1, cpu_workers=1, query_workers=1)
+    yield pools
+    pools.shutdown()
+
+def test_queue_depth_per_stage(pools):
+    release = threading.Event()
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(pools.run("query", "search", release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # Пул из одного потока: одна задача выполняется, две ждут
+        during = pools.stats()["search"]
+        release.set()
+        await asyncio.gather(*tasks)
+        return during
+
+    during = asyncio.run(scenario())
+    assert (during["queued"], during["running"]) == (2, 1)
+    after = pools.stats()["search"]
+    assert after["pool"] == "query" and after["max_queued"] == 2
+    assert (after["queued"], after["running"], after["done"], after["failed"]) == (0, 0, 3, 0)
+
+def test_failures_are_counted_and_raised(pools):
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(pools.run("io", "disk", divmod, 1, 0))
+    assert pools.stats()["disk"]["failed"] == 1
+
+def test_cpu_stage_in_process_pool():
+    pools = WorkerPools(cpu_workers=1, processes=True)
+    try:
+        assert asyncio.run(pools.run("cpu", "parse", pow, 2, 10)) == 1024
+        assert pools.stats()["parse"]["done"] == 1
+    finally:
+        pools.shutdown()
+
+def test_room_search_runs_in_query_pool(hub, isolated_bot, monkeypatch):
+    index = hub["index"]
+    pools = WorkerPools(io_workers=1, cpu_workers=1, query_workers=1)
+    monkeypatch.setattr(scheduler_bot, "POOLS", pools)
+    scheduler_bot.LOCAL_STORAGE["h"] = hub
+
+    room = next(r for r in sorted(index["room_names"]) if scheduler_bot.find_room_schedule([index], r))
+    message = FakeMessage(room)
+    try:
+        asyncio.run(scheduler_bot.process_room_search(message, FakeState()))
+    finally:
+        pools.shutdown()
+    assert pools.stats()["room_search"]["done"] == 1
+    assert any(f"Занятия в аудитории {room}" in text for text in message.sent)
+
+def test_queue_wait_and_run_time_are_separate(pools):
+    async def scenario():
+        # Один поток: вторая задача 0.1 с ждет первую, а выполняется мгновенно
+        await asyncio.gather(pools.run("query", "slow", time.sleep, 0.1),
+                             pools.run("query", "fast", time.sleep, 0))
+
+    asyncio.run(scenario())
+    slow, fast = pools.stats()["slow"], pools.stats()["fast"]
+    assert slow["avg_ms"] >= 90 and slow["wait_avg_ms"] < 50
+    assert fast["avg_ms"] < 50 and fast["wait_max_ms"] >= 90
@@ -0,0 +1,127 @@
+"""
+Пулы исполнителей бота и метрики их очередей.
+
+На event loop бота остаются только ожидание сети и ответы пользователям,
+все остальное уходит в один из пулов:
+    io    - потоки для блокирующего ввода-вывода (дисковый кэш, хранилище)
+    cpu   - процессы для разбора таблиц: pandas и регулярки держат GIL сотни
+            миллисекунд, в отдельном процессе они не мешают event loop
+    query - потоки для поисковых запросов пользователей по готовым индексам
+
+Пулы ограничены по размеру: лишние задачи ждут в очереди пула, а не
+плодят потоки. По каждому этапу (stage) считается, сколько задач сейчас
+ждут и выполняются, максимум очереди, время ожидания в очереди и время
+выполнения - см. stats().
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def _timed_call(func, *args):
+    """Выполняется в исполнителе: результат func(*args) и чистое время выполнения"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class StageStats:
+    """Счетчики одного этапа. Незавершенные задачи хранятся, чтобы в любой момент посчитать очередь"""
+    def __init__(self, pool):
+        self.pool = pool
+        self.pending = set()
+        self.done = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def snapshot(self):
+        running = sum(1 for future in self.pending if future.running())
+        return {
+            "pool": self.pool,
+            "queued": len(self.pending) - running,
+            "running": running,
+            "max_queued": self.max_queued,
+            "done": self.done,
+            "failed": self.failed,
+            "avg_ms": self.seconds / self.done * 1000 if self.done else 0.0,
+            "max_ms": self.max_seconds * 1000,
+            "wait_avg_ms": self.wait_seconds / self.done * 1000 if self.done else 0.0,
+            "wait_max_ms": self.max_wait_seconds * 1000,
+        }
+
+
+class WorkerPools:
+    """
+    Пулы io, cpu и query с общим учетом задач по этапам.
+
+    processes=False (или недоступный multiprocessing) - задачи cpu идут
+    в пул потоков того же размера: так работают тесты и бенчмарк.
+    Функции для пула cpu и их аргументы должны сериализоваться pickle.
+    """
+    def __init__(self, io_workers=4, cpu_workers=1, query_workers=2, processes=False):
+        self.sizes = {"io": io_workers, "cpu": cpu_workers, "query": query_workers}
+        self.processes = processes
+        self.io = ThreadPoolExecutor(io_workers, thread_name_prefix="bot-io")
+        self.query = ThreadPoolExecutor(query_workers, thread_name_prefix="bot-query")
+        self.cpu = None
+        self.stages = {}
+
+    def _cpu_pool(self):
+        if self.cpu is None:
+            if self.processes:
+                try:
+                    # spawn: дочерний процесс не наследует потоки и event loop бота
+                    self.cpu = ProcessPoolExecutor(self.sizes["cpu"], mp_context=multiprocessing.get_context("spawn"))
+                except (OSError, NotImplementedError) as e:
+                    logging.warning(f"Process pool unavailable ({e}), parsing in threads")
+            if self.cpu is None:
+                self.cpu = ThreadPoolExecutor(self.sizes["cpu"], thread_name_prefix="bot-cpu")
+        return self.cpu
+
+    def _pool(self, name):
+        return self._cpu_pool() if name == "cpu" else getattr(self, name)
+
+    async def run(self, pool, stage, func, *args):
+        """Выполняет func(*args) в пуле pool ("io", "cpu", "query"), учитывая задачу в этапе stage"""
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats(pool)
+        started = time.perf_counter()
+        # Время выполнения меряется в самом исполнителе, остальное - ожидание в очереди
+        # (и передача результата обратно в event loop)
+        future = self._pool(pool).submit(_timed_call, func, *args)
+        stats.pending.add(future)
+        queued = sum(1 for f in stats.pending if not f.running())
+        stats.max_queued = max(stats.max_queued, queued)
+        try:
+            result, run_seconds = await asyncio.wrap_future(future)
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.pending.discard(future)
+        wait_seconds = max(0.0, time.perf_counter() - started - run_seconds)
+        stats.done += 1
+        stats.seconds += run_seconds
+        stats.max_seconds = max(stats.max_seconds, run_seconds)
+        stats.wait_seconds += wait_seconds
+        stats.max_wait_seconds = max(stats.max_wait_seconds, wait_seconds)
+        return result
+
+    def stats(self):
+        """
+        Этап -> {"pool", "queued", "running", "max_queued", "done", "failed",
+        "avg_ms", "max_ms" (выполнение), "wait_avg_ms", "wait_max_ms" (очередь)}
+        """
+        return {stage: stats.snapshot() for stage, stats in self.stages.items()}
+
+    def shutdown(self, wait=True):
+        for pool in (self.io, self.query, self.cpu):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
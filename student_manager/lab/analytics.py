@@ -0,0 +1,190 @@
+# lab/analytics.py
+"""
+Модуль векторизованной аналитики по оценкам.
+
+Если установлен NumPy, ростер загружается в массивы (ID, матрица оценок,
+количество оценок у студента) и статистика считается без циклов Python.
+Без NumPy используются эквивалентные функции на чистом Python, результаты
+обоих вариантов совпадают.
+
+Функции модуля принимают и готовую GradeMatrix: для нескольких запросов
+к одному ростеру матрицу стоит построить один раз.
+"""
+import math
+from typing import Any, Dict, Iterable, List, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+
+try:
+    from .models import Student
+    from . import processing
+except (ImportError, ValueError):
+    from models import Student
+    import processing
+
+
+def has_numpy() -> bool:
+    """Проверяет, доступен ли векторизованный бэкенд."""
+    return np is not None
+
+
+class GradeMatrix:
+    """
+    Ростер в виде массивов NumPy.
+
+    ids      - ID студентов (int64)
+    counts   - количество оценок у каждого студента
+    grades   - матрица оценок, дополненная нулями до максимального числа оценок
+    mask     - True там, где в матрице настоящая оценка
+    averages - средние баллы (0.0 для студентов без оценок)
+
+    Оценки студентов уже упакованы по байту на оценку, поэтому плоский массив
+    собирается склейкой grades_bytes без обхода отдельных оценок в Python.
+    """
+    def __init__(self, students: Iterable[Student]):
+        if np is None:
+            raise RuntimeError("Для GradeMatrix требуется NumPy.")
+
+        self.students: List[Student] = list(students)
+        n = len(self.students)
+
+        self.ids = np.fromiter((s.id for s in self.students), dtype=np.int64, count=n)
+        self.names = np.array([s.name for s in self.students], dtype=str)
+        self.counts = np.fromiter((s.grades_count for s in self.students), dtype=np.int64, count=n)
+
+        total = int(self.counts.sum())
+        flat = np.frombuffer(b"".join([s.grades_bytes for s in self.students]), dtype=np.uint8, count=total)
+
+        # Раскладываем плоский массив оценок по строкам матрицы
+        rows = np.repeat(np.arange(n), self.counts)
+        starts = np.cumsum(self.counts) - self.counts
+        cols = np.arange(total) - np.repeat(starts, self.counts)
+
+        width = int(self.counts.max()) if n else 0
+        self.grades = np.zeros((n, width), dtype=np.uint8)
+        self.grades[rows, cols] = flat
+        self.mask = np.arange(width) < self.counts[:, None]
+
+        # Суммы целые, поэтому деление дает тот же float, что и sum() / len()
+        sums = self.grades.sum(axis=1, dtype=np.int64)
+        self.averages = np.zeros(n, dtype=np.float64)
+        np.divide(sums, self.counts, out=self.averages, where=self.counts > 0)
+
+    def __len__(self) -> int:
+        return len(self.students)
+
+    def ranking(self) -> "np.ndarray":
+        """Индексы студентов в порядке sort_students(..., 'avg')."""
+        # lexsort сортирует по последнему ключу, при равенстве - по предыдущему
+        return np.lexsort((self.names, -self.averages))
+
+    def top_n(self, n: int) -> List[Student]:
+        """N лучших студентов без полной сортировки всего ростера."""
+        if n <= 0 or not len(self):
+            return []
+        if n >= len(self):
+            order = self.ranking()
+        else:
+            # Отбираем всех, кто не хуже N-го по среднему баллу (включая равных),
+            # и сортируем только их - так сохраняется порядок при равенстве
+            neg = -self.averages
+            kth = np.partition(neg, n - 1)[n - 1]
+            candidates = np.flatnonzero(neg <= kth)
+            order = candidates[np.lexsort((self.names[candidates], neg[candidates]))]
+        return [self.students[i] for i in order[:n]]
+
+    def percentiles(self, qs: Sequence[float]) -> List[float]:
+        """Перцентили средних баллов (линейная интерполяция)."""
+        if not len(self):
+            return []
+        return [float(v) for v in np.percentile(self.averages, qs)]
+
+    def column_statistics(self) -> List[Dict[str, Any]]:
+        """Статистика по каждой колонке оценок (grade1, grade2, ...)."""
+        counts = self.mask.sum(axis=0)
+        sums = self.grades.sum(axis=0, dtype=np.int64)
+        as_int = self.grades.astype(np.int16)
+        mins = np.where(self.mask, as_int, 101).min(axis=0, initial=101)
+        maxs = np.where(self.mask, as_int, -1).max(axis=0, initial=-1)
+
+        return [
+            {
+                "column": j + 1,
+                "count": int(counts[j]),
+                "average": int(sums[j]) / int(counts[j]),
+                "min": int(mins[j]),
+                "max": int(maxs[j]),
+            }
+            for j in range(self.grades.shape[1])
+        ]
+
+
+# --- Функции с автоматическим выбором бэкенда ---
+
+Roster = Union[GradeMatrix, Iterable[Student]]
+
+def _matrix(students: Roster) -> GradeMatrix:
+    """Готовая матрица используется как есть, иначе строится новая."""
+    return students if isinstance(students, GradeMatrix) else GradeMatrix(students)
+
+def rank_students(students: Roster) -> List[Student]:
+    """Сортирует студентов по убыванию среднего балла, затем по имени."""
+    if np is None:
+        return processing.sort_students(students, 'avg')
+    matrix = _matrix(students)
+    return [matrix.students[i] for i in matrix.ranking()]
+
+def get_top_n_students(students: Roster, n: int) -> List[Student]:
+    """Возвращает N лучших студентов (как processing.get_top_n_students)."""
+    if np is None:
+        return processing.get_top_n_students(students, n)
+    return _matrix(students).top_n(n)
+
+def average_percentiles(students: Roster, qs: Sequence[float]) -> List[float]:
+    """Возвращает перцентили qs (0-100) распределения средних баллов."""
+    if np is None:
+        averages = sorted(s.average for s in students)
+        return [_percentile(averages, q) for q in qs] if averages else []
+    return _matrix(students).percentiles(qs)
+
+def column_statistics(students: Roster) -> List[Dict[str, Any]]:
+    """Возвращает количество, среднее, минимум и максимум по каждой колонке оценок."""
+    if np is None:
+        return _column_statistics_py(students)
+    return _matrix(students).column_statistics()
+
+
+# --- Реализация на чистом Python ---
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией, как у numpy.percentile по умолчанию."""
+    if not 0 <= q <= 100:
+        raise ValueError("Перцентиль должен быть в диапазоне 0-100.")
+    pos = (len(sorted_values) - 1) * (q / 100)
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    a, b, t = sorted_values[lo], sorted_values[hi], pos - lo
+    # Та же формула, что в NumPy: интерполяция от ближайшего конца отрезка
+    return float(a + (b - a) * t if t < 0.5 else b - (b - a) * (1 - t))
+
+def _column_statistics_py(students: Iterable[Student]) -> List[Dict[str, Any]]:
+    columns: List[List[int]] = []
+    for s in students:
+        for j, grade in enumerate(s.grades):
+            if j == len(columns):
+                columns.append([])
+            columns[j].append(grade)
+
+    return [
+        {
+            "column": j + 1,
+            "count": len(col),
+            "average": sum(col) / len(col),
+            "min": min(col),
+            "max": max(col),
+        }
+        for j, col in enumerate(columns)
+    ]
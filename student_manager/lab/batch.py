@@ -0,0 +1,200 @@
+# lab/batch.py
+"""
+Неинтерактивный (пакетный) режим командной строки.
+
+Примеры:
+    python -m lab.main stats data/students.csv
+    python -m lab.main top data/students.csv -n 10 --format csv -o top.csv
+    cat students.csv | python -m lab.main sort - --by name --format json
+    python -m lab.main export data/students.csv -o data/students.snap
+    python -m lab.main load class_*.csv --workers 8
+
+Вход "-" - CSV из stdin, вывод по умолчанию - stdout. CSV читается потоково,
+а stats и top не держат весь ростер в памяти.
+"""
+import argparse
+import json
+import os
+import sys
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+try:
+    from . import io_utils, processing, storage
+    from .ingest import ingest_csv_files
+    from .models import Student
+    from .errors import StudentAppError
+except (ImportError, ValueError):
+    import io_utils
+    import processing
+    import storage
+    from ingest import ingest_csv_files
+    from models import Student
+    from errors import StudentAppError
+
+
+@contextmanager
+def _open_students(path: str) -> Iterator[Iterable[Student]]:
+    """
+    Открывает источник студентов по пути: stdin, база SQLite, снимок или CSV.
+    Студентов нужно обойти внутри блока with: на выходе база закрывается.
+    CSV читается потоково вместе с журналом правок, сохраненных из меню.
+    """
+    if path == '-':
+        yield (s for batch in io_utils.iter_students_from_file(sys.stdin, source="<stdin>") for s in batch)
+    elif storage.is_sqlite_path(path):
+        with storage.SQLiteStudentStore(path) as store:
+            yield store
+    elif path.lower().endswith(io_utils.SNAPSHOT_EXT):
+        yield io_utils.load_snapshot(path)
+    else:
+        yield io_utils.iter_students(path)
+
+def _student_dict(s: Student) -> Dict[str, Any]:
+    return {"id": s.id, "name": s.name, "average": s.average, "grades": s.grades.tolist()}
+
+def _write_students(out: TextIO, students: Iterable[Student], fmt: str):
+    if fmt == 'json':
+        json.dump([_student_dict(s) for s in students], out, ensure_ascii=False)
+        out.write("\n")
+    else:
+        io_utils.write_students_report(out, students)
+
+def _write_mapping(out: TextIO, data: Dict[str, Any], fmt: str):
+    if fmt == 'json':
+        json.dump(data, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+    else:
+        out.write("".join(f"{key},{value}\n" for key, value in data.items()))
+
+
+# --- Команды ---
+
+def cmd_load(args, out: TextIO) -> int:
+    """Проверяет файлы и выводит сводку; несколько файлов разбираются параллельно."""
+    report = ingest_csv_files(args.inputs, max_workers=args.workers)
+    _write_mapping(out, {
+        "files": report.files_total,
+        "files_loaded": report.files_loaded,
+        "students": len(report.students),
+        "errors": sum(map(len, report.errors.values())),
+        "duplicate_ids": len(report.duplicates),
+        "seconds": round(report.elapsed, 3),
+    }, args.format)
+    for path, messages in report.errors.items():
+        for message in messages:
+            print(f"{path}: {message}", file=sys.stderr)
+    return 0 if report.ok else 1
+
+def cmd_stats(args, out: TextIO) -> int:
+    with _open_students(args.input) as students:
+        stats = processing.get_group_statistics(students)
+    if stats is None:
+        print("Список студентов пуст, статистика недоступна.", file=sys.stderr)
+        return 1
+
+    best, worst = stats["best_student"], stats["worst_student"]
+    data = {
+        "total_students": stats["total_students"],
+        "overall_average": stats["overall_average"],
+        "median_grade": stats["median_grade"],
+        "stddev": stats["stddev"],
+        "best_student_id": best.id,
+        "best_student_average": best.average,
+        "worst_student_id": worst.id,
+        "worst_student_average": worst.average,
+    }
+    if args.format == 'json':
+        data["histogram"] = stats["histogram"]
+    _write_mapping(out, data, args.format)
+    return 0
+
+def cmd_top(args, out: TextIO) -> int:
+    with _open_students(args.input) as students:
+        _write_students(out, processing.get_top_n_students(students, args.n), args.format)
+    return 0
+
+def cmd_sort(args, out: TextIO) -> int:
+    with _open_students(args.input) as students:
+        _write_students(out, processing.sort_students(students, args.by), args.format)
+    return 0
+
+def cmd_export(args, out: TextIO) -> int:
+    """Конвертирует ростер в CSV, снимок (.snap) или базу SQLite (.db)."""
+    with _open_students(args.input) as students:
+        if storage.is_sqlite_path(args.output):
+            storage.export_to_sqlite(args.output, students)
+        else:
+            io_utils.save_students(args.output, students)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="lab.main", description="Пакетная обработка списков студентов.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_output(p: argparse.ArgumentParser):
+        p.add_argument("-o", "--output", default="-", help="файл для вывода ('-' - stdout)")
+        p.add_argument("--format", choices=("json", "csv"), default="csv")
+
+    p = sub.add_parser("load", help="проверить один или несколько CSV-файлов")
+    p.add_argument("inputs", nargs="+")
+    p.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    add_output(p)
+    p.set_defaults(func=cmd_load)
+
+    p = sub.add_parser("stats", help="статистика по группе")
+    p.add_argument("input")
+    add_output(p)
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("top", help="ТОП-N студентов по среднему баллу")
+    p.add_argument("input")
+    p.add_argument("-n", type=int, default=10)
+    add_output(p)
+    p.set_defaults(func=cmd_top)
+
+    p = sub.add_parser("sort", help="отсортированный список студентов")
+    p.add_argument("input")
+    p.add_argument("--by", choices=("id", "name", "avg"), default="id")
+    add_output(p)
+    p.set_defaults(func=cmd_sort)
+
+    p = sub.add_parser("export", help="конвертировать в CSV, .snap или .db")
+    p.add_argument("input")
+    p.add_argument("-o", "--output", required=True)
+    p.set_defaults(func=cmd_export, format="csv")
+
+    return parser
+
+
+def _run_to_file(args) -> int:
+    """
+    Выполняет команду с выводом во временный файл рядом с args.output и
+    подменяет им args.output только при успехе: неудачная команда не оставляет
+    пустой или недописанный файл на месте прежнего.
+    """
+    tmp_path = args.output + '.tmp'
+    try:
+        with open(tmp_path, mode='w', encoding='utf-8', newline='') as out:
+            code = args.func(args, out)
+        if code == 0:
+            os.replace(tmp_path, args.output)
+        return code
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа пакетного режима. Возвращает код завершения."""
+    args = build_parser().parse_args(argv)
+    try:
+        if args.output == '-' or args.command == 'export':
+            return args.func(args, sys.stdout)
+        return _run_to_file(args)
+    except StudentAppError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"Ошибка ввода-вывода: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,152 @@
+# lab/ingest.py
+"""Модуль массовой параллельной загрузки множества CSV-файлов."""
+import csv
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .models import Student
+    from .io_utils import is_header_row, parse_row, read_journal
+    from .errors import StudentAppError, DataValidationError, DuplicateStudentIdError
+except (ImportError, ValueError):
+    from models import Student
+    from io_utils import is_header_row, parse_row, read_journal
+    from errors import StudentAppError, DataValidationError, DuplicateStudentIdError
+
+# Студент в компактном виде для передачи между процессами: (id, имя, оценки)
+PackedStudent = Tuple[int, str, bytes]
+
+
+class IngestReport:
+    """Результат массовой загрузки: студенты, ошибки по файлам и скорость."""
+    def __init__(self):
+        self.students: List[Student] = []
+        # путь -> список сообщений об ошибках (файл с ошибками не загружается)
+        self.errors: Dict[str, List[str]] = {}
+        # ID -> пути файлов, где он повторно встретился (остается первое вхождение)
+        self.duplicates: Dict[int, List[str]] = {}
+        self.files_total = 0
+        self.files_loaded = 0
+        self.bytes_total = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """True, если не было ни ошибок, ни дубликатов."""
+        return not self.errors and not self.duplicates
+
+    @property
+    def students_per_second(self) -> float:
+        return len(self.students) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_total / 1_000_000 / self.elapsed if self.elapsed else 0.0
+
+    def raise_for_errors(self):
+        """Выбрасывает исключение, если при загрузке были проблемы."""
+        if self.errors:
+            details = "; ".join(f"{path}: {msgs[0]}" for path, msgs in self.errors.items())
+            raise DataValidationError(f"Ошибки в {len(self.errors)} файл(ах): {details}")
+        if self.duplicates:
+            ids = ", ".join(map(str, sorted(self.duplicates)))
+            raise DuplicateStudentIdError(f"Повторяющиеся ID студентов: {ids}")
+
+    def summary(self) -> str:
+        """Короткий отчет для вывода пользователю."""
+        return (
+            f"Файлов: {self.files_loaded}/{self.files_total}, студентов: {len(self.students)}, "
+            f"ошибок: {sum(map(len, self.errors.values()))}, дубликатов ID: {len(self.duplicates)}, "
+            f"время: {self.elapsed:.2f} с ({self.students_per_second:,.0f} студ./с, "
+            f"{self.megabytes_per_second:.1f} МБ/с)"
+        )
+
+
+def _parse_file(filepath: str) -> Tuple[str, List[PackedStudent], List[str], int]:
+    """
+    Разбирает один файл (выполняется в процессе-воркере).
+
+    В отличие от read_students_from_csv не останавливается на первой ошибке,
+    а собирает все ошибки файла. Если они есть, студенты файла не возвращаются.
+    Журнал изменений файла применяется так же, как при обычном чтении.
+    """
+    students: List[Student] = []
+    errors: List[str] = []
+    size = 0
+    try:
+        size = os.path.getsize(filepath)
+        with open(filepath, mode='r', encoding='utf-8', newline='') as file:
+            for line_num, row in enumerate(csv.reader(file), start=1):
+                if line_num == 1 and is_header_row(row):
+                    continue
+                try:
+                    student = parse_row(row, line_num)
+                except DataValidationError as e:
+                    errors.append(str(e))
+                    continue
+                if student is not None:
+                    students.append(student)
+    except FileNotFoundError:
+        errors.append(f"Файл не найден по пути: {filepath}")
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        errors.append(f"Не удалось прочитать файл {filepath}: {e}")
+    if errors:
+        return filepath, [], errors, size
+
+    try:
+        overlay = read_journal(filepath)
+        if overlay is not None:
+            students = list(overlay.apply(students)) + list(overlay.appended.values())
+    except StudentAppError as e:
+        return filepath, [], [str(e)], size
+    packed: List[PackedStudent] = [(s.id, s.name, s.grades_bytes) for s in students]
+    return filepath, packed, errors, size
+
+
+def ingest_csv_files(filepaths: Sequence[str], max_workers: Optional[int] = None) -> IngestReport:
+    """
+    Загружает несколько CSV-файлов параллельно в пуле процессов.
+
+    Файлы разбираются независимо, результаты объединяются в порядке filepaths:
+    при повторном ID остается студент из более раннего файла, а повтор
+    записывается в report.duplicates. Ошибки собираются по файлам в
+    report.errors и не прерывают загрузку остальных файлов.
+    """
+    report = IngestReport()
+    report.files_total = len(filepaths)
+    start = time.perf_counter()
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(filepaths) <= 1:
+        results = map(_parse_file, filepaths)
+        _merge(report, results)
+    else:
+        # Крупные пачки снижают накладные расходы на передачу задач воркерам
+        chunksize = max(1, len(filepaths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            _merge(report, executor.map(_parse_file, filepaths, chunksize=chunksize))
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def _merge(report: IngestReport, results) -> None:
+    seen: Dict[int, str] = {}
+    from_packed = Student.from_packed
+    for filepath, packed, errors, size in results:
+        report.bytes_total += size
+        if errors:
+            report.errors[filepath] = errors
+            continue
+
+        report.files_loaded += 1
+        for student_id, name, grades in packed:
+            if student_id in seen:
+                report.duplicates.setdefault(student_id, [seen[student_id]]).append(filepath)
+                continue
+            seen[student_id] = filepath
+            # Данные уже проверены в воркере через parse_row
+            report.students.append(from_packed(student_id, name, array('B', grades)))
@@ -1,86 +1,492 @@
 # lab/io_utils.py
-"""Модуль для операций ввода/вывода, в основном для работы с CSV файлами."""
+"""Модуль для операций ввода/вывода: CSV файлы и бинарные снимки ростера."""
 import csv
-from typing import List
+import gc
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
 
 try:
     # Сначала относительный (для pytest)
-    from .models import Student
-    from .errors import FileProcessingError, DataValidationError
+    from .models import Student, StudentRegistry
+    from .errors import StudentAppError, FileProcessingError, DataValidationError
 except (ImportError, ValueError):
     # Затем прямой (для EXE)
-    from models import Student
-    from errors import FileProcessingError, DataValidationError
+    from models import Student, StudentRegistry
+    from errors import StudentAppError, FileProcessingError, DataValidationError
 # -------------------------
 
-def read_students_from_csv(filepath: str) -> List[Student]:
-    """Читает данные о студентах из CSV-файла."""
-    students = []
-    try:
-        with open(filepath, mode='r', encoding='utf-8', newline='') as file:
-            reader = csv.reader(file)
-
-            try:
-                first_row = next(reader)
-            except StopIteration:
-                return [] # Пустой файл
+# Размер пачки по умолчанию для потокового чтения
+DEFAULT_CHUNK_SIZE = 10_000
 
-            has_header = False
-            if first_row and 'id' in first_row[0].lower():
-                has_header = True
+def iter_students_from_csv(filepath: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Student]]:
+    """
+    Потоково читает CSV-файл и отдает студентов пачками по chunk_size.
 
-            if not has_header:
-                process_row(first_row, 1, students)
+    В памяти одновременно находится не больше одной пачки, поэтому так можно
+    обрабатывать файлы, которые целиком не помещаются в память.
+    Ошибка в данных прерывает чтение с DataValidationError и номером строки.
 
-            for i, row in enumerate(reader, start=2 if has_header else 2):
-                process_row(row, i, students)
+    Если рядом с файлом лежит журнал изменений, он применяется на лету:
+    удаленные студенты пропускаются, добавленные отдаются в конце.
+    """
+    if chunk_size <= 0:
+        raise ValueError("Размер пачки должен быть положительным числом.")
 
+    try:
+        file = open(filepath, mode='r', encoding='utf-8', newline='')
     except FileNotFoundError:
         raise FileProcessingError(f"Файл не найден по пути: {filepath}")
+    except OSError as e:
+        raise FileProcessingError(f"Не удалось открыть файл {filepath}: {e}")
+
+    with file:
+        overlay = read_journal(filepath)
+        batches = iter_students_from_file(file, chunk_size, filepath)
+        if overlay is None:
+            yield from batches
+            return
+        for batch in batches:
+            batch = list(overlay.apply(batch))
+            if batch:
+                yield batch
+        appended = list(overlay.appended.values())
+        for start in range(0, len(appended), chunk_size):
+            yield appended[start:start + chunk_size]
+
+def iter_students_from_file(file: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            source: str = "<stream>") -> Iterator[List[Student]]:
+    """
+    То же, что iter_students_from_csv, но для уже открытого текстового потока
+    (например, sys.stdin). source используется только в сообщениях об ошибках.
+    """
+    if chunk_size <= 0:
+        raise ValueError("Размер пачки должен быть положительным числом.")
+
+    reader = csv.reader(file)
+    batch: List[Student] = []
+    try:
+        for line_num, row in enumerate(reader, start=1):
+            if line_num == 1 and is_header_row(row):
+                continue
+
+            student = parse_row(row, line_num)
+            if student is None:
+                continue
+
+            batch.append(student)
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+    except (csv.Error, UnicodeDecodeError, OSError) as e:
+        raise FileProcessingError(f"Не удалось прочитать файл {source}: {e}")
+
+    if batch:
+        yield batch
+
+def iter_students(filepath: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Student]:
+    """Потоково отдает студентов из CSV-файла по одному (поверх iter_students_from_csv)."""
+    for batch in iter_students_from_csv(filepath, chunk_size):
+        yield from batch
+
+def read_students_from_csv(filepath: str) -> List[Student]:
+    """Читает данные о студентах из CSV-файла."""
+    students = []
+    try:
+        for batch in iter_students_from_csv(filepath):
+            students.extend(batch)
+    except FileProcessingError:
+        raise
     except Exception as e:
         raise FileProcessingError(f"Не удалось прочитать файл {filepath}: {e}")
 
     return students
 
-def process_row(row: List[str], line_num: int, students: List[Student]):
-    """Обрабатывает одну строку из CSV и добавляет студента в список."""
+def is_header_row(row: List[str]) -> bool:
+    """Первая строка файла может быть заголовком (id, name, grade1, ...)."""
+    return bool(row) and 'id' in row[0].lower()
+
+def parse_row(row: List[str], line_num: int) -> Optional[Student]:
+    """Разбирает одну строку из CSV. Для пустой строки возвращает None."""
     if not row or not row[0].strip():
-        return
+        return None
 
     try:
         student_id = int(row[0])
         name = row[1]
         grades = [int(grade) for grade in row[2:] if grade.strip()]
-        students.append(Student(student_id, name, grades))
+        return Student(student_id, name, grades)
     except (ValueError, IndexError) as e:
         raise DataValidationError(f"Ошибка в строке {line_num}: {row}. Детали: {e}")
 
-def write_students_to_csv(filepath: str, students: List[Student]):
-    """Записывает данные о студентах в CSV-файл с выравниванием колонок."""
+def process_row(row: List[str], line_num: int, students: List[Student]):
+    """Обрабатывает одну строку из CSV и добавляет студента в список."""
+    student = parse_row(row, line_num)
+    if student is not None:
+        students.append(student)
+
+def write_students_to_csv(filepath: str, students: Iterable[Student]):
+    """
+    Записывает данные о студентах в CSV-файл с выравниванием колонок.
+
+    Число колонок оценок известно только после просмотра всех студентов,
+    поэтому одноразовый итератор (генератор, потоковое чтение) сначала
+    сохраняется в список.
+    """
+    if isinstance(students, Iterator):
+        students = list(students)
     try:
         with open(filepath, mode='w', encoding='utf-8', newline='') as file:
             writer = csv.writer(file)
 
-            max_grades = max((len(s.grades) for s in students), default=0)
+            max_grades = max((s.grades_count for s in students), default=0)
             header = ['id', 'name'] + [f'grade{i+1}' for i in range(max_grades)]
             writer.writerow(header)
 
             for s in students:
                 row = [s.id, s.name] + s.grades
-                row.extend([''] * (max_grades - len(s.grades)))
+                row.extend([''] * (max_grades - s.grades_count))
                 writer.writerow(row)
     except IOError as e:
         raise FileProcessingError(f"Ошибка записи в файл {filepath}: {e}")
+    # Файл записан целиком: старый журнал относится к прежнему содержимому
+    discard_journal(filepath)
 
 def export_top_n_to_csv(filepath: str, students: List[Student]):
     """Экспортирует ТОП-N студентов в отдельный CSV-файл."""
     try:
         with open(filepath, mode='w', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['id', 'name', 'average', 'grades'])
-
-            for s in students:
-                grades_str = " ".join(map(str, s.grades))
-                writer.writerow([s.id, s.name, f"{s.average:.2f}", grades_str])
+            write_students_report(file, students)
     except IOError as e:
         raise FileProcessingError(f"Ошибка экспорта в файл {filepath}: {e}")
+
+def write_students_report(file: TextIO, students: Iterable[Student]):
+    """Пишет студентов в поток в формате отчета: id, name, average, grades."""
+    writer = csv.writer(file)
+    writer.writerow(['id', 'name', 'average', 'grades'])
+    writer.writerows(
+        [s.id, s.name, f"{s.average:.2f}", " ".join(map(str, s.grades))]
+        for s in students
+    )
+
+
+# --- Бинарный снимок ростера ---
+#
+# Формат (все числа little-endian):
+#   заголовок      MAGIC, версия, резерв, число студентов, размер имен, размер оценок
+#   ids            int64  x count
+#   name_offsets   uint64 x (count + 1)  - границы имен (в символах) в блоке имен
+#   grade_offsets  uint64 x (count + 1)  - границы оценок в блоке оценок
+#   names          UTF-8 имена подряд
+#   grades         uint8 оценки подряд
+#
+# Загрузка читает таблицы целиком через mmap без разбора строк и
+# проверки каждой оценки по отдельности.
+
+SNAPSHOT_MAGIC = b'STSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXT = '.snap'
+_HEADER = struct.Struct('<4sHHQQQ')
+
+def _to_le(arr: array) -> array:
+    """Приводит массив к little-endian (на big-endian платформах)."""
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+def save_snapshot(filepath: str, students: Iterable[Student]):
+    """Сохраняет студентов в бинарный снимок. students обходится один раз."""
+    ids = array('q')
+    name_offsets = array('Q', [0])
+    grade_offsets = array('Q', [0])
+    names: List[str] = []
+    names_len = 0
+    grades = bytearray()
+
+    for s in students:
+        ids.append(s.id)
+        names.append(s.name)
+        names_len += len(s.name)
+        grades += s.grades_bytes
+        name_offsets.append(names_len)
+        grade_offsets.append(len(grades))
+
+    names_blob = ''.join(names).encode('utf-8')
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(ids), len(names_blob), len(grades))
+    try:
+        with open(filepath, mode='wb') as file:
+            file.write(header)
+            for table in (ids, name_offsets, grade_offsets):
+                _to_le(table).tofile(file)
+            file.write(names_blob)
+            file.write(grades)
+    except IOError as e:
+        raise FileProcessingError(f"Ошибка записи снимка {filepath}: {e}")
+
+def load_snapshot(filepath: str) -> List[Student]:
+    """Загружает студентов из бинарного снимка."""
+    try:
+        with open(filepath, mode='rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _parse_snapshot(mm, filepath)
+    except FileNotFoundError:
+        raise FileProcessingError(f"Файл не найден по пути: {filepath}")
+    except (OSError, ValueError) as e:
+        # mmap не умеет отображать пустые файлы и выбрасывает ValueError
+        raise FileProcessingError(f"Не удалось прочитать снимок {filepath}: {e}")
+
+def _parse_snapshot(buf: mmap.mmap, filepath: str) -> List[Student]:
+    if len(buf) < _HEADER.size:
+        raise DataValidationError(f"Файл {filepath} не является снимком: слишком короткий.")
+    magic, version, _, count, names_size, grades_size = _HEADER.unpack_from(buf, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise DataValidationError(f"Файл {filepath} не является снимком ростера.")
+    if version != SNAPSHOT_VERSION:
+        raise DataValidationError(f"Неподдерживаемая версия снимка {version} в файле {filepath}.")
+
+    expected = _HEADER.size + 8 * (3 * count + 2) + names_size + grades_size
+    if len(buf) != expected:
+        raise DataValidationError(f"Снимок {filepath} поврежден: ожидалось {expected} байт, получено {len(buf)}.")
+
+    pos = _HEADER.size
+
+    def read_table(typecode: str, length: int) -> array:
+        nonlocal pos
+        table = array(typecode)
+        table.frombytes(buf[pos:pos + 8 * length])
+        pos += 8 * length
+        return _to_le(table)
+
+    ids = read_table('q', count)
+    name_offsets = read_table('Q', count + 1)
+    grade_offsets = read_table('Q', count + 1)
+    names = buf[pos:pos + names_size]
+    grades = buf[pos + names_size:pos + names_size + grades_size]
+
+    # Проверяем весь буфер разом вместо проверки каждой оценки в Student.__init__
+    if count and (min(ids) <= 0 or (grades and max(grades) > 100)):
+        raise DataValidationError(f"Снимок {filepath} содержит недопустимые ID или оценки.")
+
+    # Имена декодируются одним вызовом, границы в таблице заданы в символах
+    try:
+        text = names.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise DataValidationError(f"Снимок {filepath} поврежден: имена не в UTF-8 ({e}).")
+    n_off = name_offsets.tolist()
+    g_off = grade_offsets.tolist()
+    _check_offsets(n_off, len(text), "имен", filepath)
+    _check_offsets(g_off, grades_size, "оценок", filepath)
+    student_names = [text[a:b] for a, b in zip(n_off, n_off[1:])]
+    if not all(map(str.strip, student_names)):
+        raise DataValidationError(f"Снимок {filepath} содержит пустые имена студентов.")
+
+    # Массовое создание объектов без циклических ссылок: сборщик мусора
+    # на это время отключаем, иначе он многократно обходит растущий список
+    from_packed = Student.from_packed
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [
+            from_packed(student_id, name, array('B', grades[a:b]))
+            for student_id, name, a, b in zip(ids.tolist(), student_names, g_off, g_off[1:])
+        ]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def _check_offsets(offsets: List[int], size: int, what: str, filepath: str):
+    """
+    Границы должны начинаться с 0, не убывать и заканчиваться ровно на размере
+    блока, иначе срезы молча вернут чужие данные. sorted() по уже
+    упорядоченному списку проходит его один раз на C.
+    """
+    if offsets[0] != 0 or offsets[-1] != size or offsets != sorted(offsets):
+        raise DataValidationError(f"Снимок {filepath} поврежден: неверная таблица границ {what}.")
+
+def convert_csv_to_snapshot(csv_path: str, snapshot_path: str):
+    """Конвертирует CSV в бинарный снимок потоково, не держа весь ростер в памяти."""
+    save_snapshot(snapshot_path, iter_students(csv_path))
+
+def convert_snapshot_to_csv(snapshot_path: str, csv_path: str):
+    """Конвертирует бинарный снимок обратно в CSV."""
+    write_students_to_csv(csv_path, load_snapshot(snapshot_path))
+
+def load_students(filepath: str) -> List[Student]:
+    """Загружает студентов из снимка (*.snap) или из CSV-файла."""
+    if str(filepath).lower().endswith(SNAPSHOT_EXT):
+        return load_snapshot(filepath)
+    return read_students_from_csv(filepath)
+
+def save_students(filepath: str, students: Iterable[Student]):
+    """Сохраняет студентов в снимок (*.snap) или в CSV-файл."""
+    if str(filepath).lower().endswith(SNAPSHOT_EXT):
+        save_snapshot(filepath, students)
+    else:
+        write_students_to_csv(filepath, students)
+
+
+# --- Журнал изменений для CSV ---
+#
+# Рядом с CSV-файлом хранится журнал <файл>.journal: по строке CSV на каждое
+# изменение после последней полной записи:
+#   A,id,name,grade1,...   - добавление студента
+#   U,id,grade1,...        - новые оценки
+#   D,id                   - удаление
+# Сохранение небольшого изменения дописывает несколько строк в журнал (O(изменений)).
+# Когда журнал становится слишком большим, он сворачивается обратно в CSV.
+# Любая полная запись CSV (write_students_to_csv) удаляет журнал.
+# Все чтения CSV по пути (iter_students_from_csv и функции поверх него)
+# применяют журнал, поэтому видят ростер с последними сохраненными правками.
+
+JOURNAL_SUFFIX = '.journal'
+# Журнал сворачивается, когда его размер превышает эту долю от размера CSV
+COMPACT_RATIO = 0.5
+
+def journal_path(filepath: str) -> str:
+    """Путь к журналу изменений для CSV-файла."""
+    return str(filepath) + JOURNAL_SUFFIX
+
+def discard_journal(filepath: str):
+    """Удаляет журнал файла, если он есть (после полной перезаписи CSV)."""
+    try:
+        os.remove(journal_path(filepath))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        raise FileProcessingError(f"Не удалось удалить журнал {journal_path(filepath)}: {e}")
+
+def _same_file(a: Optional[str], b: str) -> bool:
+    return a is not None and os.path.abspath(a) == os.path.abspath(str(b))
+
+def append_journal(filepath: str, registry: StudentRegistry):
+    """Дописывает несохраненные изменения реестра в журнал файла."""
+    try:
+        with open(journal_path(filepath), mode='a', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            for op, student_id, student in registry.changes:
+                if op == 'A':
+                    writer.writerow(['A', student.id, student.name] + student.grades)
+                elif op == 'U':
+                    writer.writerow(['U', student_id] + student.grades)
+                else:
+                    writer.writerow(['D', student_id])
+    except IOError as e:
+        raise FileProcessingError(f"Ошибка записи журнала {journal_path(filepath)}: {e}")
+
+class JournalOverlay:
+    """
+    Итог журнала относительно CSV-файла, чтобы применять его при потоковом чтении.
+
+    removed  - ID строк CSV, которых больше нет на своем месте (удалены или добавлены заново);
+    updated  - ID -> новые оценки для строк CSV, оставшихся на месте;
+    appended - ID -> студенты, добавленные журналом, в порядке обхода реестра.
+
+    Порядок результата совпадает с тем, что дало бы выполнение тех же
+    add/remove/update_grades над StudentRegistry: повторное добавление ID
+    переносит студента в конец. Изменение и удаление отсутствующего ID
+    ничего не делают, поэтому журнал, оставшийся после свертывания, безопасен.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.removed: set = set()
+        self.updated: Dict[int, List[int]] = {}
+        self.appended: Dict[int, Student] = {}
+
+    def record(self, op: str, student_id: int, fields: List[str]):
+        """Учитывает одну запись журнала (поля - остаток строки после ID)."""
+        if op == 'A':
+            self.removed.add(student_id)
+            self.updated.pop(student_id, None)
+            self.appended.pop(student_id, None)
+            self.appended[student_id] = Student(student_id, fields[0], [int(g) for g in fields[1:]])
+        elif op == 'U':
+            grades = [int(g) for g in fields]
+            if student_id in self.appended:
+                self.appended[student_id].grades = grades
+            elif student_id not in self.removed:
+                self.updated[student_id] = grades
+        elif op == 'D':
+            self.removed.add(student_id)
+            self.updated.pop(student_id, None)
+            self.appended.pop(student_id, None)
+        else:
+            raise ValueError(f"неизвестная операция '{op}'")
+
+    def apply(self, students: Iterable[Student]) -> Iterator[Student]:
+        """Отдает студентов из CSV с учетом удалений и новых оценок (без добавленных)."""
+        removed, updated = self.removed, self.updated
+        for student in students:
+            if student.id in removed:
+                continue
+            grades = updated.get(student.id)
+            if grades is not None:
+                try:
+                    student.grades = grades
+                except ValueError as e:
+                    raise DataValidationError(f"Ошибка в журнале {self.path}, ID {student.id}: {e}")
+            yield student
+
+def read_journal(filepath: str) -> Optional[JournalOverlay]:
+    """Читает журнал CSV-файла. Возвращает None, если журнала нет."""
+    path = journal_path(filepath)
+    overlay = JournalOverlay(path)
+    try:
+        with open(path, mode='r', encoding='utf-8', newline='') as file:
+            for line_num, row in enumerate(csv.reader(file), start=1):
+                if not row:
+                    continue
+                try:
+                    overlay.record(row[0], int(row[1]), row[2:])
+                except (ValueError, IndexError, StudentAppError) as e:
+                    raise DataValidationError(f"Ошибка в журнале {path}, строка {line_num}: {row}. Детали: {e}")
+    except FileNotFoundError:
+        return None
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        raise FileProcessingError(f"Не удалось прочитать журнал {path}: {e}")
+    return overlay
+
+def compact_journal(filepath: str, registry: StudentRegistry):
+    """Полностью перезаписывает CSV из реестра и удаляет журнал."""
+    tmp_path = str(filepath) + '.tmp'
+    write_students_to_csv(tmp_path, registry)
+    # Сначала атомарно подменяем CSV, затем удаляем журнал: если работа прервется
+    # между этими шагами, повторное применение журнала ничего не испортит
+    os.replace(tmp_path, filepath)
+    discard_journal(filepath)
+    registry.mark_saved(str(filepath))
+
+def load_registry(filepath: str) -> StudentRegistry:
+    """Загружает ростер в реестр (журнал изменений CSV-файла применяется при чтении)."""
+    registry = StudentRegistry(load_students(filepath))
+    registry.mark_saved(str(filepath))
+    return registry
+
+def save_registry(filepath: str, registry: StudentRegistry) -> bool:
+    """
+    Сохраняет реестр, по возможности дописывая только изменения в журнал.
+
+    Полная запись выполняется, если реестр загружен из другого файла, файл
+    является снимком или журнал вырос больше COMPACT_RATIO от размера CSV.
+    Возвращает True, если файл был перезаписан целиком.
+    """
+    is_snapshot = str(filepath).lower().endswith(SNAPSHOT_EXT)
+    if is_snapshot or not _same_file(registry.source, filepath) or not os.path.exists(filepath):
+        if is_snapshot:
+            save_snapshot(filepath, registry)
+            registry.mark_saved(str(filepath))
+        else:
+            compact_journal(filepath, registry)
+        return True
+
+    if registry.changes:
+        append_journal(filepath, registry)
+        registry.mark_saved(str(filepath))
+
+    journal = journal_path(filepath)
+    if os.path.exists(journal) and os.path.getsize(journal) > COMPACT_RATIO * max(os.path.getsize(filepath), 1):
+        compact_journal(filepath, registry)
+        return True
+    return False
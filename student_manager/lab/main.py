@@ -3,7 +3,6 @@
 import sys
 import os
 import traceback
-from typing import List
 
 if getattr(sys, 'frozen', False):
     base_path = sys._MEIPASS
@@ -15,25 +14,28 @@ if base_path not in sys.path:
 
 try:
     # 1. Попытка относительного импорта (Для pytest и запуска через python -m lab.main)
-    from . import io_utils, processing, errors
-    from .models import Student
+    from . import io_utils, processing, errors, storage, batch
+    from .models import StudentRegistry
 except (ImportError, ValueError):
     # 2. Попытка прямого импорта (Для EXE и запуска через python lab/main.py)
     import io_utils
     import processing
     import errors
-    from models import Student
+    import storage
+    import batch
+    from models import StudentRegistry
 # -------------------------
 
-students_data: List[Student] = []
+# Ростер в памяти (StudentRegistry) или база SQLite (SQLiteStudentStore)
+students_data: processing.Students = StudentRegistry()
 
 def print_menu():
     """Выводит на экран главное меню."""
     print("\n" + "="*30)
     print("      МЕНЮ УПРАВЛЕНИЯ")
     print("="*30)
-    print("1. Загрузить студентов из CSV")
-    print("2. Сохранить студентов в CSV")
+    print("1. Загрузить студентов из CSV, снимка (.snap) или базы (.db)")
+    print("2. Сохранить студентов в CSV, снимок (.snap) или базу (.db)")
     print("3. Показать всех студентов")
     print("4. Добавить нового студента")
     print("5. Удалить студента по ID")
@@ -44,6 +46,22 @@ def print_menu():
     print("0. Выход")
     print("="*30)
 
+def print_students(students, chunk_size: int = 10_000):
+    """Выводит студентов крупными блоками вместо отдельного print на каждую строку."""
+    chunk = []
+    for s in students:
+        chunk.append(str(s))
+        if len(chunk) >= chunk_size:
+            sys.stdout.write("\n".join(chunk) + "\n")
+            chunk = []
+    if chunk:
+        sys.stdout.write("\n".join(chunk) + "\n")
+
+def close_students_data():
+    """Закрывает соединение с базой, если ростер загружен из SQLite."""
+    if isinstance(students_data, storage.SQLiteStudentStore):
+        students_data.close()
+
 def main_cli():
     """Основной цикл консольного приложения."""
     global students_data
@@ -56,7 +74,14 @@ def main_cli():
             if choice == '1':
                 filepath = input("Введите путь к файлу для загрузки (e.g., data/students.csv): ")
                 filepath = filepath.strip('"').strip("'")
-                students_data = io_utils.read_students_from_csv(filepath)
+                if storage.is_sqlite_path(filepath):
+                    # Изменения в базе сохраняются сразу, пункт 2 для нее не нужен
+                    loaded = storage.SQLiteStudentStore(filepath)
+                else:
+                    loaded = io_utils.load_registry(filepath)
+                # Прежняя база больше не нужна; если загрузка не удалась, она остается открытой
+                close_students_data()
+                students_data = loaded
                 print(f"✅ Успешно загружено {len(students_data)} студентов.")
 
             elif choice == '2':
@@ -65,7 +90,16 @@ def main_cli():
                     continue
                 filepath = input("Введите путь к файлу для сохранения: ")
                 filepath = filepath.strip('"').strip("'")
-                io_utils.write_students_to_csv(filepath, students_data)
+                if storage.is_sqlite_path(filepath):
+                    if getattr(students_data, 'filepath', None) == filepath:
+                        print(f"ℹ️ Все изменения уже сохранены в базе {filepath}.")
+                        continue
+                    storage.export_to_sqlite(filepath, students_data)
+                elif isinstance(students_data, StudentRegistry):
+                    # Небольшие изменения дописываются в журнал, а не переписывают весь файл
+                    io_utils.save_registry(filepath, students_data)
+                else:
+                    io_utils.save_students(filepath, students_data)
                 print(f"✅ Данные успешно сохранены в {filepath}.")
 
             elif choice == '3':
@@ -73,8 +107,7 @@ def main_cli():
                     print("ℹ️ Список студентов пуст.")
                 else:
                     print("\n--- Список всех студентов ---")
-                    for s in students_data:
-                        print(s)
+                    print_students(students_data)
 
             elif choice == '4':
                 try:
@@ -113,6 +146,8 @@ def main_cli():
                     print("\n--- Статистика по группе ---")
                     print(f"Всего студентов: {stats['total_students']}")
                     print(f"Общий средний балл: {stats['overall_average']:.2f}")
+                    print(f"Медиана оценок: {stats['median_grade']:.1f}")
+                    print(f"Стандартное отклонение: {stats['stddev']:.2f}")
                     print(f"Лучший студент: {stats['best_student'].name} (ср. балл: {stats['best_student'].average:.2f})")
                     print(f"Худший студент: {stats['worst_student'].name} (ср. балл: {stats['worst_student'].average:.2f})")
 
@@ -132,12 +167,12 @@ def main_cli():
                 try:
                     sorted_list = processing.sort_students(students_data, sort_key)
                     print(f"\n--- Студенты, отсортированные по '{sort_key}' ---")
-                    for s in sorted_list:
-                        print(s)
+                    print_students(sorted_list)
                 except ValueError as ve:
                     print(f"❌ Ошибка сортировки: {ve}")
 
             elif choice == '0':
+                close_students_data()
                 print("👋 До свидания!")
                 break
 
@@ -150,6 +185,10 @@ def main_cli():
             print(f"❌ Произошла непредвиденная ошибка: {e}")
 
 if __name__ == '__main__':
+    # С аргументами - пакетный режим без меню и ожидания ввода (для скриптов и конвейеров)
+    if len(sys.argv) > 1:
+        sys.exit(batch.main(sys.argv[1:]))
+
     try:
         main_cli()
     except KeyboardInterrupt:
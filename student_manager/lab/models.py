@@ -1,34 +1,143 @@
 # lab/models.py
 """Модуль, определяющий основные модели данных, такие как Student."""
-from typing import List
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from .errors import StudentNotFoundError, DuplicateStudentIdError
+except (ImportError, ValueError):
+    from errors import StudentNotFoundError, DuplicateStudentIdError
+
+class GradesView(Sequence):
+    """
+    Оценки студента только для чтения: обертка над его array('B') без копирования.
+
+    Сравнивается со списками и складывается с ними как список, но методов
+    изменения (append, [i] = ...) нет - изменить оценки можно только
+    присваиванием s.grades = [...]. Копию-список дает tolist().
+    """
+    __slots__ = ('_data',)
+
+    def __init__(self, data: array):
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, index):
+        item = self._data[index]
+        return item.tolist() if isinstance(index, slice) else item
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._data)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, GradesView):
+            other = other._data
+        if isinstance(other, (list, tuple, array)):
+            return len(other) == len(self._data) and all(a == b for a, b in zip(self._data, other))
+        return NotImplemented
+
+    def __add__(self, other) -> List[int]:
+        return self._data.tolist() + list(other)
+
+    def __radd__(self, other) -> List[int]:
+        return list(other) + self._data.tolist()
+
+    def tolist(self) -> List[int]:
+        return self._data.tolist()
+
+    def __repr__(self) -> str:
+        return repr(self._data.tolist())
+
+def _validated_grades(grades: Iterable[int]) -> array:
+    """Проверяет оценки и упаковывает их в компактный массив байтов."""
+    if isinstance(grades, GradesView):
+        # Уже проверены, когда попали в другого студента
+        return array('B', grades._data)
+    if not isinstance(grades, (list, tuple, array)):
+        grades = list(grades)
+    # Мы не фильтруем оценки, а проверяем их. Если хоть одна плохая - ошибка.
+    for grade in grades:
+        if not isinstance(grade, int):
+            raise ValueError(f"Оценка '{grade}' должна быть целым числом.")
+        if grade < 0 or grade > 100:
+            raise ValueError(f"Оценка {grade} недопустима. Разрешен диапазон 0-100.")
+    return array('B', grades)
 
 class Student:
-    """Представляет студента с его ID, именем и оценками."""
+    """
+    Представляет студента с его ID, именем и оценками.
+
+    Объект хранит поля в __slots__ (без __dict__), а оценки - в array('B')
+    по одному байту на оценку. Средний балл вычисляется один раз и
+    сбрасывается только при присваивании новых оценок.
+    """
+    __slots__ = ('id', 'name', '_grades', '_average')
+
     def __init__(self, student_id: int, name: str, grades: List[int]):
         if not isinstance(student_id, int) or student_id <= 0:
             raise ValueError("ID студента должен быть положительным целым числом.")
         if not name or not isinstance(name, str) or not name.strip():
             raise ValueError("Имя студента не может быть пустым.")
 
-        # Мы не фильтруем оценки, а проверяем их. Если хоть одна плохая - ошибка.
-        self.grades = []
-        for grade in grades:
-            if not isinstance(grade, int):
-                raise ValueError(f"Оценка '{grade}' должна быть целым числом.")
-            if grade < 0 or grade > 100:
-                raise ValueError(f"Оценка {grade} недопустима. Разрешен диапазон 0-100.")
-            self.grades.append(grade)
-        # ---------------------------
-
+        self.grades = grades
         self.id = student_id
         self.name = name
 
+    @classmethod
+    def from_packed(cls, student_id: int, name: str, grades: array) -> "Student":
+        """
+        Создает студента из уже проверенных данных без поэлементной валидации.
+
+        Используется при загрузке бинарного снимка, где оценки проверяются
+        одним проходом по всему буферу. grades - array('B'), он не копируется.
+        """
+        student = cls.__new__(cls)
+        student.id = student_id
+        student.name = name
+        student._grades = grades
+        student._average = None
+        return student
+
+    @property
+    def grades(self) -> GradesView:
+        """
+        Оценки студента только для чтения (без копирования).
+
+        Чтобы изменить оценки, присвойте новый список (s.grades = [...]),
+        тогда средний балл будет пересчитан. Там, где нужны только сумма
+        или количество, используйте grades_sum и grades_count.
+        """
+        return GradesView(self._grades)
+
+    @grades.setter
+    def grades(self, new_grades: Iterable[int]):
+        self._grades = _validated_grades(new_grades)
+        self._average = None
+
+    @property
+    def grades_count(self) -> int:
+        """Количество оценок без копирования списка."""
+        return len(self._grades)
+
+    @property
+    def grades_sum(self) -> int:
+        """Сумма оценок без копирования списка."""
+        return sum(self._grades)
+
+    @property
+    def grades_bytes(self) -> bytes:
+        """Оценки в упакованном виде: по одному байту на оценку."""
+        return self._grades.tobytes()
+
     @property
     def average(self) -> float:
         """Рассчитывает средний балл студента. Возвращает 0.0, если оценок нет."""
-        if not self.grades:
-            return 0.0
-        return sum(self.grades) / len(self.grades)
+        if self._average is None:
+            grades = self._grades
+            self._average = sum(grades) / len(grades) if grades else 0.0
+        return self._average
 
     def __repr__(self) -> str:
         """Возвращает строковое представление объекта для отладки."""
@@ -36,5 +145,80 @@ class Student:
 
     def __str__(self) -> str:
         """Возвращает удобное для пользователя строковое представление объекта."""
-        grades_str = ", ".join(map(str, self.grades)) if self.grades else "Нет оценок"
+        grades_str = ", ".join(map(str, self._grades)) if self._grades else "Нет оценок"
         return f"ID: {self.id:<3} | Имя: {self.name:<20} | Средний балл: {self.average:<6.2f} | Оценки: [{grades_str}]"
+
+
+class StudentRegistry:
+    """
+    Контейнер студентов с индексом id -> Student.
+
+    Вставка, поиск и удаление выполняются за O(1). Порядок обхода совпадает
+    с порядком добавления (словарь Python сохраняет порядок вставки).
+
+    Реестр запоминает изменения, сделанные через add/remove/update_grades
+    после последнего сохранения, чтобы их можно было дописать в журнал
+    вместо перезаписи всего файла (см. io_utils.save_registry).
+    """
+    def __init__(self, students: Iterable[Student] = ()):
+        self._index: Dict[int, Student] = {}
+        # Изменения после сохранения: (операция 'A'/'U'/'D', ID, студент или None)
+        self._changes: List[Tuple[str, int, Optional[Student]]] = []
+        # Файл, с которым реестр совпадает с учетом журнала
+        self.source: Optional[str] = None
+        for student in students:
+            self.add(student)
+        self._changes.clear()
+
+    def add(self, student: Student) -> Student:
+        """Добавляет студента. Выбрасывает DuplicateStudentIdError, если ID занят."""
+        if student.id in self._index:
+            raise DuplicateStudentIdError(f"Студент с ID {student.id} уже существует.")
+        self._index[student.id] = student
+        self._changes.append(('A', student.id, student))
+        return student
+
+    def get(self, student_id: int) -> Optional[Student]:
+        """Возвращает студента по ID или None."""
+        return self._index.get(student_id)
+
+    def remove(self, student_id: int) -> Student:
+        """Удаляет студента по ID и возвращает его."""
+        try:
+            student = self._index.pop(student_id)
+        except KeyError:
+            raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
+        self._changes.append(('D', student_id, None))
+        return student
+
+    def update_grades(self, student_id: int, new_grades: List[int]) -> Student:
+        """Заменяет оценки студента с заданным ID."""
+        student = self._index.get(student_id)
+        if student is None:
+            raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
+        # Сеттер grades сам проверит оценки и сбросит кэш среднего балла
+        student.grades = new_grades
+        self._changes.append(('U', student_id, student))
+        return student
+
+    @property
+    def changes(self) -> List[Tuple[str, int, Optional[Student]]]:
+        """Изменения, сделанные после последнего сохранения, в порядке выполнения."""
+        return list(self._changes)
+
+    def mark_saved(self, source: Optional[str]):
+        """Отмечает, что реестр сохранен в source, и очищает список изменений."""
+        self.source = source
+        self._changes.clear()
+
+    def __contains__(self, student_id: object) -> bool:
+        return student_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Student]:
+        return iter(self._index.values())
+
+    def __repr__(self) -> str:
+        return f"StudentRegistry(size={len(self._index)})"
@@ -1,19 +1,34 @@
 # lab/processing.py
 """Модуль для обработки данных: сортировка, статистика, управление студентами."""
-from typing import List, Dict, Any, Optional
+import heapq
+import math
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional, Union
 
 try:
     # 1. Относительный импорт (для pytest)
-    from .models import Student
+    from .models import Student, StudentRegistry
+    from .storage import SQLiteStudentStore
     from .errors import StudentNotFoundError, DuplicateStudentIdError
 except (ImportError, ValueError):
     # 2. Прямой импорт (для EXE)
-    from models import Student
+    from models import Student, StudentRegistry
+    from storage import SQLiteStudentStore
     from errors import StudentNotFoundError, DuplicateStudentIdError
 # --------------------------------------------------
 
-def add_student(students: List[Student], student_id: int, name: str, grades: List[int]) -> List[Student]:
+# Функции принимают как обычный список, так и индексированные контейнеры
+# (StudentRegistry в памяти или SQLiteStudentStore на диске).
+# Для них поиск по ID идет через индекс, для списка - линейно.
+Students = Union[List[Student], StudentRegistry, SQLiteStudentStore]
+_INDEXED = (StudentRegistry, SQLiteStudentStore)
+
+def add_student(students: Students, student_id: int, name: str, grades: List[int]) -> Students:
     """Добавляет нового студента в список, проверяя уникальность ID."""
+    if isinstance(students, _INDEXED):
+        students.add(Student(student_id, name, grades))
+        return students
+
     if any(s.id == student_id for s in students):
         raise DuplicateStudentIdError(f"Студент с ID {student_id} уже существует.")
 
@@ -23,8 +38,12 @@ def add_student(students: List[Student], student_id: int, name: str, grades: Lis
     students.append(new_student)
     return students
 
-def remove_student_by_id(students: List[Student], student_id: int) -> List[Student]:
+def remove_student_by_id(students: Students, student_id: int) -> Students:
     """Удаляет студента из списка по его ID."""
+    if isinstance(students, _INDEXED):
+        students.remove(student_id)
+        return students
+
     student_to_remove = next((s for s in students if s.id == student_id), None)
     if not student_to_remove:
         raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
@@ -32,54 +51,136 @@ def remove_student_by_id(students: List[Student], student_id: int) -> List[Stude
     students.remove(student_to_remove)
     return students
 
-def update_student_grades(students: List[Student], student_id: int, new_grades: List[int]) -> Student:
+def update_student_grades(students: Students, student_id: int, new_grades: List[int]) -> Student:
     """Обновляет оценки существующего студента."""
+    if isinstance(students, _INDEXED):
+        return students.update_grades(student_id, new_grades)
+
     student_to_update = next((s for s in students if s.id == student_id), None)
     if not student_to_update:
         raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
 
-    # Валидация новых оценок произойдет здесь вручную, так как мы меняем поле напрямую,
-    # но лучше пересоздать список через валидацию
-    for grade in new_grades:
-        if not isinstance(grade, int) or grade < 0 or grade > 100:
-             raise ValueError(f"Оценка {grade} недопустима. Разрешен диапазон 0-100.")
-
+    # Сеттер grades проверяет оценки (ValueError) и сбрасывает кэш среднего балла
     student_to_update.grades = new_grades
     return student_to_update
 
-def sort_students(students: List[Student], by: str) -> List[Student]:
+def _avg_sort_key(s: Student):
+    """Ключ сортировки 'avg': по убыванию среднего балла, затем по имени."""
+    return (-s.average, s.name)
+
+def sort_students(students: Iterable[Student], by: str) -> List[Student]:
     """Сортирует список студентов по заданному критерию."""
+    if isinstance(students, SQLiteStudentStore):
+        return students.sorted_by(by)
     if by == 'id':
         return sorted(students, key=lambda s: s.id)
     elif by == 'name':
         return sorted(students, key=lambda s: s.name)
     elif by == 'avg':
         # Сортировка по убыванию среднего балла, затем по имени для стабильности
-        return sorted(students, key=lambda s: (-s.average, s.name))
+        return sorted(students, key=_avg_sort_key)
     else:
         raise ValueError("Неверный ключ для сортировки. Доступно: 'id', 'name', 'avg'.")
 
-def get_group_statistics(students: List[Student]) -> Optional[Dict[str, Any]]:
-    """Рассчитывает статистику по группе студентов."""
-    if not students:
-        return None
+class GroupStatsAccumulator:
+    """
+    Однопроходный накопитель статистики по группе.
+
+    Вместо общего списка всех оценок хранится гистограмма (оценка -> количество),
+    которой достаточно для среднего, медианы и стандартного отклонения.
+    Память не зависит от размера группы: оценок всего 101 вариант (0-100).
+    """
+    def __init__(self):
+        self.total_students = 0
+        self.best_student: Optional[Student] = None
+        self.worst_student: Optional[Student] = None
+        self._best_avg = 0.0
+        self._worst_avg = 0.0
+        self._histogram: Counter = Counter()
+        self._grades_count = 0
+        self._grades_total = 0
+
+    def add(self, student: Student):
+        """Учитывает одного студента."""
+        avg = student.average
+        # Строгие сравнения: при равенстве остается первый студент, как у max/min
+        if self.best_student is None or avg > self._best_avg:
+            self.best_student, self._best_avg = student, avg
+        if self.worst_student is None or avg < self._worst_avg:
+            self.worst_student, self._worst_avg = student, avg
+
+        self.total_students += 1
+        self._grades_count += student.grades_count
+        self._grades_total += student.grades_sum
+        # Гистограмма - прямо из упакованных байтов оценок, без списка int
+        self._histogram.update(student.grades_bytes)
+
+    def update(self, students: Iterable[Student]):
+        """Учитывает всех студентов из итерируемого объекта."""
+        for student in students:
+            self.add(student)
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Возвращает словарь со статистикой или None, если студентов не было."""
+        if not self.total_students:
+            return None
+
+        histogram = dict(sorted(self._histogram.items()))
+        count, total = self._grades_count, self._grades_total
+        squares = sum(grade * grade * c for grade, c in histogram.items())
+
+        overall_avg = total / count if count else 0.0
+        # Дисперсия в целых числах, чтобы не терять точность на больших группах
+        stddev = math.sqrt(count * squares - total * total) / count if count else 0.0
+
+        return {
+            "total_students": self.total_students,
+            "overall_average": overall_avg,
+            "best_student": self.best_student,
+            "worst_student": self.worst_student,
+            "median_grade": _histogram_median(histogram, count),
+            "stddev": stddev,
+            "histogram": histogram,
+        }
+
+def _histogram_median(histogram: Dict[int, int], count: int) -> float:
+    """Находит медиану по отсортированной гистограмме оценок."""
+    if not count:
+        return 0.0
 
-    total_students = len(students)
-    all_grades = [grade for s in students for grade in s.grades]
+    # Позиции (с нуля) двух средних элементов; для нечетного count они совпадают
+    lower_pos, upper_pos = (count - 1) // 2, count // 2
+    lower = upper = None
+    seen = 0
+    for grade, c in histogram.items():
+        seen += c
+        if lower is None and seen > lower_pos:
+            lower = grade
+        if seen > upper_pos:
+            upper = grade
+            break
+    return (lower + upper) / 2
 
-    overall_avg = sum(all_grades) / len(all_grades) if all_grades else 0.0
+def get_group_statistics(students: Iterable[Student]) -> Optional[Dict[str, Any]]:
+    """
+    Рассчитывает статистику по группе студентов.
 
-    best_student = max(students, key=lambda s: s.average)
-    worst_student = min(students, key=lambda s: s.average)
+    Данные обходятся один раз, поэтому сюда можно передать поток студентов
+    (например, io_utils.iter_students) без загрузки всего списка в память.
+    Помимо среднего, лучшего и худшего студента возвращает медиану оценок,
+    стандартное отклонение и гистограмму оценок.
+    """
+    accumulator = GroupStatsAccumulator()
+    accumulator.update(students)
+    return accumulator.result()
 
-    return {
-        "total_students": total_students,
-        "overall_average": overall_avg,
-        "best_student": best_student,
-        "worst_student": worst_student,
-    }
+def get_top_n_students(students: Iterable[Student], n: int) -> List[Student]:
+    """
+    Возвращает N лучших студентов по среднему баллу.
 
-def get_top_n_students(students: List[Student], n: int) -> List[Student]:
-    """Возвращает N лучших студентов по среднему баллу."""
-    sorted_by_avg = sort_students(students, 'avg')
-    return sorted_by_avg[:n]
+    Используется куча размера N (O(n log N)) вместо полной сортировки;
+    порядок совпадает с sort_students(..., 'avg')[:n].
+    """
+    if isinstance(students, SQLiteStudentStore):
+        return students.top_n(n)
+    return heapq.nsmallest(n, students, key=_avg_sort_key)
@@ -0,0 +1,191 @@
+# lab/storage.py
+"""Модуль хранилища студентов на SQLite (альтернатива CSV-файлу в памяти)."""
+import sqlite3
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    from .models import Student
+    from .errors import FileProcessingError, StudentNotFoundError, DuplicateStudentIdError
+except (ImportError, ValueError):
+    from models import Student
+    from errors import FileProcessingError, StudentNotFoundError, DuplicateStudentIdError
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# Порядок сортировки совпадает с processing.sort_students;
+# при полном совпадении ключа сохраняется порядок обхода (по ID)
+_ORDER_BY = {
+    'id': "id",
+    'name': "name, id",
+    'avg': "average DESC, name, id",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    id      INTEGER PRIMARY KEY,
+    name    TEXT    NOT NULL,
+    average REAL    NOT NULL,
+    grades  BLOB    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_students_average ON students (average DESC, name);
+CREATE INDEX IF NOT EXISTS idx_students_name ON students (name);
+"""
+
+def is_sqlite_path(filepath: str) -> bool:
+    """Проверяет по расширению, что путь указывает на базу SQLite."""
+    return str(filepath).lower().endswith(SQLITE_EXTENSIONS)
+
+def _row_to_student(row) -> Student:
+    student_id, name, grades = row
+    return Student.from_packed(student_id, name, array('B', grades))
+
+def _student_to_row(s: Student):
+    return (s.id, s.name, s.average, s.grades_bytes)
+
+
+class SQLiteStudentStore:
+    """
+    Ростер, хранящийся в базе SQLite.
+
+    Поддерживает тот же набор операций, что и StudentRegistry (add, get,
+    remove, update_grades, обход), поэтому функции lab.processing работают
+    с ним напрямую. Каждое изменение - запись одной строки; сортировка и
+    ТОП-N выполняются запросами по индексам, весь ростер в память не читается.
+    """
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        try:
+            self._conn = sqlite3.connect(filepath)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            raise FileProcessingError(f"Не удалось открыть базу {filepath}: {e}")
+
+    def close(self):
+        """Закрывает соединение с базой."""
+        self._conn.close()
+
+    def __enter__(self) -> "SQLiteStudentStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Изменение данных ---
+
+    def add(self, student: Student) -> Student:
+        """Добавляет студента. Выбрасывает DuplicateStudentIdError, если ID занят."""
+        try:
+            with self._conn:
+                self._conn.execute("INSERT INTO students VALUES (?, ?, ?, ?)", _student_to_row(student))
+        except sqlite3.IntegrityError:
+            raise DuplicateStudentIdError(f"Студент с ID {student.id} уже существует.")
+        return student
+
+    def import_students(self, students: Iterable[Student], batch_size: int = 10_000) -> int:
+        """
+        Массово добавляет студентов пачками через executemany.
+
+        Импорт идет одной транзакцией: при дубликате ID база не меняется.
+        Возвращает количество добавленных студентов.
+        """
+        try:
+            with self._conn:
+                return self._insert_batches(students, batch_size)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateStudentIdError(f"Импорт отменен, найден повторяющийся ID: {e}")
+
+    def replace_all(self, students: Iterable[Student], batch_size: int = 10_000) -> int:
+        """Заменяет все содержимое базы одной транзакцией."""
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM students")
+                return self._insert_batches(students, batch_size)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateStudentIdError(f"Сохранение отменено, найден повторяющийся ID: {e}")
+
+    def _insert_batches(self, students: Iterable[Student], batch_size: int) -> int:
+        total = 0
+        batch = []
+        for s in students:
+            batch.append(_student_to_row(s))
+            if len(batch) >= batch_size:
+                self._conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?)", batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self._conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?)", batch)
+            total += len(batch)
+        return total
+
+    def remove(self, student_id: int) -> Student:
+        """Удаляет студента по ID и возвращает его."""
+        student = self.get(student_id)
+        if student is None:
+            raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
+        with self._conn:
+            self._conn.execute("DELETE FROM students WHERE id = ?", (student_id,))
+        return student
+
+    def update_grades(self, student_id: int, new_grades: List[int]) -> Student:
+        """Заменяет оценки студента с заданным ID."""
+        student = self.get(student_id)
+        if student is None:
+            raise StudentNotFoundError(f"Студент с ID {student_id} не найден.")
+        # Сеттер grades проверит оценки до записи в базу
+        student.grades = new_grades
+        with self._conn:
+            self._conn.execute(
+                "UPDATE students SET average = ?, grades = ? WHERE id = ?",
+                (student.average, student.grades_bytes, student_id),
+            )
+        return student
+
+    # --- Чтение данных ---
+
+    def get(self, student_id: int) -> Optional[Student]:
+        """Возвращает студента по ID или None."""
+        row = self._conn.execute(
+            "SELECT id, name, grades FROM students WHERE id = ?", (student_id,)
+        ).fetchone()
+        return _row_to_student(row) if row else None
+
+    def sorted_by(self, by: str, limit: Optional[int] = None) -> List[Student]:
+        """Возвращает студентов, отсортированных по 'id', 'name' или 'avg'."""
+        if by not in _ORDER_BY:
+            raise ValueError("Неверный ключ для сортировки. Доступно: 'id', 'name', 'avg'.")
+        query = f"SELECT id, name, grades FROM students ORDER BY {_ORDER_BY[by]}"
+        params = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (max(limit, 0),)
+        return [_row_to_student(row) for row in self._conn.execute(query, params)]
+
+    def top_n(self, n: int) -> List[Student]:
+        """N лучших студентов по среднему баллу (запрос по индексу)."""
+        return self.sorted_by('avg', limit=n)
+
+    def __contains__(self, student_id: object) -> bool:
+        return self._conn.execute("SELECT 1 FROM students WHERE id = ?", (student_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+    def __bool__(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM students LIMIT 1").fetchone() is not None
+
+    def __iter__(self) -> Iterator[Student]:
+        # Курсор отдает строки по мере чтения, ростер не загружается целиком
+        for row in self._conn.execute("SELECT id, name, grades FROM students ORDER BY id"):
+            yield _row_to_student(row)
+
+    def __repr__(self) -> str:
+        return f"SQLiteStudentStore('{self.filepath}')"
+
+
+def export_to_sqlite(filepath: str, students: Iterable[Student]) -> int:
+    """Сохраняет студентов в базу SQLite, заменяя ее содержимое."""
+    with SQLiteStudentStore(filepath) as store:
+        return store.replace_all(students)
@@ -0,0 +1,66 @@
+# tests/test_analytics.py
+import random
+import pytest
+from lab import analytics
+from lab.models import Student
+from lab.processing import sort_students, get_top_n_students
+
+@pytest.fixture
+def random_students():
+    """Ростер со случайными оценками и намеренными совпадениями средних баллов."""
+    rnd = random.Random(42)
+    names = ["Анна", "Борис", "Вера", "Глеб", "Дина"]
+    return [
+        Student(i, rnd.choice(names), [rnd.choice([60, 80, 100]) for _ in range(rnd.randint(0, 5))])
+        for i in range(1, 301)
+    ]
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    """Прогоняет тест на обоих бэкендах."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(analytics, "np", None)
+    return request.param
+
+def test_rank_matches_processing(random_students, backend):
+    assert analytics.rank_students(random_students) == sort_students(random_students, 'avg')
+
+def test_top_n_matches_processing(random_students, backend):
+    for n in (0, 1, 7, 50, 300, 500):
+        assert analytics.get_top_n_students(random_students, n) == get_top_n_students(random_students, n)
+
+def test_percentiles(sample_students, backend):
+    # Средние: 67.5, 84.33, 91.67
+    result = analytics.average_percentiles(sample_students, [0, 50, 100])
+    assert result == [67.5, sample_students[0].average, sample_students[1].average]
+    assert analytics.average_percentiles([], [50]) == []
+
+def test_column_statistics(sample_students, backend):
+    stats = analytics.column_statistics(sample_students)
+    assert [c["count"] for c in stats] == [3, 3, 2]
+    assert stats[0] == {"column": 1, "count": 3, "average": (78 + 92 + 65) / 3, "min": 65, "max": 92}
+    assert stats[2]["average"] == 92.5
+
+def test_backends_agree(random_students):
+    pytest.importorskip("numpy")
+    matrix = analytics.GradeMatrix(random_students)
+    assert matrix.averages.tolist() == [s.average for s in random_students]
+    assert matrix.column_statistics() == analytics._column_statistics_py(random_students)
+
+    qs = [0, 10, 25, 50, 75, 90, 100]
+    expected = [analytics._percentile(sorted(s.average for s in random_students), q) for q in qs]
+    assert matrix.percentiles(qs) == pytest.approx(expected)
+
+def test_matrix_reused_across_queries(random_students):
+    pytest.importorskip("numpy")
+    matrix = analytics.GradeMatrix(random_students)
+    assert [list(row[:count]) for row, count in zip(matrix.grades, matrix.counts)] == [list(s.grades) for s in random_students]
+    assert not matrix.grades[~matrix.mask].any()
+
+    assert analytics.rank_students(matrix) == sort_students(random_students, 'avg')
+    assert analytics.get_top_n_students(matrix, 7) == get_top_n_students(random_students, 7)
+    assert analytics.average_percentiles(matrix, [50]) == analytics.average_percentiles(random_students, [50])
+    assert analytics.column_statistics(matrix) == analytics._column_statistics_py(random_students)
+    assert len(analytics.GradeMatrix([])) == 0 and analytics.GradeMatrix([]).grades.shape == (0, 0)
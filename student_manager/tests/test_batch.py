@@ -0,0 +1,94 @@
+# tests/test_batch.py
+import io
+import json
+import pytest
+from lab import batch, storage
+from lab.io_utils import write_students_to_csv, load_snapshot, read_students_from_csv, load_registry, save_registry
+
+@pytest.fixture
+def csv_file(tmp_path, sample_students):
+    path = tmp_path / "students.csv"
+    write_students_to_csv(path, sample_students)
+    return str(path)
+
+def test_batch_stats_json(csv_file, capsys):
+    assert batch.main(["stats", csv_file, "--format", "json"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["total_students"] == 3
+    assert stats["best_student_id"] == 3
+    assert stats["worst_student_id"] == 2
+
+def test_batch_top_csv_to_file(csv_file, tmp_path):
+    out = tmp_path / "top.csv"
+    assert batch.main(["top", csv_file, "-n", "2", "-o", str(out)]) == 0
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "id,name,average,grades"
+    assert [line.split(",")[0] for line in lines[1:]] == ["3", "1"]
+
+def test_batch_sort_from_stdin(csv_file, monkeypatch, capsys):
+    with open(csv_file, encoding="utf-8") as f:
+        monkeypatch.setattr("sys.stdin", io.StringIO(f.read()))
+    assert batch.main(["sort", "-", "--by", "avg", "--format", "json"]) == 0
+    assert [s["id"] for s in json.loads(capsys.readouterr().out)] == [3, 1, 2]
+
+def test_batch_export_and_errors(csv_file, tmp_path, capsys):
+    snap = tmp_path / "students.snap"
+    assert batch.main(["export", csv_file, "-o", str(snap)]) == 0
+    assert [s.id for s in load_snapshot(snap)] == [1, 3, 2]
+
+    assert batch.main(["stats", str(tmp_path / "missing.csv")]) == 1
+    assert "не найден" in capsys.readouterr().err
+
+def test_batch_export_csv_to_csv(csv_file, tmp_path, sample_students):
+    out = tmp_path / "copy.csv"
+    assert batch.main(["export", csv_file, "-o", str(out)]) == 0
+    copied = read_students_from_csv(out)
+    assert [(s.id, s.name, s.grades) for s in copied] == [(s.id, s.name, s.grades) for s in sample_students]
+
+def test_batch_export_stdin_to_csv(csv_file, tmp_path, monkeypatch):
+    with open(csv_file, encoding="utf-8") as f:
+        monkeypatch.setattr("sys.stdin", io.StringIO(f.read()))
+    out = tmp_path / "from_stdin.csv"
+    assert batch.main(["export", "-", "-o", str(out)]) == 0
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 4
+    assert [s.id for s in read_students_from_csv(out)] == [1, 3, 2]
+
+def test_batch_closes_sqlite_store(csv_file, tmp_path, monkeypatch, capsys):
+    db = tmp_path / "students.db"
+    assert batch.main(["export", csv_file, "-o", str(db)]) == 0
+
+    closed = []
+    close = storage.SQLiteStudentStore.close
+    monkeypatch.setattr(storage.SQLiteStudentStore, "close", lambda self: closed.append(self) or close(self))
+    assert batch.main(["sort", str(db), "--by", "avg", "--format", "json"]) == 0
+    assert [s["id"] for s in json.loads(capsys.readouterr().out)] == [3, 1, 2]
+    assert batch.main(["stats", str(db)]) == 0
+    assert len(closed) == 2
+
+def test_batch_reads_csv_journal(csv_file, capsys):
+    """Правки, сохраненные из меню в журнал, видны пакетным командам."""
+    registry = load_registry(csv_file)
+    registry.remove(2)
+    registry.update_grades(1, [100])
+    assert save_registry(csv_file, registry) is False
+
+    assert batch.main(["stats", csv_file, "--format", "json"]) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["total_students"] == 2 and stats["worst_student_id"] == 3
+    assert batch.main(["sort", csv_file, "--by", "id", "--format", "json"]) == 0
+    assert [(s["id"], s["grades"]) for s in json.loads(capsys.readouterr().out)] == [(1, [100]), (3, [92, 88, 95])]
+
+def test_batch_failure_keeps_output_file(csv_file, tmp_path):
+    out = tmp_path / "stats.csv"
+    assert batch.main(["stats", csv_file, "-o", str(out)]) == 0
+    before = out.read_text(encoding="utf-8")
+
+    # Ошибка чтения и пустой список не должны затирать прежний результат
+    assert batch.main(["stats", str(tmp_path / "missing.csv"), "-o", str(out)]) == 1
+    empty = tmp_path / "empty.csv"
+    empty.write_text("id,name\n", encoding="utf-8")
+    assert batch.main(["stats", str(empty), "-o", str(out)]) == 1
+    assert out.read_text(encoding="utf-8") == before
+    assert batch.main(["top", str(tmp_path / "missing.csv"), "-o", str(tmp_path / "new.csv")]) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["empty.csv", "stats.csv", "students.csv"]
@@ -0,0 +1,38 @@
+# tests/test_ingest.py
+import pytest
+from lab.ingest import ingest_csv_files
+from lab.io_utils import write_students_to_csv
+from lab.models import Student
+from lab.errors import DataValidationError, DuplicateStudentIdError
+
+@pytest.fixture
+def class_files(tmp_path):
+    """Три файла классов: два корректных (с общим ID 5) и один с ошибками."""
+    first = tmp_path / "class_a.csv"
+    second = tmp_path / "class_b.csv"
+    broken = tmp_path / "class_c.csv"
+    write_students_to_csv(first, [Student(1, "Анна", [90]), Student(5, "Борис", [70, 80])])
+    write_students_to_csv(second, [Student(5, "Повтор", [10]), Student(7, "Вера", [])])
+    broken.write_text("id,name,grade1\n8,Глеб,abc\n9,Дина,200\n10,Егор,50\n", encoding="utf-8")
+    return [str(first), str(second), str(broken)]
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest_merges_files(class_files, workers):
+    report = ingest_csv_files(class_files, max_workers=workers)
+
+    assert [(s.id, s.name) for s in report.students] == [(1, "Анна"), (5, "Борис"), (7, "Вера")]
+    assert report.duplicates == {5: [class_files[0], class_files[1]]}
+    # Обе ошибки файла собраны, файл целиком не загружен
+    assert len(report.errors[class_files[2]]) == 2
+    assert report.files_loaded == 2 and report.files_total == 3
+    assert not report.ok
+
+def test_ingest_raise_for_errors(class_files, tmp_path):
+    with pytest.raises(DataValidationError):
+        ingest_csv_files(class_files, max_workers=1).raise_for_errors()
+
+    with pytest.raises(DuplicateStudentIdError):
+        ingest_csv_files(class_files[:2], max_workers=1).raise_for_errors()
+
+    missing = ingest_csv_files([str(tmp_path / "nope.csv")])
+    assert "не найден" in missing.errors[str(tmp_path / "nope.csv")][0]
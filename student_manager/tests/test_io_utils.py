@@ -1,5 +1,15 @@
 # tests/test_io_utils.py
-from lab.io_utils import write_students_to_csv, read_students_from_csv
+import struct
+
+import pytest
+from lab.io_utils import write_students_to_csv, read_students_from_csv, iter_students_from_csv, iter_students
+from lab.io_utils import save_snapshot, load_snapshot, load_students, _HEADER
+from lab.io_utils import convert_csv_to_snapshot, convert_snapshot_to_csv
+from lab.errors import DataValidationError, FileProcessingError
+from lab.io_utils import load_registry, save_registry, journal_path, save_students
+from lab.ingest import ingest_csv_files
+from lab.models import Student, StudentRegistry
+from lab.processing import get_group_statistics, get_top_n_students
 
 def test_csv_roundtrip(sample_students, tmp_path):
     """Тестирует полный цикл: запись в CSV и чтение обратно."""
@@ -22,3 +32,195 @@ def test_csv_roundtrip(sample_students, tmp_path):
         assert original.id == read.id
         assert original.name == read.name
         assert original.grades == read.grades
+
+def test_iter_students_from_csv_chunks(sample_students, tmp_path):
+    """Потоковое чтение отдает пачки не больше chunk_size."""
+    filepath = tmp_path / "test.csv"
+    write_students_to_csv(filepath, sample_students)
+
+    batches = list(iter_students_from_csv(filepath, chunk_size=2))
+    assert [len(b) for b in batches] == [2, 1]
+    assert [s.id for b in batches for s in b] == [s.id for s in sample_students]
+
+def test_iter_students_from_csv_reports_line(tmp_path):
+    """Ошибка в данных сообщает номер строки файла."""
+    filepath = tmp_path / "bad.csv"
+    filepath.write_text("id,name,grade1\n1,Иванов,90\n2,Петров,abc\n", encoding="utf-8")
+
+    with pytest.raises(DataValidationError, match="строке 3"):
+        list(iter_students_from_csv(filepath, chunk_size=1))
+
+def test_statistics_and_top_from_stream(sample_students, tmp_path):
+    """Статистика и ТОП-N считаются по потоку без загрузки всего списка."""
+    filepath = tmp_path / "test.csv"
+    write_students_to_csv(filepath, sample_students)
+
+    stats = get_group_statistics(iter_students(filepath, chunk_size=1))
+    assert stats["total_students"] == 3
+    assert stats["overall_average"] == get_group_statistics(sample_students)["overall_average"]
+    assert stats["best_student"].id == 3
+    assert stats["worst_student"].id == 2
+
+    top = get_top_n_students(iter_students(filepath, chunk_size=1), 2)
+    assert [s.id for s in top] == [3, 1]
+
+def test_snapshot_roundtrip(sample_students, tmp_path):
+    """Снимок сохраняет ID, имена (включая кириллицу) и оценки без потерь."""
+    filepath = tmp_path / "roster.snap"
+    students = sample_students + [Student(7, "Без оценок", [])]
+    save_snapshot(filepath, students)
+
+    loaded = load_snapshot(filepath)
+    assert [(s.id, s.name, s.grades) for s in loaded] == [(s.id, s.name, s.grades) for s in students]
+    assert loaded[0].average == students[0].average
+
+def test_snapshot_csv_conversion(sample_students, tmp_path):
+    csv_path = tmp_path / "test.csv"
+    snap_path = tmp_path / "test.snap"
+    back_path = tmp_path / "back.csv"
+    write_students_to_csv(csv_path, sample_students)
+
+    convert_csv_to_snapshot(csv_path, snap_path)
+    convert_snapshot_to_csv(snap_path, back_path)
+    assert back_path.read_text(encoding="utf-8") == csv_path.read_text(encoding="utf-8")
+
+    # load_students выбирает формат по расширению
+    assert [s.id for s in load_students(snap_path)] == [s.id for s in load_students(csv_path)]
+
+def test_snapshot_rejects_bad_files(sample_students, tmp_path):
+    empty = tmp_path / "empty.snap"
+    empty.write_bytes(b"")
+    with pytest.raises(FileProcessingError):
+        load_snapshot(empty)
+
+    not_snapshot = tmp_path / "text.snap"
+    not_snapshot.write_bytes(b"id,name,grade1\n1,A,50\n" * 3)
+    with pytest.raises(DataValidationError):
+        load_snapshot(not_snapshot)
+
+    # Портим последнюю оценку: 95 -> 200
+    broken = tmp_path / "broken.snap"
+    save_snapshot(broken, sample_students[:2])
+    data = bytearray(broken.read_bytes())
+    data[-1] = 200
+    broken.write_bytes(bytes(data))
+    with pytest.raises(DataValidationError):
+        load_snapshot(broken)
+
+@pytest.mark.parametrize("table, index, value", [
+    ("names", 0, 1),      # первая граница не 0
+    ("names", 1, 40),     # граница за концом блока имен
+    ("names", 2, 1),      # границы убывают
+    ("grades", 1, 7),     # оценки первого студента залезают в третьего
+    ("grades", 3, 5),     # последняя граница не на конце блока оценок
+])
+def test_snapshot_rejects_corrupt_offsets(sample_students, tmp_path, table, index, value):
+    """Испорченная таблица границ дает ошибку формата, а не чужие имена и оценки."""
+    path = tmp_path / "corrupt.snap"
+    save_snapshot(path, sample_students)
+    count = len(sample_students)
+    start = _HEADER.size + 8 * count + (0 if table == "names" else 8 * (count + 1))
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<Q", data, start + 8 * index, value)
+    path.write_bytes(bytes(data))
+    with pytest.raises(DataValidationError, match="границ"):
+        load_snapshot(path)
+
+def test_registry_incremental_save(tmp_path):
+    """Небольшие изменения дописываются в журнал и восстанавливаются при загрузке."""
+    filepath = tmp_path / "roster.csv"
+    write_students_to_csv(filepath, [Student(i, f"Студент {i}", [50]) for i in range(1, 101)])
+    csv_before = filepath.read_bytes()
+
+    registry = load_registry(filepath)
+    registry.update_grades(5, [100, 90])
+    registry.remove(7)
+    registry.add(Student(500, "Новенький", [70]))
+
+    assert save_registry(filepath, registry) is False
+    # Основной файл не переписывался, изменения лежат в журнале
+    assert filepath.read_bytes() == csv_before
+    assert len(open(journal_path(filepath), encoding="utf-8").readlines()) == 3
+    assert registry.changes == []
+
+    reloaded = load_registry(filepath)
+    assert [(s.id, s.grades) for s in reloaded] == [(s.id, s.grades) for s in registry]
+
+def test_registry_journal_compaction(tmp_path):
+    filepath = tmp_path / "roster.csv"
+    registry = StudentRegistry([Student(1, "Анна", [90]), Student(2, "Борис", [80])])
+
+    # Первое сохранение в новый файл - всегда полная запись
+    assert save_registry(filepath, registry) is True
+
+    # Много правок: журнал становится больше половины CSV и сворачивается
+    for grade in range(10, 30):
+        registry.update_grades(1, [grade])
+    assert save_registry(filepath, registry) is True
+    assert not (tmp_path / "roster.csv.journal").exists()
+    assert [s.grades for s in read_students_from_csv(filepath)] == [[29], [80]]
+
+def test_csv_readers_apply_journal(tmp_path):
+    """Все чтения CSV по пути видят правки, сохраненные в журнал."""
+    filepath = tmp_path / "roster.csv"
+    write_students_to_csv(filepath, [Student(i, f"Студент {i}", [50]) for i in range(1, 200)])
+    registry = load_registry(filepath)
+    registry.update_grades(1, [99])
+    registry.remove(2)
+    registry.remove(3)
+    registry.add(Student(3, "Вернулся", [70]))
+    registry.add(Student(500, "Новенький", [80]))
+    registry.update_grades(500, [81])
+    assert save_registry(filepath, registry) is False
+
+    expected = [(s.id, s.name, s.grades) for s in registry]
+    assert len(expected) == 199 and expected[-2:] == [(3, "Вернулся", [70]), (500, "Новенький", [81])]
+    snap = tmp_path / "roster.snap"
+    convert_csv_to_snapshot(filepath, snap)
+    readers = {
+        "read_students_from_csv": read_students_from_csv(filepath),
+        "iter_students": list(iter_students(filepath)),
+        "iter_students_from_csv": [s for batch in iter_students_from_csv(filepath, chunk_size=50) for s in batch],
+        "load_students": load_students(filepath),
+        "ingest": ingest_csv_files([str(filepath)]).students,
+        "convert_csv_to_snapshot": load_snapshot(snap),
+    }
+    for name, students in readers.items():
+        assert [(s.id, s.name, s.grades) for s in students] == expected, name
+
+def test_broken_journal_is_reported(tmp_path):
+    filepath = tmp_path / "roster.csv"
+    write_students_to_csv(filepath, [Student(1, "Анна", [90])])
+    with open(journal_path(filepath), "w", encoding="utf-8") as f:
+        f.write("U,1,500\n")
+    with pytest.raises(FileProcessingError, match="журнале"):
+        read_students_from_csv(filepath)
+    report = ingest_csv_files([str(filepath)])
+    assert report.students == [] and "журнале" in report.errors[str(filepath)][0]
+
+def test_journal_replay_is_idempotent(tmp_path):
+    """Журнал, оставшийся после свертывания, не ломает загрузку."""
+    filepath = tmp_path / "roster.csv"
+    write_students_to_csv(filepath, [Student(1, "Анна", [90]), Student(3, "Вера", [60])])
+    with open(journal_path(filepath), "w", encoding="utf-8") as f:
+        f.write("A,3,Вера,60\nU,2,50\nD,9\n")
+
+    assert [(s.id, s.grades) for s in load_registry(filepath)] == [(1, [90]), (3, [60])]
+
+def test_full_write_discards_stale_journal(tmp_path):
+    """Полная перезапись CSV удаляет журнал, относящийся к прежнему содержимому."""
+    filepath = tmp_path / "roster.csv"
+    write_students_to_csv(filepath, [Student(3, "Старый", [10])])
+    with open(journal_path(filepath), "w", encoding="utf-8") as f:
+        f.write("D,3\n")
+
+    save_students(filepath, [Student(3, "New", [99])])
+    assert not (tmp_path / "roster.csv.journal").exists()
+    assert [(s.id, s.name, s.grades) for s in load_registry(filepath)] == [(3, "New", [99])]
+
+    snap = tmp_path / "roster.snap"
+    save_snapshot(snap, [Student(4, "Из снимка", [80])])
+    with open(journal_path(filepath), "w", encoding="utf-8") as f:
+        f.write("D,4\n")
+    convert_snapshot_to_csv(snap, filepath)
+    assert [s.id for s in load_registry(filepath)] == [4]
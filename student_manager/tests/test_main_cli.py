@@ -52,3 +52,20 @@ def test_cli_show_students(monkeypatch, capsys, sample_students):
 
     # 3. Проверка, что программа корректно попрощалась
     assert "До свидания!" in output
+
+def test_cli_reload_closes_previous_database(monkeypatch, tmp_path, sample_students):
+    """Повторная загрузка и выход закрывают открытую базу SQLite."""
+    from lab import main, storage
+    first, second = str(tmp_path / "first.db"), str(tmp_path / "second.db")
+    storage.export_to_sqlite(first, sample_students)
+    storage.export_to_sqlite(second, sample_students[:1])
+
+    closed = []
+    close = storage.SQLiteStudentStore.close
+    monkeypatch.setattr(storage.SQLiteStudentStore, "close", lambda self: closed.append(self.filepath) or close(self))
+    inputs = iter(['1', first, '1', second, '0'])
+    monkeypatch.setattr('builtins.input', lambda prompt="": next(inputs, "0"))
+    monkeypatch.setattr(main, "students_data", main.StudentRegistry())
+
+    main_cli()
+    assert closed == [first, second]
@@ -1,5 +1,7 @@
 # tests/test_models.py
-from lab.models import Student
+import pytest
+from lab.models import Student, StudentRegistry
+from lab.errors import StudentNotFoundError, DuplicateStudentIdError
 
 def test_student_creation():
     s = Student(1, "Тестов Тест", [80, 90])
@@ -22,3 +24,60 @@ def test_student_str_representation(capsys):
     assert "Анна Котова" in captured.out
     assert "97.50" in captured.out
     assert "[100, 95]" in captured.out
+
+def test_registry_add_get_remove():
+    registry = StudentRegistry([Student(2, "Второй", [50]), Student(1, "Первый", [])])
+    assert len(registry) == 2
+    assert 1 in registry
+    assert registry.get(2).name == "Второй"
+    assert registry.get(99) is None
+    # Порядок обхода совпадает с порядком добавления
+    assert [s.id for s in registry] == [2, 1]
+
+    registry.remove(2)
+    assert 2 not in registry
+    assert [s.id for s in registry] == [1]
+
+def test_registry_errors():
+    registry = StudentRegistry([Student(1, "Первый", [])])
+    with pytest.raises(DuplicateStudentIdError):
+        registry.add(Student(1, "Дубликат", []))
+    with pytest.raises(StudentNotFoundError):
+        registry.remove(42)
+    with pytest.raises(StudentNotFoundError):
+        registry.update_grades(42, [10])
+
+def test_student_compact_storage():
+    s = Student(1, "Компактный", [70, 80])
+    assert not hasattr(s, "__dict__")
+    assert s.grades_count == 2
+    assert s.grades_sum == 150
+
+def test_student_average_cache_invalidated():
+    s = Student(1, "Кэш", [70, 80, 90])
+    assert s.average == 80.0
+    s.grades = [100]
+    assert s.average == 100.0
+    with pytest.raises(ValueError):
+        s.grades = [50, 101]
+    assert s.grades == [100]
+
+def test_grades_view_is_read_only():
+    s = Student(1, "Только чтение", [70, 80])
+    grades = s.grades
+    with pytest.raises(AttributeError):
+        grades.append(5)
+    with pytest.raises(TypeError):
+        grades[0] = 100
+    assert s.average == 75.0
+
+    # Ведет себя как список при чтении
+    assert grades == [70, 80] and [70, 80] == grades and grades != [70]
+    assert [1] + grades == [1, 70, 80] and grades + [90] == [70, 80, 90]
+    assert grades[-1] == 80 and grades[:1] == [70] and len(grades) == 2
+    assert grades.tolist() == [70, 80] and repr(grades) == "[70, 80]"
+
+    # Оценки другого студента копируются, а не разделяются
+    other = Student(2, "Копия", s.grades)
+    s.grades = [100]
+    assert other.grades == [70, 80] and grades == [70, 80]
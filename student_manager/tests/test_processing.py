@@ -1,7 +1,10 @@
+import statistics
 import pytest
 # ВАЖНО: Импортируем StudentNotFoundError из lab.processing,
 # чтобы класс ошибки гарантированно совпадал с тем, который выбрасывает функция.
 from lab.processing import sort_students, get_group_statistics, remove_student_by_id, StudentNotFoundError
+from lab.processing import add_student, update_student_grades, get_top_n_students, DuplicateStudentIdError
+from lab.models import Student, StudentRegistry
 
 def test_sort_students_by_id(sample_students):
     sorted_list = sort_students(sample_students, 'id')
@@ -26,3 +29,50 @@ def test_remove_student_not_found(sample_students):
     # Тест ожидает, что будет выброшено исключение StudentNotFoundError
     with pytest.raises(StudentNotFoundError):
         remove_student_by_id(sample_students, 999)
+
+def test_processing_with_registry(sample_students):
+    registry = StudentRegistry(sample_students)
+
+    add_student(registry, 10, "Новый Студент", [100])
+    assert registry.get(10).average == 100.0
+    with pytest.raises(DuplicateStudentIdError):
+        add_student(registry, 10, "Еще один", [])
+
+    student = update_student_grades(registry, 2, [90, 100])
+    assert student.average == 95.0
+    with pytest.raises(ValueError):
+        update_student_grades(registry, 2, [101])
+
+    remove_student_by_id(registry, 1)
+    assert [s.id for s in registry] == [3, 2, 10]
+    with pytest.raises(StudentNotFoundError):
+        remove_student_by_id(registry, 1)
+
+    assert [s.id for s in sort_students(registry, 'avg')] == [10, 2, 3]
+
+def test_top_n_matches_sort_order():
+    students = [Student(i, name, grades) for i, (name, grades) in enumerate([
+        ("Борис", [90]), ("Анна", [90]), ("Вера", [70, 80]), ("Глеб", []), ("Дина", [100, 80]),
+    ], start=1)]
+    for n in range(len(students) + 2):
+        assert get_top_n_students(students, n) == sort_students(students, 'avg')[:n]
+
+def test_group_statistics_distribution(sample_students):
+    stats = get_group_statistics(sample_students)
+    all_grades = [g for s in sample_students for g in s.grades]
+
+    assert stats["median_grade"] == statistics.median(all_grades)
+    assert pytest.approx(stats["stddev"]) == statistics.pstdev(all_grades)
+    assert stats["histogram"] == {65: 1, 70: 1, 78: 1, 85: 1, 88: 1, 90: 1, 92: 1, 95: 1}
+
+    odd = [Student(1, "А", [10, 10, 40]), Student(2, "Б", [100, 40])]
+    assert get_group_statistics(odd)["median_grade"] == 40
+
+def test_group_statistics_without_grades():
+    stats = get_group_statistics([Student(1, "Без оценок", [])])
+    assert stats["overall_average"] == 0.0
+    assert stats["median_grade"] == 0.0
+    assert stats["histogram"] == {}
+
+def test_group_statistics_empty():
+    assert get_group_statistics([]) is None
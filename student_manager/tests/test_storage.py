@@ -0,0 +1,57 @@
+# tests/test_storage.py
+import pytest
+from lab.storage import SQLiteStudentStore, export_to_sqlite
+from lab.models import Student
+from lab.errors import StudentNotFoundError, DuplicateStudentIdError
+from lab import processing
+
+@pytest.fixture
+def store(tmp_path, sample_students):
+    """База SQLite, заполненная тестовыми студентами."""
+    with SQLiteStudentStore(tmp_path / "students.db") as db:
+        db.import_students(sample_students)
+        yield db
+
+def test_store_crud(store):
+    assert len(store) == 3
+    assert 3 in store
+    assert store.get(3).grades == [92, 88, 95]
+
+    processing.add_student(store, 10, "Новый Студент", [100])
+    with pytest.raises(DuplicateStudentIdError):
+        processing.add_student(store, 10, "Еще один", [])
+
+    student = processing.update_student_grades(store, 2, [90, 100])
+    assert student.average == 95.0
+    assert store.get(2).grades == [90, 100]
+    with pytest.raises(ValueError):
+        processing.update_student_grades(store, 2, [101])
+
+    processing.remove_student_by_id(store, 1)
+    with pytest.raises(StudentNotFoundError):
+        processing.remove_student_by_id(store, 1)
+    assert [s.id for s in store] == [2, 3, 10]
+
+def test_store_queries_match_processing(store, sample_students):
+    for key in ('id', 'name', 'avg'):
+        expected = processing.sort_students(sample_students, key)
+        assert [s.id for s in processing.sort_students(store, key)] == [s.id for s in expected]
+    assert [s.id for s in processing.get_top_n_students(store, 2)] == [3, 1]
+
+    stats = processing.get_group_statistics(store)
+    assert stats["total_students"] == 3
+    assert stats["best_student"].id == 3
+
+def test_store_import_is_atomic(store):
+    with pytest.raises(DuplicateStudentIdError):
+        store.import_students([Student(50, "Новый", []), Student(1, "Дубликат", [])])
+    assert 50 not in store
+    assert len(store) == 3
+
+def test_export_persists(tmp_path, sample_students):
+    path = tmp_path / "export.db"
+    assert export_to_sqlite(path, sample_students) == 3
+    # Повторный экспорт заменяет содержимое, а не дописывает
+    export_to_sqlite(path, sample_students[:1])
+    with SQLiteStudentStore(path) as db:
+        assert [s.id for s in db] == [1]